@@ -0,0 +1,496 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from diagnostics import DiagnosticsPublisher, MetricsHttpServer
+from playback import datetime_to_ns, ns_to_datetime
+from server import IbaToUaServer, VariableUpdater
+
+# the asyncio engine is optional, the threaded engine only needs python-opcua
+try:
+    from asyncua import ua, uamethod, Server
+except ImportError:
+    ua = uamethod = Server = None
+
+
+def string_node(idx, node_id, name):
+    """Returns the NodeId and browse name of a node with a string NodeId as asyncua types, see
+    diagnostics.string_node.
+
+    :param idx: (mandatory, int) namespace index
+    :param node_id: (mandatory, string) identifier of the NodeId, e.g. '3:12.value'
+    :param name: (mandatory, string) browse name of the node
+    :return: (tuple) ua.NodeId, ua.QualifiedName
+    """
+
+    return ua.NodeId(node_id, idx), ua.QualifiedName(name, idx)
+
+
+class AsyncIbaToUaServer(IbaToUaServer):
+    """The AsyncIbaToUaServer plays back the iba files on an asyncua server. The updaters of all sample rates run as
+    coroutines on the event loop of the server, so the values are written and published to the subscriptions without
+    locks shared between threads. Only the decoding of the iba files runs in background threads.
+
+    The address space, the NodeIds and the playback controls are the same as of the threaded IbaToUaServer. The ticks
+    are scheduled by the event loop, so the options timing, spin_threshold and cpu_affinity do not apply.
+    """
+
+    def __init__(self, **kwargs):
+        """Default constructor. Takes the same arguments as the IbaToUaServer."""
+
+        if Server is None:
+            raise ImportError('The asyncio engine needs asyncua. Install it with: pip install asyncua')
+
+        super().__init__(**kwargs)
+
+        # set by stop, possibly from another thread
+        self._loop = None
+        self._stop_event = None
+
+        # coroutines of the updaters and the diagnostics
+        self._tasks = list()
+
+    def start(self):
+        """Runs the server on a new event loop until stop is called.
+
+        :return: None
+        """
+
+        asyncio.run(self.run())
+
+    async def run(self):
+        """The asyncio counterpart of IbaToUaServer.start.
+
+        1. discover the iba files in the directory of each recorder
+        2. get channels from the iba files
+        3. build the opc ua server
+        4. read the data of the first file of each recorder
+        5. start the updating of the data
+        6. read the remaining (and new) files in the background
+
+        :return: None
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+
+        if self._profiler is not None:
+            self._profiler.start()
+
+        # discover iba files
+        print('finding iba files ...')
+        with self._phase('discover'):
+            for recorder in self.recorders:
+                recorder.iba_files = recorder.discover_iba_files()
+
+        # get the union of the channels of all iba files
+        print('receiving channel info ...')
+        with self._phase('channel_info'):
+            for recorder in self.recorders:
+                recorder.iba_info = recorder.get_union_info(recorder.iba_files)
+                print('\t{0}: {1} files with {2} channel configuration(s).'.format(
+                    recorder.name, len(recorder.iba_files), recorder.schema_count))
+
+        # build the opc server
+        print('building opc server ...')
+        with self._phase('init_opc'):
+            await self.init_opc()
+
+        # read the first file of each recorder in parallel, outside of the event loop
+        print('reading iba data ...')
+        with self._phase('read_first_files'), ThreadPoolExecutor(max_workers=len(self.recorders)) as pool:
+            await asyncio.gather(*[self._loop.run_in_executor(pool, recorder.append_iba_file, recorder.iba_files[0])
+                                   for recorder in self.recorders])
+
+        try:
+            await self.serve()
+            self._start_loaders()
+            await self._stop_event.wait()
+        finally:
+            self._shutdown()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._server.stop()
+
+    async def serve(self):
+        """Starts the opc server, the updaters and the diagnostics. The address space must have been built by init_opc
+        and the first file of each recorder must be loaded.
+
+        :return: None
+        """
+
+        print('starting opc server ...')
+        with self._phase('start_server'):
+            await self._server.start()
+
+        # create the value updater
+        with self._phase('start_updaters'):
+            self._write_values()
+            self._tasks.extend(updater.task for updater in self._value_updater.values())
+
+        # expose the tick metrics of the updaters
+        with self._phase('start_diagnostics'):
+            await self._start_diagnostics()
+
+        if self._profiler is not None:
+            self._profiler.startup_done(list(self._value_updater.values()))
+
+    def stop(self):
+        """Stops the playback and the opc ua server. May be called from any thread.
+
+        :return: None
+        """
+
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def _shutdown(self):
+        """Stops the file watchers, the metrics endpoint and the updaters."""
+
+        for watcher in self._watchers:
+            watcher.stop()
+        if self._metrics_http is not None:
+            self._metrics_http.stop()
+        for updater in self._value_updater.values():
+            updater.stop()
+        if self._profiler is not None:
+            self._profiler.stop()
+
+    async def init_opc(self):
+        """Initializes the asyncua server and creates all folder, nodes, etc.
+
+        :return: None
+        """
+
+        self._server = Server()
+        await self._server.init()
+        self._server.set_endpoint(self.endpoint)
+        self._server.set_server_name("iba Files Playback OPC UA Server")
+
+        # set all possible endpoint policies for clients to connect through
+        self._server.set_security_policy([
+            ua.SecurityPolicyType.NoSecurity,
+            ua.SecurityPolicyType.Basic256Sha256_SignAndEncrypt,
+            ua.SecurityPolicyType.Basic256Sha256_Sign])
+
+        # setup our own namespace
+        uri = "http://iba-playback.sms-digital.io"
+        idx = await self._server.register_namespace(uri)
+        self._ns_idx = idx
+
+        root = self._server.nodes.objects
+        if self.subtree is not None:
+            root = await root.add_folder(*string_node(idx, self.subtree, self.subtree))
+
+        for recorder in self.recorders:
+            # each recorder gets its own subtree if there is more than one
+            if len(self.recorders) == 1:
+                parent = root
+                prefix = ''
+            else:
+                print('\tRecorder: {} ...'.format(recorder.name))
+                parent = await root.add_folder(*string_node(idx, recorder.name, recorder.name))
+                prefix = recorder.name + '/'
+            await self.init_modules(parent, idx, recorder.iba_info, prefix)
+
+            # the replicas get their own copy of the modules next to the original ones
+            self._replica_info[recorder.name] = [recorder.iba_info]
+            for replica in range(1, self.replicas):
+                print('\tReplica: {} ...'.format(replica))
+                iba_info = recorder.replicate_info()
+                name = 'Replica {0}'.format(replica)
+                folder = await parent.add_folder(*string_node(idx, prefix + name, name))
+                await self.init_modules(folder, idx, iba_info, prefix + name + '/')
+                self._replica_info[recorder.name].append(iba_info)
+
+        # add the playback controls
+        await self.init_playback_controls(self._server.nodes.objects, idx)
+
+    async def init_modules(self, parent, idx, iba_info, prefix=''):
+        """Adds the Modules folder with a folder for each module and an object for each channel, see
+        IbaToUaServer.init_modules. Analog values are published as Double, digital values as Boolean.
+
+        :param parent: (mandatory, asyncua.Node) node the Modules folder is added to
+        :param idx: (mandatory, int) namespace index
+        :param iba_info: (mandatory, dict) channel info of a recorder, see IbaRecorder.get_union_info
+        :param prefix: (optional, string) prefix of the NodeIds, e.g. of a replica
+        :return: None
+        """
+
+        # add modules folder
+        modules = await parent.add_folder(*string_node(idx, prefix + 'Modules', 'Modules'))
+        used = set()
+        for module, channel in iba_info['modules'].items():
+            print('\tModule: {} ...'.format(module))
+            # create a new folder for the module
+            module_id = '{0}Modules/{1}'.format(prefix, channel[0]['module_no'])
+            module_folder = await modules.add_folder(*string_node(idx, module_id, module))
+
+            # create a folder for analog and digital signals
+            analog_folder = await module_folder.add_folder(*string_node(idx, module_id + '/Analog', 'Analog'))
+            digital_folder = await module_folder.add_folder(*string_node(idx, module_id + '/Digital', 'Digital'))
+
+            # add the channel
+            for chan in channel:
+                chan_id = '{0}{1}:{2}'.format(prefix, chan['module_no'], chan['no'])
+                if chan_id in used:
+                    chan_id = '{0}{1}:{2}'.format(prefix, chan['module_no'], chan['name'])
+                used.add(chan_id)
+
+                # create channel
+                if chan['type'] == 'analog':
+                    opc_channel = await analog_folder.add_object(*string_node(idx, chan_id, chan['name']))
+                    val = 0.0
+                else:
+                    opc_channel = await digital_folder.add_object(*string_node(idx, chan_id, chan['name']))
+                    val = False
+
+                # define the channel object
+                value_var = await opc_channel.add_variable(*string_node(idx, chan_id + '.value', 'value'), val)
+                await value_var.set_writable(True)
+                for key, val in chan.items():
+                    var = await opc_channel.add_variable(*string_node(idx, '{0}.{1}'.format(chan_id, key), key), val)
+                    await var.set_writable(False)
+
+                # store the handles to the value variable and the opc_channel in the channel dict
+                chan['opc_obj'] = opc_channel
+                chan['opc_value'] = value_var
+                self._node_index[opc_channel.nodeid.to_string()] = chan
+                self._node_index[value_var.nodeid.to_string()] = chan
+
+    def find_channel(self, node_id):
+        """Returns the channel info of a channel object or value node without browsing.
+
+        :param node_id: (mandatory, string or ua.NodeId) NodeId of the node, e.g. 'ns=2;s=3:12.value'
+        :return: (dict) the channel info or None if the node is not a channel
+        """
+
+        if isinstance(node_id, ua.NodeId):
+            node_id = node_id.to_string()
+        return self._node_index.get(node_id)
+
+    async def init_playback_controls(self, parent, idx):
+        """Adds the Playback object with the methods Play, Pause, Seek(time) and SetSpeed(factor).
+
+        :param parent: (mandatory, asyncua.Node) node the Playback object is added to
+        :param idx: (mandatory, int) namespace index
+        :return: None
+        """
+
+        clock = self._clock
+
+        @uamethod
+        async def play(parent):
+            clock.play()
+            await self._update_playback_nodes()
+
+        @uamethod
+        async def pause(parent):
+            clock.pause()
+            await self._update_playback_nodes()
+
+        @uamethod
+        async def seek(parent, time):
+            # asyncua decodes the time as aware datetime in UTC
+            clock.seek(datetime_to_ns(time.replace(tzinfo=None)))
+            await self._update_playback_nodes()
+
+        @uamethod
+        async def set_speed(parent, factor):
+            # an exception raised by a method reaches the client as BadUnexpectedError, a returned status code as is
+            if factor <= 0:
+                return ua.StatusCode(ua.StatusCodes.BadInvalidArgument)
+            clock.set_speed(factor)
+            await self._update_playback_nodes()
+
+        playback = await parent.add_object(*string_node(idx, 'Playback', 'Playback'))
+        await playback.add_method(*string_node(idx, 'Playback.Play', 'Play'), play, [], [])
+        await playback.add_method(*string_node(idx, 'Playback.Pause', 'Pause'), pause, [], [])
+        await playback.add_method(*string_node(idx, 'Playback.Seek', 'Seek'), seek, [ua.VariantType.DateTime], [])
+        await playback.add_method(*string_node(idx, 'Playback.SetSpeed', 'SetSpeed'), set_speed,
+                                  [ua.VariantType.Double], [])
+
+        self._playback_nodes = {
+            'state': await playback.add_variable(*string_node(idx, 'Playback.State', 'State'), 'Playing'),
+            'speed': await playback.add_variable(*string_node(idx, 'Playback.Speed', 'Speed'), float(clock.speed)),
+            'time': await playback.add_variable(*string_node(idx, 'Playback.PlaybackTime', 'PlaybackTime'),
+                                                ns_to_datetime(time.time_ns())),
+        }
+
+    async def _update_playback_nodes(self):
+        """Copies the state of the playback clock to the variables of the Playback object.
+
+        :return: None
+        """
+
+        if not self._playback_nodes or not len(self._clock.timeline):
+            return
+
+        await self._playback_nodes['state'].write_value('Paused' if self._clock.paused else 'Playing')
+        await self._playback_nodes['speed'].write_value(float(self._clock.speed))
+        await self._playback_nodes['time'].write_value(ns_to_datetime(self._clock.now_ns()), ua.VariantType.DateTime)
+
+    def _create_updater(self, **kwargs):
+        """Returns the updater of a sample rate, see VariableUpdater for the arguments.
+
+        :return: (AsyncVariableUpdater)
+        """
+
+        return AsyncVariableUpdater(**kwargs)
+
+    async def _start_diagnostics(self):
+        """Publishes the tick metrics of the updaters in the Diagnostics folder and, if a port is configured, via the
+        Prometheus endpoint.
+
+        :return: None
+        """
+
+        metrics = [updater.metrics for updater in self._value_updater.values()]
+
+        nodes = await self._init_diagnostics(self._server.nodes.objects, self._ns_idx, metrics)
+        self._tasks.append(asyncio.create_task(self._publish_diagnostics(nodes), name='DiagnosticsPublisher'))
+
+        if self.metrics_port is not None:
+            print('serving metrics on http://127.0.0.1:{0}/metrics ...'.format(self.metrics_port))
+            self._metrics_http = MetricsHttpServer(metrics, port=self.metrics_port)
+            self._metrics_http.start()
+
+    @staticmethod
+    async def _init_diagnostics(parent, idx, metrics):
+        """Adds the Diagnostics folder with the same nodes as the DiagnosticsPublisher.
+
+        :param parent: (mandatory, asyncua.Node) node the Diagnostics folder is added to
+        :param idx: (mandatory, int) namespace index
+        :param metrics: (mandatory, list) the TickMetrics of all updaters
+        :return: (list) tuples of the TickMetrics and the dict of its nodes by key of the snapshot
+        """
+
+        result = list()
+        folder = await parent.add_folder(*string_node(idx, 'Diagnostics', 'Diagnostics'))
+        for metric in metrics:
+            group_id = 'Diagnostics/' + metric.name
+            group = await folder.add_object(*string_node(idx, group_id, metric.name))
+            period = await group.add_variable(*string_node(idx, group_id + '.Period', 'Period'), metric.period)
+            await period.set_writable(False)
+            nodes = dict()
+            for name, key, val in DiagnosticsPublisher.VARIABLES:
+                nodes[key] = await group.add_variable(*string_node(idx, '{0}.{1}'.format(group_id, name), name), val)
+            nodes['position'] = await group.add_variable(
+                *string_node(idx, group_id + '.PlaybackPosition', 'PlaybackPosition'), ns_to_datetime(time.time_ns()))
+            result.append((metric, nodes))
+        return result
+
+    async def _publish_diagnostics(self, nodes, interval=1.0):
+        """Copies the tick metrics and the playback state to their nodes until the task is cancelled.
+
+        :param nodes: (mandatory, list) the nodes of the metrics, see _init_diagnostics
+        :param interval: (optional, float) seconds between two updates of the nodes
+        :return: None
+        """
+
+        while True:
+            await asyncio.sleep(interval)
+            for metric, metric_nodes in nodes:
+                snapshot = metric.snapshot()
+                for _, key, val in DiagnosticsPublisher.VARIABLES:
+                    await metric_nodes[key].write_value(type(val)(snapshot[key]))
+                if snapshot['position_ns'] is not None:
+                    await metric_nodes['position'].write_value(ns_to_datetime(snapshot['position_ns']),
+                                                               ua.VariantType.DateTime)
+            await self._update_playback_nodes()
+
+
+class AsyncVariableUpdater(VariableUpdater):
+    """The AsyncVariableUpdater is the VariableUpdater of the asyncio engine. It shares the playback logic and the
+    overrun policies of the VariableUpdater, but runs as a task on the event loop of the asyncua server instead of a
+    thread. The values of a tick are collected and written to the address space after the tick, so they reach the
+    subscriptions without a thread switch."""
+
+    def __init__(self, **kwargs):
+        """Default constructor. Takes the same arguments as the VariableUpdater, the sleeper is not used."""
+
+        super().__init__(**kwargs)
+
+        # NodeIds and DataValues of the current tick
+        self._writes = list()
+
+        # handle to the coroutine of the updater
+        self.task = None
+
+    def start(self):
+        """Starts the updater as a task on the running event loop.
+
+        :return: None
+        """
+
+        self.task = asyncio.get_running_loop().create_task(self.run_async(), name=self.name)
+
+    async def run_async(self):
+        """Ticks until stop is called.
+
+        :return: None
+        """
+
+        print('Started VariableUpdater {}'.format(self.name))
+
+        late = False
+        self._nextCall = time.monotonic_ns()
+        while not self._close_event.is_set():
+            wakeup = time.monotonic_ns()
+
+            # do your tasks here
+            writes = self._tick(self.clock.now_ns(), late)
+            await self._flush()
+            self.metrics.record(time.monotonic_ns() - wakeup, wakeup - self._nextCall, writes)
+
+            # a late tick sleeps for 0 s, so the server still gets the loop between two ticks
+            late = self._schedule()
+            await asyncio.sleep(max(self._nextCall - time.monotonic_ns(), 0) / 1e9)
+
+    async def _flush(self):
+        """Writes the values collected by the tick to the address space, which notifies the subscriptions."""
+
+        writes, self._writes = self._writes, list()
+        for node_id, data_value in writes:
+            await self.server.write_attribute_value(node_id, data_value)
+
+    def _publish(self, idx):
+        """Collects the idx-th sample of the current file for the next flush."""
+
+        row = self.data[idx].tolist()
+
+        now = ns_to_datetime(time.time_ns())
+        source_timestamp = now
+        if self.recorded_timestamps:
+            source_timestamp = ns_to_datetime(self.time_axis.start_ns + idx * self.time_axis.period_ns)
+
+        for node_id, col, digital in self._present:
+            if digital:
+                variant = ua.Variant(row[col] != 0.0, ua.VariantType.Boolean)
+            else:
+                variant = ua.Variant(row[col], ua.VariantType.Double)
+            self._writes.append((node_id, ua.DataValue(variant, SourceTimestamp=source_timestamp,
+                                                       ServerTimestamp=now)))
+
+    def _load_file(self, entry):
+        """Continues the playback with the given file of the queue, see VariableUpdater._load_file."""
+
+        self._entry = entry
+        self._idx = -1
+        self._present = list()
+        if entry is None:
+            self.data = None
+            remap = [-1] * len(self.channel)
+        else:
+            self.data = entry['data'][self.rate]
+            self.time_axis = entry['time_axis'][self.rate]
+            remap = entry['remap'][self.rate]
+
+        now = ns_to_datetime(time.time_ns())
+        for chan, col in zip(self.channel, remap):
+            node_id = chan['opc_value'].nodeid
+            if col >= 0:
+                self._present.append((node_id, int(col), chan['type'] != 'analog'))
+            else:
+                self._writes.append((node_id, ua.DataValue(StatusCode=ua.StatusCode(ua.StatusCodes.BadNoData),
+                                                           SourceTimestamp=now, ServerTimestamp=now)))
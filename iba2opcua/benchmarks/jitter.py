@@ -0,0 +1,81 @@
+"""Measures the wakeup jitter of the timing modes of the VariableUpdater on the current machine. No iba file and no opc
+server is needed.
+
+Run from within the iba2opcua folder:
+
+    python benchmarks/jitter.py --periods 0.001 0.01 --duration 5
+"""
+import os
+import sys
+import time
+import argparse
+from threading import Thread, Event
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from timing import Sleeper, TIMING_MODES
+
+
+def measure(sleeper, period, duration):
+    """Ticks with the given period for duration seconds and returns the jitter of each wakeup in ns."""
+
+    period_ns = int(round(period * 1e9))
+    jitter = np.zeros(int(duration / period), dtype=np.int64)
+
+    # prepare_thread pins the calling thread, which is the main thread here. the next measurement starts unpinned
+    affinity = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else None
+    try:
+        sleeper.prepare_thread()
+        deadline = time.monotonic_ns() + period_ns
+        for tick in range(jitter.shape[0]):
+            sleeper.sleep_until(deadline)
+            jitter[tick] = time.monotonic_ns() - deadline
+            deadline += period_ns
+    finally:
+        if affinity is not None:
+            os.sched_setaffinity(0, affinity)
+
+    return jitter
+
+
+def busy(stop_event):
+    """Keeps the interpreter busy to emulate other python threads, e.g. the opc server."""
+
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the wakeup jitter of the updater timing modes.')
+    parser.add_argument('--periods', type=float, nargs='+', default=[0.001, 0.005, 0.01],
+                        help='tick periods in seconds (default: 0.001 0.005 0.01)')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per measurement (default: 5)')
+    parser.add_argument('--modes', nargs='+', default=list(TIMING_MODES), choices=TIMING_MODES)
+    parser.add_argument('--spin-threshold', type=float, default=0.002,
+                        help='seconds before a tick at which the precise timing starts spinning (default: 0.002)')
+    parser.add_argument('--cpu-affinity', type=lambda cpus: [int(cpu) for cpu in cpus.split(',')], default=None,
+                        help='comma separated CPUs the timing thread is pinned to (Linux only)')
+    parser.add_argument('--load-threads', type=int, default=0,
+                        help='number of busy python threads running in parallel (default: 0)')
+    args = parser.parse_args()
+
+    stop_event = Event()
+    for _ in range(args.load_threads):
+        Thread(target=busy, args=(stop_event,), daemon=True).start()
+
+    print('{0:>8} {1:>10} {2:>8} {3:>10} {4:>10} {5:>10} {6:>10} {7:>9}'.format(
+        'mode', 'period ms', 'ticks', 'mean us', 'p50 us', 'p99 us', 'max us', 'overruns'))
+    try:
+        for mode in args.modes:
+            for period in args.periods:
+                sleeper = Sleeper(mode, args.spin_threshold, args.cpu_affinity)
+                jitter = measure(sleeper, period, args.duration) / 1e3
+                print('{0:>8} {1:>10.3f} {2:>8} {3:>10.1f} {4:>10.1f} {5:>10.1f} {6:>10.1f} {7:>9}'.format(
+                    mode, period * 1e3, jitter.shape[0], jitter.mean(), np.percentile(jitter, 50),
+                    np.percentile(jitter, 99), jitter.max(), int((jitter >= period * 1e6).sum())))
+    finally:
+        stop_event.set()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Measures how quickly the samples get from the server to subscribed clients. The server is started as a separate
+process on localhost playing back a synthetic file. One or more python-opcua clients subscribe to a fraction of the
+value nodes each and measure for every notification the latency between the SourceTimestamp set by the server when the
+value was written and the receipt by the client. Notifications missing compared to the values written by the server
+are counted as dropped or coalesced. The cpu time of the server process is read from /proc (Linux only).
+
+Run from within the iba2opcua folder:
+
+    python benchmarks/latency.py --channels 1000 --rate 0.01 --clients 2 --fraction 0.1 --duration 20
+    python benchmarks/latency.py --engines threaded asyncio
+
+With several engines the measurement is repeated for each engine of the server on the same synthetic file and the
+results are reported side by side.
+
+Note: clients and server run on the same machine, so the clients compete with the server for the cpu. The latency
+includes the publishing interval of the subscriptions.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from threading import Lock
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from opcua import Client
+from pyIbaTools.backends import write_synthetic_files
+from playback import ns_to_datetime
+from server import ENGINES
+
+ENDPOINT = 'opc.tcp://localhost:4840/sms-digital/iba-playback/'
+NAMESPACE = 'http://iba-playback.sms-digital.io'
+
+# channels per module of the synthetic file
+CHANNELS_PER_MODULE = 100
+
+
+class LatencyHandler(object):
+    """The LatencyHandler collects the latency of the data change notifications of one client."""
+
+    def __init__(self):
+        self.measuring = False
+        self.latencies = list()
+        self.counts = dict()
+        self._lock = Lock()
+
+    def datachange_notification(self, node, val, data):
+        received = ns_to_datetime(time.time_ns())
+        if not self.measuring:
+            return
+
+        source_timestamp = data.monitored_item.Value.SourceTimestamp
+        with self._lock:
+            if source_timestamp is not None:
+                self.latencies.append((received - source_timestamp).total_seconds())
+            self.counts[node.nodeid] = self.counts.get(node.nodeid, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.latencies = list()
+            self.counts = dict()
+
+
+def value_nodes(client, modules, channels):
+    """Returns the value node of every channel of the synthetic file. The NodeIds are derived from module and channel
+    number, so nothing has to be browsed."""
+
+    idx = client.get_namespace_index(NAMESPACE)
+    return [client.get_node('ns={0};s={1}:{2}.value'.format(idx, module, nr))
+            for module in range(modules) for nr in range(channels)]
+
+
+def connect(timeout):
+    """Connects a client to the server. Retries until the server accepts connections or the timeout expires."""
+
+    deadline = time.monotonic() + timeout
+    while True:
+        client = Client(ENDPOINT)
+        try:
+            client.connect()
+            return client
+        except (OSError, TimeoutError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def cpu_seconds(pid):
+    """Returns the user and system cpu time of the process in seconds or None if /proc is not available."""
+
+    try:
+        with open('/proc/{0}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are the fields 14 and 15 of the stat file, i.e. 11 and 12 after the process name
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def measure(args, workdir, modules, channels, engine):
+    """Starts the server with the given engine, measures the latency of the subscribed clients and stops the server.
+
+    :return: (dict) the result of the engine
+    """
+
+    # start the server in its own process, so its cpu time can be measured
+    print('starting server ({0} engine) ...'.format(engine))
+    server_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    server = subprocess.Popen([sys.executable, os.path.join(server_dir, 'server.py'), '--backend', 'synthetic',
+                               '--data-dir', workdir, '--engine', engine] + args.server_args.split(),
+                              cwd=server_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    clients = list()
+    try:
+        probe = connect(timeout=120)
+        nodes = value_nodes(probe, modules, channels)
+        probe.disconnect()
+        print('{0} value nodes.'.format(len(nodes)))
+
+        # each client subscribes to its own share of the nodes
+        per_client = max(1, int(round(len(nodes) * args.fraction)))
+        handlers = list()
+        for num in range(args.clients):
+            client = connect(timeout=10)
+            clients.append(client)
+            handler = LatencyHandler()
+            handlers.append(handler)
+            subscription = client.create_subscription(args.publishing_interval, handler)
+            start = (num * per_client) % len(nodes)
+            subscription.subscribe_data_change([client.get_node(node.nodeid) for node in
+                                                (nodes[start:] + nodes[:start])[:per_client]])
+        print('{0} clients subscribed to {1} nodes each.'.format(args.clients, per_client))
+
+        time.sleep(args.warmup)
+
+        for handler in handlers:
+            handler.reset()
+            handler.measuring = True
+        cpu_start = cpu_seconds(server.pid)
+        start = time.monotonic()
+        time.sleep(args.duration)
+        for handler in handlers:
+            handler.measuring = False
+        elapsed = time.monotonic() - start
+        cpu_end = cpu_seconds(server.pid)
+    finally:
+        for client in clients:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+        server.terminate()
+        server.wait()
+
+    latencies = np.array([latency for handler in handlers for latency in handler.latencies]) * 1e3
+    received = sum(sum(handler.counts.values()) for handler in handlers)
+    written = int(args.clients * per_client * elapsed / args.rate)
+
+    return {
+        'engine': engine,
+        'channels': len(nodes),
+        'rate': args.rate,
+        'clients': args.clients,
+        'subscribed_per_client': per_client,
+        'publishing_interval_ms': args.publishing_interval,
+        'duration': elapsed,
+        'server_args': args.server_args,
+        'notifications': received,
+        'notifications_per_second': received / elapsed,
+        'values_written': written,
+        'dropped_or_coalesced': max(written - received, 0),
+        'dropped_or_coalesced_ratio': max(written - received, 0) / written if written else 0.0,
+        'latency_ms': {
+            'mean': float(latencies.mean()) if latencies.size else None,
+            'p50': float(np.percentile(latencies, 50)) if latencies.size else None,
+            'p95': float(np.percentile(latencies, 95)) if latencies.size else None,
+            'p99': float(np.percentile(latencies, 99)) if latencies.size else None,
+            'max': float(latencies.max()) if latencies.size else None,
+        },
+        'server_cpu_percent': (cpu_end - cpu_start) / elapsed * 100 if cpu_start is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the notification latency of subscribed clients.')
+    parser.add_argument('--channels', type=int, default=1000, help='channels of the synthetic file (default: 1000)')
+    parser.add_argument('--rate', type=float, default=0.01,
+                        help='sample rate of the channels in seconds (default: 0.01)')
+    parser.add_argument('--clients', type=int, default=1, help='number of clients (default: 1)')
+    parser.add_argument('--fraction', type=float, default=0.1,
+                        help='fraction of the value nodes each client subscribes to (default: 0.1)')
+    parser.add_argument('--publishing-interval', type=float, default=10,
+                        help='publishing interval of the subscriptions in ms (default: 10)')
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds before the measurement (default: 5)')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of measurement (default: 20)')
+    parser.add_argument('--server-args', default='',
+                        help='further options of the server, e.g. "--timing precise --overrun burst"')
+    parser.add_argument('--engines', nargs='+', default=['threaded'], choices=ENGINES,
+                        help='engines of the server to measure one after the other (default: threaded)')
+    parser.add_argument('--output', default=None, help='write the result as JSON to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    modules = max(1, -(-args.channels // CHANNELS_PER_MODULE))
+    channels = args.channels // modules
+    write_synthetic_files(workdir, files=1, duration=max(60.0, 2 * (args.warmup + args.duration)), modules=modules,
+                          channels=channels, rates=(args.rate,), digital=0.0)
+
+    try:
+        results = {engine: measure(args, workdir, modules, channels, engine) for engine in args.engines}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # a single engine keeps the result of earlier runs, several are keyed by engine
+    result = results[args.engines[0]] if len(results) == 1 else results
+    print(json.dumps(result, indent=2))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if len(results) > 1:
+        print('\n{0:>10} {1:>10} {2:>10} {3:>10} {4:>10} {5:>16} {6:>10}'.format(
+            'engine', 'mean ms', 'p50 ms', 'p99 ms', 'max ms', 'notifications/s', 'cpu %'))
+        for engine, res in results.items():
+            print('{0:>10} {1:>10.2f} {2:>10.2f} {3:>10.2f} {4:>10.2f} {5:>16,.0f} {6:>10.1f}'.format(
+                engine, *[res['latency_ms'][key] or 0.0 for key in ('mean', 'p50', 'p99', 'max')],
+                res['notifications_per_second'], res['server_cpu_percent'] or 0.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Benchmarks of the read path of pyIbaTools and the publish loop of the server. The iba files are generated by the
+synthetic backend and the values are written to an in-process opc server, so neither ibaFilesLite nor a network
+connection is needed.
+
+Each benchmark runs for every combination of channel count, sample rate and file length and reports the throughput
+(samples decoded or values written per second) and the peak memory traced during one run. The results are stored as
+JSON in benchmarks/results, so later runs can be compared against them.
+
+Run from within the iba2opcua folder:
+
+    python benchmarks/suite.py --channels 10 100 --rates 0.001 0.01 --durations 10
+    python benchmarks/suite.py --compare benchmarks/results/<previous>.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+import warnings
+import itertools
+from datetime import datetime
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import pandas as pd
+from pyIbaTools.backends import write_synthetic_file, write_synthetic_files
+from pyIbaTools.pyIbaTools import readIbaFile, get_channels, sortIbaFiles, checkFile, ibaReader, set_backend, \
+    __read_numeric_channel__, __read_text_channel__, __get_iba_channel_reader__
+from playback import PlaybackQueue, PlaybackClock
+from server import IbaToUaServer, VariableUpdater
+from async_engine import AsyncIbaToUaServer, AsyncVariableUpdater, Server as AsyncServer
+
+RESULTS = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'results')
+
+# channels per module of the synthetic files
+CHANNELS_PER_MODULE = 100
+
+# name -> setup function of each benchmark
+BENCHMARKS = dict()
+
+
+def benchmark(name):
+    """Registers a benchmark. The decorated function gets the case and a working directory and returns a tuple of
+    (function to measure, number of items processed by one call, unit of the items)."""
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def synthetic_file(case, workdir, **kwargs):
+    """Writes the synthetic iba file of the case and returns its path."""
+
+    modules = max(1, -(-case['channels'] // CHANNELS_PER_MODULE))
+    path = os.path.join(workdir, 'case.dat')
+    write_synthetic_file(path, datetime(2019, 1, 1), duration=case['duration'], modules=modules,
+                         channels=case['channels'] // modules, rates=(case['rate'],), digital=0.25, **kwargs)
+    return path
+
+
+@benchmark('readIbaFile')
+def bench_read_file(case, workdir):
+    iba_file = synthetic_file(case, workdir)
+    ids = ['{0}:{1}'.format(module, nr) for module, nr in channel_ids(iba_file)]
+    frames = checkFile(iba_file)[1]
+    return (lambda: readIbaFile(iba_file, channels=ids, names=ids, time_mode='implicit', caching=False),
+            len(ids) * frames, 'samples')
+
+
+@benchmark('readIbaFile_column')
+def bench_read_file_column(case, workdir):
+    iba_file = synthetic_file(case, workdir)
+    ids = ['{0}:{1}'.format(module, nr) for module, nr in channel_ids(iba_file)]
+    frames = checkFile(iba_file)[1]
+    return (lambda: readIbaFile(iba_file, channels=ids, names=ids, time_mode='column', caching=False),
+            len(ids) * frames, 'samples')
+
+
+@benchmark('read_numeric_channel')
+def bench_read_numeric_channel(case, workdir):
+    iba_file = synthetic_file(case, workdir)
+    clk, frames = checkFile(iba_file)
+    numeric_ids = channel_ids(iba_file)
+
+    def run():
+        with ibaReader(iba_file) as reader:
+            for module, nr in numeric_ids:
+                __read_numeric_channel__(__get_iba_channel_reader__('{0}:{1}'.format(module, nr), reader), 0, clk)
+
+    return run, len(numeric_ids) * frames, 'samples'
+
+
+@benchmark('read_text_channel')
+def bench_read_text_channel(case, workdir):
+    iba_file = synthetic_file(case, workdir, text=1)
+    clk, frames = checkFile(iba_file)
+    text_ids = channel_ids(iba_file, text=True)
+
+    def run():
+        with ibaReader(iba_file) as reader:
+            for module, nr in text_ids:
+                __read_text_channel__(__get_iba_channel_reader__('{0}:{1}'.format(module, nr), reader), 0, clk,
+                                      frames)
+
+    return run, len(text_ids) * frames, 'samples'
+
+
+@benchmark('get_channels')
+def bench_get_channels(case, workdir):
+    iba_file = synthetic_file(case, workdir)
+    return lambda: get_channels(iba_file), case['channels'], 'channels'
+
+
+@benchmark('sortIbaFiles')
+def bench_sort_files(case, workdir):
+    iba_files = write_synthetic_files(os.path.join(workdir, 'sort'), files=case['files'], duration=case['duration'],
+                                      modules=1, channels=1)
+    return lambda: sortIbaFiles(list(reversed(iba_files))), len(iba_files), 'files'
+
+
+@benchmark('VariableUpdater_tick')
+def bench_updater_tick(case, workdir):
+    synthetic_file(case, workdir)
+
+    # build the address space of the server without opening the endpoint
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        server = IbaToUaServer(data_dirs=[workdir])
+        recorder = server.recorders[0]
+        recorder.iba_files = recorder.discover_iba_files()
+        recorder.iba_info = recorder.get_union_info(recorder.iba_files)
+        server.init_opc()
+        entry = recorder.load_iba_file(recorder.iba_files[0])
+
+    queue = PlaybackQueue()
+    queue.append(entry)
+    rate = list(recorder.iba_info['channels'].keys())[0]
+    updater = VariableUpdater(server=server._server, channel=recorder.iba_info['channels'][rate],
+                              period=float(rate), queue=queue, rate=rate, clock=PlaybackClock(queue))
+    time_axis = entry['time_axis'][rate]
+    ticks = min(len(time_axis), 1000)
+
+    def run():
+        # one tick per sample, as if the clock advanced by one period in between
+        updater._load_file(None)
+        for idx in range(ticks):
+            updater._tick(time_axis.start_ns + idx * time_axis.period_ns)
+
+    return run, ticks * case['channels'], 'writes'
+
+
+def bench_async_updater_tick(case, workdir):
+    """The VariableUpdater_tick benchmark of the asyncio engine, the values are written to an asyncua server."""
+
+    synthetic_file(case, workdir)
+    loop = asyncio.new_event_loop()
+
+    # build the address space of the server without opening the endpoint
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        server = AsyncIbaToUaServer(data_dirs=[workdir])
+        recorder = server.recorders[0]
+        recorder.iba_files = recorder.discover_iba_files()
+        recorder.iba_info = recorder.get_union_info(recorder.iba_files)
+        loop.run_until_complete(server.init_opc())
+        entry = recorder.load_iba_file(recorder.iba_files[0])
+
+    queue = PlaybackQueue()
+    queue.append(entry)
+    rate = list(recorder.iba_info['channels'].keys())[0]
+    updater = AsyncVariableUpdater(server=server._server, channel=recorder.iba_info['channels'][rate],
+                                   period=float(rate), queue=queue, rate=rate, clock=PlaybackClock(queue))
+    time_axis = entry['time_axis'][rate]
+    ticks = min(len(time_axis), 1000)
+
+    async def run():
+        # one tick per sample including the writes to the address space
+        updater._load_file(None)
+        for idx in range(ticks):
+            updater._tick(time_axis.start_ns + idx * time_axis.period_ns)
+            await updater._flush()
+
+    return lambda: loop.run_until_complete(run()), ticks * case['channels'], 'writes'
+
+
+# the asyncio engine is optional
+if AsyncServer is not None:
+    benchmark('AsyncVariableUpdater_tick')(bench_async_updater_tick)
+
+
+def channel_ids(iba_file, text=False):
+    """Returns (module, nr) of the numeric or the text channels of a synthetic file."""
+
+    with ibaReader(iba_file) as reader:
+        return [(chan_id.Module, chan_id.Nr) for chan_id, _ in reader.EnumerateChannels()
+                if reader.QueryChannel(chan_id).IsText == text]
+
+
+def measure(func, repeat):
+    """Returns the best time of repeat calls of func in seconds and the peak memory traced during one call."""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def machine_info():
+    """Describes the machine and the code the benchmarks ran on."""
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.realpath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'host': socket.gethostname(), 'platform': platform.platform(), 'python': platform.python_version(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count(), 'commit': commit,
+            'time': datetime.now().isoformat(timespec='seconds')}
+
+
+def case_key(result):
+    return result['benchmark'], tuple(sorted(result['case'].items()))
+
+
+def compare(results, previous_file):
+    """Prints the change of the throughput compared to a previous result file."""
+
+    with open(previous_file) as f:
+        previous = {case_key(result): result for result in json.load(f)['results']}
+
+    print('\ncompared to {0}:'.format(previous_file))
+    for result in results:
+        other = previous.get(case_key(result))
+        if other is None or not other['throughput']:
+            continue
+        print('{0:>25} {1:<48} {2:>+8.1%}'.format(result['benchmark'], format_case(result['case']),
+                                                   result['throughput'] / other['throughput'] - 1))
+
+
+def format_case(case):
+    return ' '.join('{0}={1}'.format(key, val) for key, val in sorted(case.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the read path and the publish loop.')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument('--channels', type=int, nargs='+', default=[10, 100, 1000],
+                        help='channels per file (default: 10 100 1000)')
+    parser.add_argument('--rates', type=float, nargs='+', default=[0.001, 0.01],
+                        help='sample rates of the channels in seconds (default: 0.001 0.01)')
+    parser.add_argument('--durations', type=float, nargs='+', default=[10.0],
+                        help='length of the files in seconds (default: 10)')
+    parser.add_argument('--files', type=int, default=50, help='number of files sorted by sortIbaFiles (default: 50)')
+    parser.add_argument('--repeat', type=int, default=3, help='calls per case, the best one counts (default: 3)')
+    parser.add_argument('--output', default=None,
+                        help='result file (default: benchmarks/results/<time>_<host>.json)')
+    parser.add_argument('--compare', default=None, help='previous result file to compare with')
+    args = parser.parse_args()
+
+    set_backend('synthetic')
+
+    # readIbaFile adds the channels one by one, which pandas warns about for many channels
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+
+    results = list()
+    print('{0:>25} {1:<48} {2:>12} {3:>16} {4:>12}'.format('benchmark', 'case', 'time ms', 'throughput/s',
+                                                            'peak MiB'))
+    for name in args.benchmarks:
+        for channels, rate, duration in itertools.product(args.channels, args.rates, args.durations):
+            case = {'channels': channels, 'rate': rate, 'duration': duration}
+            if name == 'sortIbaFiles':
+                case = {'files': args.files, 'duration': duration}
+                if (channels, rate) != (args.channels[0], args.rates[0]):
+                    continue
+
+            with tempfile.TemporaryDirectory() as workdir:
+                func, items, unit = BENCHMARKS[name](case, workdir)
+                seconds, peak = measure(func, args.repeat)
+
+            result = {'benchmark': name, 'case': case, 'seconds': seconds, 'items': items, 'unit': unit,
+                      'throughput': items / seconds if seconds else None, 'peak_memory_bytes': peak}
+            results.append(result)
+            print('{0:>25} {1:<48} {2:>12.2f} {3:>16,.0f} {4:>12.1f}'.format(
+                name, format_case(case), seconds * 1e3, result['throughput'] or 0, peak / 2 ** 20))
+
+    # store the results for later comparison
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS, exist_ok=True)
+        output = os.path.join(RESULTS, '{0}_{1}.json'.format(datetime.now().strftime('%Y%m%d_%H%M%S'),
+                                                             socket.gethostname()))
+    with open(output, 'w') as f:
+        json.dump({'machine': machine_info(), 'results': results}, f, indent=2)
+    print('\nresults written to {0}'.format(output))
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+import os
+import math
+import time
+import asyncio
+import platform
+import numpy as np
+from datetime import datetime
+from threading import Thread
+from opcua import Server
+from pyIbaTools.pyIbaTools import IbaTimeAxis, checkFile
+from playback import PlaybackQueue, PlaybackClock
+from server import VariableUpdater
+from timing import Sleeper
+
+# bytes of a sample in the playback buffers
+SAMPLE_BYTES = np.dtype(np.float64).itemsize
+
+# share of the ticks of a sample rate which may overrun their period
+OVERRUN_TOLERANCE = 0.001
+
+# data played back by the benchmark of the publish path
+BENCHMARK_FRAMES = 1000
+BENCHMARK_PERIOD_NS = 1000000
+
+
+def capacity_report(server, workers=1, benchmark_seconds=2.0, benchmark_channels=500, engine='threaded'):
+    """Predicts whether the server keeps up with the iba files on this machine without starting it. Only the headers
+    and the channel lists of the iba files are read. The report contains per recorder and sample rate the number of
+    channels, the expected writes per second and the size of the playback buffers, the memory needed with the data
+    held by the server process or in shared memory by a cluster of workers, and the fixed cost of a tick, the cost of
+    a write and the wakeup latency of the updaters a short benchmark of the given engine measured on this machine.
+
+    :param server: (mandatory, IbaToUaServer) the configured but not started server
+    :param workers: (optional, int) number of worker processes the modules are partitioned across
+    :param benchmark_seconds: (optional, float) duration of the benchmark of the publish path
+    :param benchmark_channels: (optional, int) number of nodes written per tick by the benchmark of the writes
+    :param engine: (optional, string) engine of the server, see server.ENGINES
+    :return: (dict) the report, ready to be dumped as JSON
+    """
+
+    recorders = list()
+    total_writes = 0.0
+    total_bytes = 0
+    largest_file = 0
+    first_files = 0
+    for recorder in server.recorders:
+        recorder.iba_files = recorder.discover_iba_files()
+        recorder.iba_info = recorder.get_union_info(recorder.iba_files)
+
+        # duration of each file from its header
+        durations = list()
+        for iba_file in recorder.iba_files:
+            clk, frames = checkFile(iba_file)
+            durations.append(clk * frames)
+
+        groups = list()
+        for sampleRate, channel in sorted(recorder.iba_info['channels'].items(), key=lambda item: float(item[0])):
+            period = recorder.publish_period(sampleRate)
+            ticks = tick_rate(period, server.speed, server.max_tick_rate, server.block_speed)
+            writes = len(channel) * server.replicas * ticks
+
+            # the union of the channels is an upper bound of the channels of each file
+            file_bytes = [math.ceil(duration / period) * len(channel) * SAMPLE_BYTES for duration in durations]
+            groups.append({'rate': sampleRate, 'publish_period': period, 'channels': len(channel),
+                           'ticks_per_second': ticks, 'writes_per_second': writes, 'buffer_bytes': sum(file_bytes),
+                           'first_file_bytes': file_bytes[0]})
+            total_writes += writes
+
+        sizes = [sum(math.ceil(duration / group['publish_period']) * group['channels'] * SAMPLE_BYTES
+                     for group in groups) for duration in durations]
+        total_bytes += sum(sizes)
+        largest_file = max([largest_file] + sizes)
+        first_files += sizes[0]
+
+        recorders.append({'name': recorder.name, 'directory': recorder.directory, 'files': len(recorder.iba_files),
+                          'duration_seconds': sum(durations), 'channel_configurations': recorder.schema_count,
+                          'modules': len(recorder.iba_info['modules']),
+                          'channels': sum(group['channels'] for group in groups),
+                          'writes_per_second': sum(group['writes_per_second'] for group in groups),
+                          'buffer_bytes': sum(sizes), 'groups': groups})
+
+    # the file being decoded exists twice, as DataFrame and as the array appended to the playback
+    memory = {
+        'process': {'resident_bytes': total_bytes, 'first_file_bytes': first_files,
+                    'peak_bytes': total_bytes + largest_file},
+        'shared_memory': {'shared_bytes': total_bytes, 'launcher_peak_bytes': 2 * largest_file,
+                          'workers': workers},
+    }
+
+    # a tick has a fixed cost no matter how many channels it writes, which dominates the small fast groups. it is
+    # the difference of a tick with a single channel and the share of the writes of a tick with many channels
+    small = benchmark_publish(1, benchmark_seconds / 4, server.recorded_timestamps, engine)
+    large = benchmark_publish(benchmark_channels, benchmark_seconds / 4, server.recorded_timestamps, engine)
+    write_seconds = max(large['tick_seconds'] - small['tick_seconds'], 0.0) / max(benchmark_channels - 1, 1)
+    fixed_seconds = max(small['tick_seconds'] - write_seconds, 0.0)
+
+    # the updaters wake up late by the latency of the timer. measured at the shortest interval between two ticks
+    intervals = [1.0 / updater_ticks(group['publish_period'], server.speed, server.max_tick_rate)
+                 for rec in recorders for group in rec['groups']]
+    period = min(intervals + [0.01])
+    latency = benchmark_wakeup(period, benchmark_seconds / 2, engine, server.timing, server.spin_threshold,
+                               server.cpu_affinity)
+    benchmark = {'engine': engine, 'fixed_tick_seconds': fixed_seconds, 'write_seconds': write_seconds,
+                 'writes_per_second': 1.0 / write_seconds if write_seconds else None, 'ticks': [small, large],
+                 'wakeup': {'period': period, 'wakeups': len(latency), 'mean_seconds': float(latency.mean()),
+                            'p99_seconds': float(np.percentile(latency, 99)), 'max_seconds': float(latency.max())}}
+
+    # a server process publishes on a single core, the workers of a cluster on one core each at best. the asyncio
+    # engine runs all updaters on one event loop
+    cores = min(workers, os.cpu_count() or 1) if engine == 'threaded' else 1
+    capacity = benchmark['writes_per_second'] * cores if write_seconds else None
+
+    # each replica of a sample rate is an updater of its own. a tick overruns if it has not written the samples of
+    # all of its channels before the next tick is due, counting the time it woke up late
+    load = 0.0
+    late_groups = list()
+    for rec in recorders:
+        for group in rec['groups']:
+            ticks = updater_ticks(group['publish_period'], server.speed, server.max_tick_rate)
+            tick_seconds = fixed_seconds + group['channels'] * group['ticks_per_second'] / ticks * write_seconds
+            group['tick_seconds'] = tick_seconds
+            group['overrun_ratio'] = float(np.mean(latency + tick_seconds > 1.0 / ticks))
+            group['fits_period'] = group['overrun_ratio'] <= OVERRUN_TOLERANCE
+            load += tick_seconds * ticks * server.replicas
+            if not group['fits_period']:
+                late_groups.append('{0}/{1}'.format(rec['name'], group['rate']))
+    utilization = load / cores
+
+    return {
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'cpu_count': os.cpu_count(), 'time': datetime.now().isoformat(timespec='seconds')},
+        'options': {'tbase': server.tbase, 'aggregation': server.aggregation, 'speed': server.speed,
+                    'max_tick_rate': server.max_tick_rate, 'block_speed': server.block_speed,
+                    'replicas': server.replicas, 'recorded_timestamps': server.recorded_timestamps,
+                    'workers': workers, 'engine': engine, 'timing': server.timing},
+        'recorders': recorders,
+        'total': {'channels': sum(rec['channels'] for rec in recorders), 'writes_per_second': total_writes,
+                  'buffer_bytes': total_bytes},
+        'memory': memory,
+        'benchmark': benchmark,
+        'prediction': {'capacity_writes_per_second': capacity, 'utilization': utilization,
+                       'headroom': 1.0 - utilization,
+                       'keeps_up': utilization <= 1.0 and not late_groups,
+                       'late_groups': late_groups},
+    }
+
+
+def tick_rate(period, speed=1.0, max_tick_rate=1000, block_speed=None):
+    """Returns the samples published per second by the updater of a sample rate, see VariableUpdater.run."""
+
+    ticks = speed / period
+    if block_speed is not None and speed >= block_speed:
+        # all samples passed within a tick are published
+        return ticks
+    return min(ticks, max_tick_rate)
+
+
+def updater_ticks(period, speed=1.0, max_tick_rate=1000):
+    """Returns the ticks per second of the updater of a sample rate, see VariableUpdater._schedule."""
+
+    return min(speed / period, max_tick_rate)
+
+
+def benchmark_publish(channels=500, seconds=2.0, recorded_timestamps=False, engine='threaded'):
+    """Measures the ticks and writes per second of the publish path of the updaters of the given engine on this
+    machine. The values are written to the address space of an opc server which is not started, so no network is
+    involved.
+
+    :param channels: (optional, int) number of value nodes written per tick
+    :param seconds: (optional, float) duration of the measurement
+    :param recorded_timestamps: (optional, bool) publish with the recorded time as source timestamp
+    :param engine: (optional, string) engine of the server, see server.ENGINES
+    :return: (dict) with keys: channels, seconds, ticks, tick_seconds, writes, writes_per_second
+    """
+
+    if engine == 'asyncio':
+        return asyncio.run(benchmark_publish_async(channels, seconds, recorded_timestamps))
+
+    server = Server()
+    idx = server.register_namespace('http://iba-playback.sms-digital.io/capacity')
+    folder = server.nodes.objects.add_folder(idx, 'Capacity')
+    channel = [{'opc_value': folder.add_variable(idx, 'value{0}'.format(num), 0.0), 'type': 'analog'}
+               for num in range(channels)]
+    updater = VariableUpdater(server=server, channel=channel, **benchmark_playback(channels, recorded_timestamps))
+
+    # one tick per sample, as if the clock advanced by one period in between
+    ticks = 0
+    writes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        # the work of VariableUpdater.run around the tick
+        wakeup = time.monotonic_ns()
+        updater.clock.now_ns()
+        tick_writes = updater._tick(updater.queue.start_ns + (ticks % BENCHMARK_FRAMES) * BENCHMARK_PERIOD_NS)
+        updater.metrics.record(time.monotonic_ns() - wakeup, 0, tick_writes)
+        writes += tick_writes
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    return {'channels': channels, 'seconds': elapsed, 'ticks': ticks, 'tick_seconds': elapsed / ticks,
+            'writes': writes, 'writes_per_second': writes / elapsed}
+
+
+async def benchmark_publish_async(channels=500, seconds=2.0, recorded_timestamps=False):
+    """The asyncio engine counterpart of benchmark_publish. Each tick collects the values and writes them to the
+    address space of an asyncua server."""
+
+    from async_engine import AsyncVariableUpdater, Server as AsyncServer
+    if AsyncServer is None:
+        raise ImportError('The asyncio engine needs asyncua. Install it with: pip install asyncua')
+
+    server = AsyncServer()
+    await server.init()
+    idx = await server.register_namespace('http://iba-playback.sms-digital.io/capacity')
+    folder = await server.nodes.objects.add_folder(idx, 'Capacity')
+    channel = [{'opc_value': await folder.add_variable(idx, 'value{0}'.format(num), 0.0), 'type': 'analog'}
+               for num in range(channels)]
+    updater = AsyncVariableUpdater(server=server, channel=channel,
+                                   **benchmark_playback(channels, recorded_timestamps))
+
+    ticks = 0
+    writes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        wakeup = time.monotonic_ns()
+        updater.clock.now_ns()
+        tick_writes = updater._tick(updater.queue.start_ns + (ticks % BENCHMARK_FRAMES) * BENCHMARK_PERIOD_NS)
+        await updater._flush()
+        updater.metrics.record(time.monotonic_ns() - wakeup, 0, tick_writes)
+        writes += tick_writes
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    return {'channels': channels, 'seconds': elapsed, 'ticks': ticks, 'tick_seconds': elapsed / ticks,
+            'writes': writes, 'writes_per_second': writes / elapsed}
+
+
+def benchmark_playback(channels, recorded_timestamps=False):
+    """Returns the arguments of an updater playing back random data of the given number of channels."""
+
+    time_axis = IbaTimeAxis(datetime(2019, 1, 1), BENCHMARK_PERIOD_NS, BENCHMARK_FRAMES)
+    queue = PlaybackQueue()
+    queue.append({'file': None, 'data': {'rate': np.random.default_rng(0).normal(size=(BENCHMARK_FRAMES, channels))},
+                  'time_axis': {'rate': time_axis}, 'remap': {'rate': np.arange(channels)},
+                  'start_ns': time_axis.start_ns, 'end_ns': time_axis.start_ns + time_axis.duration_ns})
+    clock = PlaybackClock(queue)
+    clock.start()
+    return {'period': BENCHMARK_PERIOD_NS / 1e9, 'queue': queue, 'rate': 'rate', 'clock': clock,
+            'recorded_timestamps': recorded_timestamps}
+
+
+def benchmark_wakeup(period, seconds=0.5, engine='threaded', timing='sleep', spin_threshold=0.002, cpu_affinity=None):
+    """Measures how late the updaters of the given engine wake up for their ticks on this machine. The threaded engine
+    waits in a thread of its own with the Sleeper of the timing mode, the asyncio engine on an event loop.
+
+    :param period: (mandatory, float) seconds between two ticks
+    :param seconds: (optional, float) duration of the measurement
+    :param engine: (optional, string) engine of the server, see server.ENGINES
+    :param timing: (optional, string) timing mode of the threaded engine, see timing.TIMING_MODES
+    :param spin_threshold: (optional, float) seconds before a tick at which the precise timing starts spinning
+    :param cpu_affinity: (optional, list of int) CPUs the thread of the threaded engine is pinned to
+    :return: (numpy.ndarray) seconds by which each wakeup was late
+    """
+
+    period_ns = int(round(period * 1e9))
+    latency = np.zeros(max(int(seconds / period), 1), dtype=np.int64)
+
+    if engine == 'asyncio':
+        async def wait():
+            deadline = time.monotonic_ns() + period_ns
+            for tick in range(latency.shape[0]):
+                await asyncio.sleep(max(deadline - time.monotonic_ns(), 0) / 1e9)
+                latency[tick] = time.monotonic_ns() - deadline
+                deadline += period_ns
+
+        asyncio.run(wait())
+    else:
+        sleeper = Sleeper(timing, spin_threshold, cpu_affinity)
+
+        # the sleeper prepares the thread it runs in, like the thread of an updater
+        def wait():
+            sleeper.prepare_thread()
+            deadline = time.monotonic_ns() + period_ns
+            for tick in range(latency.shape[0]):
+                sleeper.sleep_until(deadline)
+                latency[tick] = time.monotonic_ns() - deadline
+                deadline += period_ns
+
+        thread = Thread(target=wait, name='WakeupBenchmark')
+        thread.start()
+        thread.join()
+
+    return np.maximum(latency, 0) / 1e9
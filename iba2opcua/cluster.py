@@ -0,0 +1,375 @@
+import os
+import signal
+import threading
+import numpy as np
+from threading import Thread, Lock
+from urllib.parse import urlsplit
+from multiprocessing import Process, Queue
+from multiprocessing.shared_memory import SharedMemory
+from file_watcher import IbaFileWatcher
+from recorder import IbaRecorder
+from playback import SharedTimeline, SharedPlaybackClock
+from server import IbaToUaServer, ENDPOINT
+
+
+class IbaCluster(object):
+    """The IbaCluster scales the playback of one recorder across several processes. A single server is bound to one
+    core by the GIL, so the modules are partitioned across worker processes, each running its own IbaToUaServer with
+    its own endpoint (port) and a 'Partition <k>' folder holding its modules. The iba files are decoded once by the
+    launching process and stored in shared memory, which the workers map read-only. All workers follow a shared
+    playback clock, so the partitions stay time aligned, and the playback controls of any partition apply to all."""
+
+    def __init__(self, data_dir, workers, endpoint=ENDPOINT, selection=None, tbase=0, aggregation='first',
+                 watch=False, poll_interval=1.0, retention=3600.0, speed=1.0, metrics_port=None, profile_dir=None,
+                 **options):
+        """Default constructor.
+
+        :param data_dir: (mandatory, string) directory of the iba files
+        :param workers: (mandatory, int) number of worker processes
+        :param endpoint: (optional, string) endpoint url of the first worker. Worker k listens on the port plus k.
+        :param selection: (optional, ChannelSelection) which channels are published and at which rate
+        :param tbase: (optional, float) publish rate in seconds for all channels faster than tbase
+        :param aggregation: (optional, string) how the samples within one tbase are reduced
+        :param watch: (optional, bool) watch the data directory and append new iba files to the playback
+        :param poll_interval: (optional, float) seconds between two scans of the directory if inotify is not available
+        :param retention: (optional, float) seconds of recorded time the files are kept behind the playback position
+        with watch. Older files are evicted and their shared memory is released. None keeps all files.
+        :param speed: (optional, float) factor by which the playback runs faster than real time
+        :param metrics_port: (optional, int) port of the Prometheus endpoint of the first worker. Worker k uses the
+        port plus k. None disables the endpoints.
+        :param profile_dir: (optional, string) directory the profiles are written to, one sub folder per worker
+        :param options: further options of the IbaToUaServer of each worker, e.g. overrun or timing
+        """
+
+        if workers < 1:
+            raise ValueError('The number of workers must be at least 1, got {0}.'.format(workers))
+
+        self.workers = int(workers)
+        self.endpoint = endpoint
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.metrics_port = metrics_port
+        self.profile_dir = profile_dir
+        self.options = dict(options, tbase=tbase, aggregation=aggregation)
+
+        # the launcher decodes the files of all partitions
+        self.recorder = IbaRecorder(data_dir, tbase=tbase, aggregation=aggregation, selection=selection)
+
+        # extent of the loaded files and playback position shared by all workers
+        self.timeline = SharedTimeline()
+        self.clock = SharedPlaybackClock(self.timeline, speed=speed)
+
+        # modules of each partition and the channel info of each worker
+        self.partitions = list()
+        self._partition_info = list()
+
+        # shared memory blocks of the loaded files with their start and end time, queues to pass them to the workers
+        # and the worker processes
+        self._blocks = list()
+        self._queues = list()
+        self._processes = list()
+        self._watcher = None
+
+        # guards the blocks against the loader and watcher threads while the cluster is stopped
+        self._lock = Lock()
+        self._stopped = False
+
+    def start(self):
+        """Decodes the first iba file, starts the workers and decodes the remaining (and new) files in the background.
+
+        :return: None
+        """
+
+        # a terminated launcher must still release the shared memory, so SIGTERM takes the path of ctrl+c
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, interrupt)
+
+        print('finding iba files ...')
+        self.recorder.iba_files = self.recorder.discover_iba_files()
+
+        print('receiving channel info ...')
+        self.recorder.iba_info = self.recorder.get_union_info(self.recorder.iba_files)
+
+        self.partitions = partition_modules(self.recorder, self.workers)
+        self._partition_info = [self.partition_info(modules) for modules in self.partitions]
+        for num, modules in enumerate(self.partitions):
+            print('\tPartition {0}: {1} modules on {2}'.format(num, len(modules), partition_url(self.endpoint, num)))
+
+        # the workers need the first file to start their updaters
+        print('reading iba data ...')
+        self._queues = [Queue() for _ in self.partitions]
+        self.append_iba_file(self.recorder.iba_files[0])
+
+        print('starting workers ...')
+        for num, iba_info in enumerate(self._partition_info):
+            options = dict(self.options, endpoint=partition_url(self.endpoint, num),
+                           subtree='Partition {0}'.format(num))
+            if self.metrics_port is not None:
+                options['metrics_port'] = self.metrics_port + num
+            if self.profile_dir is not None:
+                options['profile_dir'] = os.path.join(self.profile_dir, 'partition{0}'.format(num))
+
+            process = Process(target=run_worker, name='Partition{0}'.format(num), daemon=True,
+                              args=(self.recorder.directory, iba_info, self._queues[num], self.clock, options))
+            process.start()
+            self._processes.append(process)
+
+        if self.watch:
+            self._watcher = IbaFileWatcher(self.recorder.directory, self._append_watched_file,
+                                           known_files=self.recorder.iba_files[:1],
+                                           pending_files=self.recorder.iba_files[1:],
+                                           poll_interval=self.poll_interval)
+            self._watcher.start()
+        else:
+            Thread(target=self._load_remaining_files, name='IbaFileLoader', daemon=True).start()
+
+    def join(self):
+        """Waits until all workers exited.
+
+        :return: None
+        """
+
+        for process in self._processes:
+            process.join()
+
+    def stop(self):
+        """Stops the workers and releases the shared memory. The workers are terminated and joined first, so no
+        process maps a block anymore when it is unlinked.
+
+        :return: None
+        """
+
+        if self._watcher is not None:
+            self._watcher.stop()
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        with self._lock:
+            self._stopped = True
+            for _, _, block in self._blocks:
+                block.close()
+                block.unlink()
+            self._blocks = list()
+
+    def _load_remaining_files(self):
+        """Decodes the remaining iba files in chronological order and passes them to the workers."""
+
+        for iba_file in self.recorder.iba_files[1:]:
+            try:
+                self.append_iba_file(iba_file)
+            except Exception as e:
+                print('could not read {0}: {1}'.format(iba_file, e))
+
+    def append_iba_file(self, iba_file):
+        """Decodes the given iba file into shared memory and appends it to the playback of all workers. Each worker
+        gets its own contiguous block of columns per sample rate, so a published row is a single slice.
+
+        :param iba_file: (mandatory, string) path to a iba file
+        :return: None
+        """
+
+        entry = self.recorder.load_iba_file(iba_file)
+
+        # the columns of each partition and sample rate and their position in the shared block
+        layout = list()
+        size = 0
+        for iba_info in self._partition_info:
+            parts = dict()
+            for sampleRate, indices in iba_info['indices'].items():
+                remap = entry['remap'][sampleRate][indices]
+                columns = remap[remap >= 0]
+                local = np.full(len(remap), -1, dtype=np.int64)
+                local[remap >= 0] = np.arange(len(columns))
+                shape = (entry['data'][sampleRate].shape[0], len(columns))
+                parts[sampleRate] = (columns, local, size, shape)
+                size += int(np.prod(shape)) * np.dtype(np.float64).itemsize
+            layout.append(parts)
+
+        with self._lock:
+            if self._stopped:
+                return
+            block = SharedMemory(create=True, size=max(size, 1))
+            self._blocks.append((entry['start_ns'], entry['end_ns'], block))
+
+            for num, parts in enumerate(layout):
+                descriptor = {'file': entry['file'], 'fingerprint': entry['fingerprint'], 'block': block.name,
+                              'start_ns': entry['start_ns'], 'end_ns': entry['end_ns'], 'data': dict(),
+                              'time_axis': entry['time_axis'], 'remap': dict()}
+                for sampleRate, (columns, local, offset, shape) in parts.items():
+                    # no view of the block outlives the copy, otherwise it could not be closed
+                    np.ndarray(shape, dtype=np.float64, buffer=block.buf, offset=offset)[:] = \
+                        entry['data'][sampleRate][:, columns]
+                    descriptor['data'][sampleRate] = (offset, shape)
+                    descriptor['remap'][sampleRate] = local
+                self._queues[num].put(descriptor)
+
+        self.timeline.extend(entry['start_ns'], entry['end_ns'])
+        if iba_file not in self.recorder.iba_files:
+            self.recorder.iba_files.append(iba_file)
+        print('{0}: appended {1} to the playback of {2} partitions ({3} files).'.format(
+            self.recorder.name, os.path.basename(iba_file), len(layout), len(self.timeline)))
+
+    def _append_watched_file(self, iba_file):
+        """Appends a new iba file to the playback and evicts the files which have been played back more than the
+        retention ago."""
+
+        self.append_iba_file(iba_file)
+        if self.retention is not None:
+            self.evict_iba_files(self.clock.now_ns() - int(self.retention * 1e9))
+
+    def evict_iba_files(self, before_ns):
+        """Removes the files which end at or before the given recorded time from the playback of all workers and
+        unlinks their shared memory. The memory is released as soon as no worker maps it anymore.
+
+        :param before_ns: (mandatory, int) recorded time in ns since epoch
+        :return: (int) number of evicted files
+        """
+
+        with self._lock:
+            evicted = [block for block in self._blocks if block[1] <= before_ns]
+            if not evicted:
+                return 0
+
+            # the workers drop the files with the same end time
+            for queue in self._queues:
+                queue.put({'evict': before_ns})
+
+            self._blocks = [block for block in self._blocks if block[1] > before_ns]
+            for _, _, block in evicted:
+                block.close()
+                block.unlink()
+
+            if self._blocks:
+                self.timeline.evict(min(start_ns for start_ns, _, _ in self._blocks), len(evicted))
+        print('{0}: evicted {1} played back files ({2} files).'.format(self.recorder.name, len(evicted),
+                                                                      len(self.timeline)))
+        return len(evicted)
+
+    def partition_info(self, modules):
+        """Returns the channel info of a worker publishing the given modules. The channels of each sample rate keep
+        the order of the recorder, and their index within the channels of the recorder is stored under 'indices'.
+
+        :param modules: (mandatory, list of strings) modules of the partition
+        :return: dict with keys: modules (dict), channels (dict), indices (dict of numpy.ndarray by sample rate)
+        """
+
+        iba_info = self.recorder.iba_info
+        channels, indices = dict(), dict()
+        for sampleRate, channel in iba_info['channels'].items():
+            selected = [num for num, chan in enumerate(channel) if self.recorder.get_channel_key(chan)[0] in modules]
+            if selected:
+                channels[sampleRate] = [channel[num] for num in selected]
+                indices[sampleRate] = np.array(selected, dtype=np.int64)
+
+        return {'modules': {module: iba_info['modules'][module] for module in modules}, 'channels': channels,
+                'indices': indices}
+
+
+def partition_modules(recorder, workers):
+    """Splits the modules of the recorder into partitions of about the same number of writes per second. Each module
+    is assigned to the partition with the least load so far, starting with the module of the highest load.
+
+    :param recorder: (mandatory, IbaRecorder) recorder whose channel info has been read
+    :param workers: (mandatory, int) number of partitions
+    :return: list of lists of module names. Partitions without modules are dropped.
+    """
+
+    load = dict()
+    for sampleRate, channel in recorder.iba_info['channels'].items():
+        for chan in channel:
+            module = recorder.get_channel_key(chan)[0]
+            load[module] = load.get(module, 0.0) + 1.0 / recorder.publish_period(sampleRate)
+
+    partitions = [list() for _ in range(workers)]
+    totals = [0.0] * workers
+    for module in sorted(load, key=load.get, reverse=True):
+        num = totals.index(min(totals))
+        partitions[num].append(module)
+        totals[num] += load[module]
+
+    # keep the order of the modules within each partition
+    order = list(recorder.iba_info['modules'])
+    return [sorted(modules, key=order.index) for modules in partitions if modules]
+
+
+def partition_url(endpoint, num):
+    """Returns the endpoint url of the given worker, i.e. the port is increased by the number of the worker."""
+
+    url = urlsplit(endpoint)
+    return url._replace(netloc='{0}:{1}'.format(url.hostname, (url.port or 4840) + num)).geturl()
+
+
+def interrupt(signum, frame):
+    """Signal handler raising KeyboardInterrupt, so the launcher is stopped like by ctrl+c."""
+
+    raise KeyboardInterrupt()
+
+
+def run_worker(data_dir, iba_info, queue, clock, options):
+    """Entry point of a worker process. Builds the address space of the partition, maps the shared memory of the
+    files passed through the queue and plays them back.
+
+    :param data_dir: (mandatory, string) directory of the iba files
+    :param iba_info: (mandatory, dict) channel info of the partition, see IbaCluster.partition_info
+    :param queue: (mandatory, multiprocessing.Queue) descriptors of the loaded files
+    :param clock: (mandatory, SharedPlaybackClock) the playback position shared by all workers
+    :param options: (mandatory, dict) options of the IbaToUaServer
+    :return: None
+    """
+
+    # the worker is stopped by the launcher, the handler of the launcher would only interrupt its main thread
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    server = IbaToUaServer(data_dirs=[data_dir], clock=clock, **options)
+    recorder = server.recorders[0]
+    recorder.iba_info = {'modules': iba_info['modules'], 'channels': iba_info['channels']}
+
+    print('building opc server ...')
+    server.init_opc()
+
+    # handles of the mapped blocks, they must stay open as long as their data is played back
+    blocks = dict()
+
+    # handles of evicted blocks. they are closed as soon as no updater plays back their data anymore
+    retired = list()
+
+    def attach(descriptor):
+        if descriptor['block'] not in blocks:
+            try:
+                blocks[descriptor['block']] = SharedMemory(name=descriptor['block'])
+            except FileNotFoundError:
+                # the file has been evicted before this worker got to it
+                return
+        buffer = blocks[descriptor['block']].buf
+
+        data = dict()
+        for sampleRate, (offset, shape) in descriptor['data'].items():
+            data[sampleRate] = np.ndarray(shape, dtype=np.float64, buffer=buffer, offset=offset)
+            data[sampleRate].flags.writeable = False
+        recorder.iba_data.append(dict(descriptor, data=data))
+
+    def evict(before_ns):
+        for entry in recorder.iba_data.evict(before_ns):
+            retired.append(blocks.pop(entry['block']))
+
+    def release():
+        for block in list(retired):
+            try:
+                block.close()
+            except BufferError:
+                # an updater still plays back the file
+                continue
+            retired.remove(block)
+
+    attach(queue.get())
+    server.serve()
+
+    while True:
+        message = queue.get()
+        if 'evict' in message:
+            evict(message['evict'])
+        else:
+            attach(message)
+        release()
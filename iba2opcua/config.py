@@ -0,0 +1,200 @@
+import re
+import argparse
+import fnmatch
+import configparser
+
+# options of the [server] section and how they are read. the names are the ones of the command line options
+SERVER_OPTIONS = {
+    'endpoint': 'string',
+    'data_dir': 'lines',
+    'backend': 'string',
+    'tbase': 'float',
+    'aggregation': 'string',
+    'watch': 'boolean',
+    'poll_interval': 'float',
+    'retention': 'float',
+    'overrun': 'string',
+    'metrics_port': 'int',
+    'timing': 'string',
+    'spin_threshold': 'float',
+    'speed': 'float',
+    'max_tick_rate': 'float',
+    'block_speed': 'float',
+    'recorded_timestamps': 'boolean',
+    'replicas': 'int',
+    'replica_offset': 'float',
+    'workers': 'int',
+    'engine': 'string',
+    'cpu_affinity': 'ints',
+    'profile': 'string',
+    'profile_window': 'float',
+}
+
+# command line options which have no meaning in the config file
+COMMAND_LINE_ONLY = ('help', 'config')
+
+
+class ChannelSelection(object):
+    """The ChannelSelection decides which channels of the iba files are published and at which rate. Channels are
+    addressed as '<module>/<channel>', where module is the module number and name as shown in the namespace, e.g.
+    '3 Furnace/Temperature'. A pattern is either a glob on both parts, a glob on the channel name only (no '/'), or a
+    regular expression on the full name if it starts with 're:'."""
+
+    def __init__(self, include=None, exclude=None, rates=None):
+        """Default constructor.
+
+        :param include: (optional, list of strings) patterns of the published channels. Default: all channels
+        :param exclude: (optional, list of strings) patterns of channels which are not published, even if included
+        :param rates: (optional, list of (string, float)) module patterns and the publish rate in seconds of their
+        channels. The first matching pattern wins.
+        """
+
+        self.include = [self.compile(pattern) for pattern in include or list()]
+        self.exclude = [self.compile(pattern) for pattern in exclude or list()]
+        self.rates = [(self.compile(pattern, module=True), float(rate)) for pattern, rate in rates or list()]
+
+    @staticmethod
+    def compile(pattern, module=False):
+        """Returns a function telling whether a module (and channel) name matches the pattern.
+
+        :param pattern: (mandatory, string) glob or 're:' followed by a regular expression
+        :param module: (optional, bool) the pattern is matched against the module name only
+        :return: (callable) taking module and channel name
+        """
+
+        if pattern.startswith('re:'):
+            regex = re.compile(pattern[3:])
+            if module:
+                return lambda mod, name=None: regex.fullmatch(mod) is not None
+            return lambda mod, name: regex.fullmatch('{0}/{1}'.format(mod, name)) is not None
+
+        if module:
+            return lambda mod, name=None: fnmatch.fnmatchcase(mod, pattern)
+        if '/' not in pattern:
+            return lambda mod, name: fnmatch.fnmatchcase(name, pattern)
+        mod_pattern, name_pattern = pattern.split('/', 1)
+        return lambda mod, name: fnmatch.fnmatchcase(mod, mod_pattern) and fnmatch.fnmatchcase(name, name_pattern)
+
+    def selected(self, module, name):
+        """Returns True if the channel shall be published.
+
+        :param module: (mandatory, string) module number and name, e.g. '3 Furnace'
+        :param name: (mandatory, string) name of the channel
+        :return: (bool)
+        """
+
+        if self.include and not any(match(module, name) for match in self.include):
+            return False
+        return not any(match(module, name) for match in self.exclude)
+
+    def rate(self, module):
+        """Returns the publish rate in seconds configured for the module or None.
+
+        :param module: (mandatory, string) module number and name, e.g. '3 Furnace'
+        :return: (float)
+        """
+
+        for match, rate in self.rates:
+            if match(module):
+                return rate
+        return None
+
+
+def read_config(path, arguments=None):
+    """Reads a configuration file of the server. Example:
+
+        [server]
+        endpoint = opc.tcp://0.0.0.0:4840/sms-digital/iba-playback/
+        data_dir = dat
+        tbase = 0.01
+
+        [channels]
+        include =
+            3 Furnace/*
+            re:1[0-9] .*/Speed.*
+        exclude = */Spare*
+
+        [rates]
+        3 Furnace = 0.1
+
+    :param path: (mandatory, string) path to the ini file
+    :param arguments: (optional, argparse.ArgumentParser) command line parser of the server. The values of the
+    [server] section are read and checked like the command line options of the same name. Without it, the options
+    are read by their kind in SERVER_OPTIONS.
+    :return: tuple of (dict of the server options by the dest of their command line option, ChannelSelection)
+    :raises: FileNotFoundError, ValueError
+    """
+
+    # keep the case of the module names and allow ':' in patterns
+    parser = configparser.ConfigParser(delimiters=('=',), interpolation=None)
+    parser.optionxform = str
+    if not parser.read(path):
+        raise FileNotFoundError('Could not read the config file {0}.'.format(path))
+
+    options = dict()
+    if parser.has_section('server'):
+        server = parser['server']
+        for key in server:
+            option = key.replace('-', '_')
+            if arguments is None:
+                read_option(options, server, key, option, path)
+            else:
+                read_argument(options, server, key, option, path, arguments)
+
+    include, exclude = list(), list()
+    if parser.has_section('channels'):
+        include = lines(parser['channels'].get('include', ''))
+        exclude = lines(parser['channels'].get('exclude', ''))
+
+    rates = list()
+    if parser.has_section('rates'):
+        rates = [(module, parser['rates'].getfloat(module)) for module in parser['rates']]
+
+    return options, ChannelSelection(include, exclude, rates)
+
+
+def read_option(options, server, key, option, path):
+    """Reads an option of the [server] section by its kind in SERVER_OPTIONS."""
+
+    kind = SERVER_OPTIONS.get(option)
+    if kind is None:
+        raise ValueError('Unknown option {0} in section [server] of {1}.'.format(key, path))
+    if kind == 'lines':
+        options['data_dirs'] = lines(server[key])
+    elif kind == 'string':
+        options[option] = server[key]
+    elif kind == 'ints':
+        options[option] = [int(value) for value in server[key].split(',')]
+    else:
+        options[option] = getattr(server, 'get' + kind)(key)
+
+
+def read_argument(options, server, key, option, path, arguments):
+    """Reads an option of the [server] section like the command line parser reads the option of the same name. The
+    defaults of the command line options are neither converted nor checked by argparse, so both is done here."""
+
+    action = arguments._option_string_actions.get('--' + option.replace('_', '-'))
+    if action is None or action.dest in COMMAND_LINE_ONLY:
+        raise ValueError('Unknown option {0} in section [server] of {1}.'.format(key, path))
+
+    if isinstance(action, argparse._AppendAction):
+        options[action.dest] = lines(server[key])
+        return
+    if isinstance(action, (argparse._StoreTrueAction, argparse._StoreFalseAction)):
+        options[action.dest] = server.getboolean(key)
+        return
+
+    try:
+        value = action.type(server[key]) if action.type is not None else server[key]
+    except (TypeError, ValueError):
+        raise ValueError('Invalid value {0} of option {1} in section [server] of {2}.'.format(server[key], key, path))
+    if action.choices is not None and value not in action.choices:
+        raise ValueError('Invalid value {0} of option {1} in section [server] of {2}. Use one of {3}.'.format(
+            server[key], key, path, ', '.join(str(choice) for choice in action.choices)))
+    options[action.dest] = value
+
+
+def lines(value):
+    """Splits a multi line value of the config file into its non empty lines."""
+
+    return [line.strip() for line in value.splitlines() if line.strip()]
@@ -0,0 +1,291 @@
+import time
+from bisect import bisect_left
+from threading import Thread, Event, Lock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from opcua import ua
+from playback import ns_to_datetime
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def string_node(idx, node_id, name):
+    """Returns the NodeId and browse name of a node with a string NodeId, as expected by the add_* methods of a node.
+
+    :param idx: (mandatory, int) namespace index
+    :param node_id: (mandatory, string) identifier of the NodeId, e.g. '3:12.value'
+    :param name: (mandatory, string) browse name of the node
+    :return: (tuple) ua.NodeId, ua.QualifiedName
+    """
+
+    return ua.NodeId(node_id, idx), ua.QualifiedName(name, idx)
+
+
+class Histogram(object):
+    """A cumulative histogram with fixed buckets as used by Prometheus. Values are given in ns."""
+
+    def __init__(self, buckets=BUCKETS):
+        """Default constructor.
+
+        :param buckets: (optional, tuple) upper bounds of the buckets in seconds
+        """
+
+        self.buckets = tuple(buckets)
+        self._bounds_ns = [int(bound * 1e9) for bound in self.buckets]
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum_ns = 0
+        self.max_ns = 0
+        self.count = 0
+
+    def observe(self, value_ns):
+        """Adds a value to the histogram."""
+
+        self.counts[bisect_left(self._bounds_ns, value_ns)] += 1
+        self.sum_ns += value_ns
+        self.count += 1
+        if value_ns > self.max_ns:
+            self.max_ns = value_ns
+
+    def cumulative(self):
+        """Returns a list of (upper bound in seconds, cumulative count), the last bound is +Inf."""
+
+        result = list()
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    @property
+    def mean_ns(self):
+        return self.sum_ns / self.count if self.count else 0.0
+
+
+class TickMetrics(object):
+    """The TickMetrics collect the timing of the ticks of a single VariableUpdater: tick duration, jitter of the
+    wakeup, overruns, writes and the current playback position."""
+
+    def __init__(self, name, period):
+        """Default constructor.
+
+        :param name: (mandatory, string) name of the rate group
+        :param period: (mandatory, float) scheduled period of the ticks in seconds
+        """
+
+        self.name = name
+        self.period = period
+
+        self.duration = Histogram()
+        self.jitter = Histogram()
+        self.overruns = 0
+        self.missed_samples = 0
+        self.writes = 0
+        self.position_ns = None
+
+        # reference for the computation of the writes per second
+        self._rate_ref = (time.monotonic_ns(), 0)
+        self._writes_per_second = 0.0
+
+        self._lock = Lock()
+
+    def record(self, duration_ns, jitter_ns, writes):
+        """Records a single tick.
+
+        :param duration_ns: (mandatory, int) time the tick took
+        :param jitter_ns: (mandatory, int) delay of the actual wakeup compared to the scheduled one
+        :param writes: (mandatory, int) number of values written to the opc server
+        :return: None
+        """
+
+        with self._lock:
+            self.duration.observe(duration_ns)
+            self.jitter.observe(max(jitter_ns, 0))
+            self.writes += writes
+
+    def writes_per_second(self):
+        """Returns the average number of writes per second, measured over at least the last second."""
+
+        now_ns = time.monotonic_ns()
+        with self._lock:
+            ref_ns, ref_writes = self._rate_ref
+            if now_ns - ref_ns >= 1e9:
+                self._writes_per_second = (self.writes - ref_writes) * 1e9 / (now_ns - ref_ns)
+                self._rate_ref = (now_ns, self.writes)
+            return self._writes_per_second
+
+    def snapshot(self):
+        """Returns a consistent copy of the metrics as dict."""
+
+        writes_per_second = self.writes_per_second()
+        with self._lock:
+            return {
+                'name': self.name,
+                'period': self.period,
+                'ticks': self.duration.count,
+                'duration_mean_ms': self.duration.mean_ns / 1e6,
+                'duration_max_ms': self.duration.max_ns / 1e6,
+                'duration_buckets': self.duration.cumulative(),
+                'duration_sum_s': self.duration.sum_ns / 1e9,
+                'jitter_mean_ms': self.jitter.mean_ns / 1e6,
+                'jitter_max_ms': self.jitter.max_ns / 1e6,
+                'jitter_buckets': self.jitter.cumulative(),
+                'jitter_sum_s': self.jitter.sum_ns / 1e9,
+                'overruns': self.overruns,
+                'missed_samples': self.missed_samples,
+                'writes': self.writes,
+                'writes_per_second': writes_per_second,
+                'position_ns': self.position_ns,
+            }
+
+
+class DiagnosticsPublisher(Thread):
+    """The DiagnosticsPublisher periodically copies the TickMetrics of all updaters into a Diagnostics folder of the
+    opc server."""
+
+    # variables of each updater: (browse name, key of the snapshot, initial value)
+    VARIABLES = (
+        ('Ticks', 'ticks', 0),
+        ('Overruns', 'overruns', 0),
+        ('MissedSamples', 'missed_samples', 0),
+        ('TickDurationMeanMs', 'duration_mean_ms', 0.0),
+        ('TickDurationMaxMs', 'duration_max_ms', 0.0),
+        ('JitterMeanMs', 'jitter_mean_ms', 0.0),
+        ('JitterMaxMs', 'jitter_max_ms', 0.0),
+        ('WritesPerSecond', 'writes_per_second', 0.0),
+    )
+
+    def __init__(self, parent, idx, metrics, interval=1.0, hooks=None):
+        """Default constructor.
+
+        :param parent: (mandatory, opcua.Node) node the Diagnostics folder is added to
+        :param idx: (mandatory, int) namespace index
+        :param metrics: (mandatory, list) the TickMetrics of all updaters
+        :param interval: (optional, float) seconds between two updates of the nodes
+        :param hooks: (optional, list of callables) called after each update, e.g. to update further nodes
+        """
+
+        super().__init__(name='DiagnosticsPublisher', daemon=True)
+
+        self.metrics = metrics
+        self.interval = interval
+        self.hooks = hooks or list()
+        self._close_event = Event()
+
+        # create the nodes
+        self._nodes = list()
+        folder = parent.add_folder(*string_node(idx, 'Diagnostics', 'Diagnostics'))
+        for metric in metrics:
+            # deterministic string NodeIds, e.g. ns=2;s=Diagnostics/Updater_0.01.Overruns
+            group_id = 'Diagnostics/' + metric.name
+            group = folder.add_object(*string_node(idx, group_id, metric.name))
+            group.add_variable(*string_node(idx, group_id + '.Period', 'Period'), metric.period).set_writable(False)
+            nodes = {key: group.add_variable(*string_node(idx, '{0}.{1}'.format(group_id, name), name), val)
+                     for name, key, val in self.VARIABLES}
+            position_node = string_node(idx, group_id + '.PlaybackPosition', 'PlaybackPosition')
+            nodes['position'] = group.add_variable(*position_node, ns_to_datetime(time.time_ns()))
+            self._nodes.append((metric, nodes))
+
+    def run(self):
+        """Update the nodes until stop is called.
+
+        :return: None
+        """
+
+        while not self._close_event.wait(self.interval):
+            for metric, nodes in self._nodes:
+                snapshot = metric.snapshot()
+                for _, key, _ in self.VARIABLES:
+                    nodes[key].set_value(snapshot[key])
+                if snapshot['position_ns'] is not None:
+                    nodes['position'].set_value(ns_to_datetime(snapshot['position_ns']), ua.VariantType.DateTime)
+            for hook in self.hooks:
+                hook()
+
+    def stop(self):
+        """Call to stop the publisher"""
+
+        self._close_event.set()
+
+
+def prometheus_text(metrics):
+    """Renders the TickMetrics of all updaters in the Prometheus text exposition format.
+
+    :param metrics: (mandatory, list) the TickMetrics of all updaters
+    :return: (string)
+    """
+
+    lines = list()
+    snapshots = [metric.snapshot() for metric in metrics]
+
+    for name, doc in (('tick_duration_seconds', 'Time a tick of the updater took.'),
+                      ('tick_jitter_seconds', 'Delay of the actual wakeup compared to the scheduled one.')):
+        key = name.split('_')[1]
+        lines.append('# HELP iba2opcua_{0} {1}'.format(name, doc))
+        lines.append('# TYPE iba2opcua_{0} histogram'.format(name))
+        for snapshot in snapshots:
+            label = 'group="{0}"'.format(snapshot['name'])
+            for bound, count in snapshot[key + '_buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('iba2opcua_{0}_bucket{{{1},le="{2}"}} {3}'.format(name, label, le, count))
+            lines.append('iba2opcua_{0}_sum{{{1}}} {2}'.format(name, label, snapshot[key + '_sum_s']))
+            lines.append('iba2opcua_{0}_count{{{1}}} {2}'.format(name, label, snapshot['ticks']))
+
+    for name, key, kind, doc in (
+            ('overruns_total', 'overruns', 'counter', 'Ticks which overran their period.'),
+            ('missed_samples_total', 'missed_samples', 'counter', 'Samples which have not been published.'),
+            ('writes_total', 'writes', 'counter', 'Values written to the opc server.'),
+            ('writes_per_second', 'writes_per_second', 'gauge', 'Values written to the opc server per second.'),
+            ('period_seconds', 'period', 'gauge', 'Scheduled period of the ticks.')):
+        lines.append('# HELP iba2opcua_{0} {1}'.format(name, doc))
+        lines.append('# TYPE iba2opcua_{0} {1}'.format(name, kind))
+        for snapshot in snapshots:
+            lines.append('iba2opcua_{0}{{group="{1}"}} {2}'.format(name, snapshot['name'], snapshot[key]))
+
+    lines.append('# HELP iba2opcua_playback_position_seconds Recorded time of the published sample (unix time).')
+    lines.append('# TYPE iba2opcua_playback_position_seconds gauge')
+    for snapshot in snapshots:
+        if snapshot['position_ns'] is not None:
+            lines.append('iba2opcua_playback_position_seconds{{group="{0}"}} {1}'.format(
+                snapshot['name'], snapshot['position_ns'] / 1e9))
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHttpServer(Thread):
+    """The MetricsHttpServer serves the TickMetrics of all updaters for Prometheus under /metrics."""
+
+    def __init__(self, metrics, port=9840, host='127.0.0.1'):
+        """Default constructor.
+
+        :param metrics: (mandatory, list) the TickMetrics of all updaters
+        :param port: (optional, int) port to listen on
+        :param host: (optional, string) address to listen on. Default: localhost only
+        """
+
+        super().__init__(name='MetricsHttpServer', daemon=True)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = prometheus_text(metrics).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+
+    def run(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        """Call to stop the http server"""
+
+        self._httpd.shutdown()
+        self._httpd.server_close()
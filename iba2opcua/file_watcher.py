@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+from collections import OrderedDict
+from threading import Thread, Event
+from pyIbaTools.pyIbaTools import getFiles, checkFile, IbaFileIsCurrentlyWrittenError, IbaFileNotCompleteError, \
+    IbaFileDamagedError
+
+# inotify constants, see <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class IbaFileWatcher(Thread):
+    """The IbaFileWatcher watches a directory for new iba files. As soon as the ibaPDA finished writing a file, the file
+    is handed to the callback. The callback is executed within the watcher thread, so it may decode the file without
+    blocking anybody else."""
+
+    def __init__(self, directory, callback, known_files=None, pending_files=None, poll_interval=1.0,
+                 retry_interval=5.0, max_retries=60, use_inotify=True):
+        """Default constructor.
+
+        :param directory: (mandatory, string) the directory to watch
+        :param callback: (mandatory, callable) called with the path of each completed iba file
+        :param known_files: (optional, list) files which are already known and shall be ignored
+        :param pending_files: (optional, list) files which shall be handed to the callback first, in the given order
+        :param poll_interval: (optional, float) seconds between two scans of the directory if inotify is not available
+        :param retry_interval: (optional, float) seconds to wait before checking a file again which is still written
+        :param max_retries: (optional, int) number of checks after which a damaged file is given up
+        :param use_inotify: (optional, bool) use inotify on Linux. Falls back to polling if not available.
+        """
+
+        super().__init__(name='IbaFileWatcher', daemon=True)
+
+        self.directory = directory
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.use_inotify = use_inotify
+
+        # every file seen so far (pending, handed over or given up)
+        self._known = set(os.path.normpath(f) for f in (known_files or list()))
+
+        # files waiting to be completed: path -> [time of next check, number of checks]
+        self._pending = OrderedDict()
+        for iba_file in pending_files or list():
+            self._add(iba_file, retry_at=0)
+
+        self._close_event = Event()
+
+    def run(self):
+        """Watch the directory until stop is called.
+
+        :return: None
+        """
+
+        fd = self._init_inotify() if self.use_inotify else None
+        if fd is None:
+            print('{0}: polling {1} every {2}s.'.format(self.name, self.directory, self.poll_interval))
+            self._scan()
+
+        try:
+            while not self._close_event.is_set():
+                if fd is None:
+                    self._scan()
+                else:
+                    self._read_inotify(fd)
+
+                self._check_pending()
+
+                if fd is None:
+                    self._close_event.wait(self.poll_interval)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def stop(self):
+        """Call to stop the watcher"""
+
+        self._close_event.set()
+
+    def _add(self, iba_file, retry_at=None):
+        """Registers a new file as pending."""
+
+        iba_file = os.path.normpath(iba_file)
+        if iba_file in self._known:
+            return
+        self._known.add(iba_file)
+        self._pending[iba_file] = [time.monotonic() if retry_at is None else retry_at, 0]
+
+    def _scan(self):
+        """Polling fallback: compare the content of the directory with the known files."""
+
+        for iba_file in sorted(getFiles(self.directory, file_type='dat', scan_sub_folders=False)):
+            self._add(iba_file)
+
+    def _check_pending(self):
+        """Hands every completely written pending file to the callback."""
+
+        now = time.monotonic()
+        for iba_file, (retry_at, retries) in list(self._pending.items()):
+            if retry_at > now:
+                continue
+
+            try:
+                checkFile(iba_file)
+            except (IbaFileIsCurrentlyWrittenError, IbaFileNotCompleteError):
+                # the ibaPDA is still writing. check again later
+                self._pending[iba_file] = [now + self.retry_interval, retries]
+                continue
+            except FileNotFoundError:
+                del self._pending[iba_file]
+                continue
+            except (IbaFileDamagedError, RuntimeError, OSError) as e:
+                # might be a file which has just been created or is locked by the ibaPDA. give up after a while
+                if isinstance(e, OSError) and not retries:
+                    print('{0}: could not check {1}, retrying: {2}'.format(self.name, iba_file, e))
+                if retries + 1 >= self.max_retries:
+                    print('{0}: giving up on {1}: {2}'.format(self.name, iba_file, e))
+                    del self._pending[iba_file]
+                else:
+                    self._pending[iba_file] = [now + self.retry_interval, retries + 1]
+                continue
+
+            del self._pending[iba_file]
+            try:
+                self.callback(iba_file)
+            except Exception as e:
+                print('{0}: could not ingest {1}: {2}'.format(self.name, iba_file, e))
+
+    def _init_inotify(self):
+        """Returns a non blocking inotify file descriptor watching the directory or None if inotify is not available."""
+
+        if not sys.platform.startswith('linux'):
+            return None
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return None
+            if libc.inotify_add_watch(fd, os.fsencode(self.directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+                os.close(fd)
+                return None
+        except (OSError, AttributeError):
+            return None
+
+        # files created before the watch was set up are picked up once
+        self._scan()
+
+        return fd
+
+    def _read_inotify(self, fd):
+        """Waits up to one poll interval for inotify events and registers the new files."""
+
+        # wake up early if files are pending so their retry is not delayed
+        timeout = min(self.poll_interval, self.retry_interval) if self._pending else self.poll_interval
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if not readable:
+            return
+
+        try:
+            buffer = os.read(fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(buffer):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = buffer[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+
+            if name.lower().endswith('.dat'):
+                self._add(os.path.join(self.directory, name))
@@ -0,0 +1,392 @@
+import time
+import multiprocessing
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from threading import Lock
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def datetime_to_ns(dt):
+    """Converts a naive datetime to ns since epoch without the rounding errors of a float timestamp."""
+
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 9 + delta.microseconds * 1000
+
+
+def ns_to_datetime(time_ns):
+    """Converts ns since epoch to a naive datetime (microsecond resolution)."""
+
+    return EPOCH + timedelta(microseconds=time_ns // 1000)
+
+
+class PlaybackQueue(object):
+    """The PlaybackQueue holds the loaded iba files ordered by their start time. Files may be appended while the
+    playback is running."""
+
+    def __init__(self):
+        """Default constructor."""
+
+        self._entries = list()
+        self._starts = list()
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __getitem__(self, idx):
+        with self._lock:
+            return self._entries[idx]
+
+    def append(self, entry):
+        """Adds a loaded iba file to the playback. The entry is sorted in by its start time.
+
+        :param entry: (mandatory, dict) loaded iba file, see IbaToUaServer.load_iba_file
+        :return: None
+        """
+
+        with self._lock:
+            pos = bisect_right(self._starts, entry['start_ns'])
+            self._starts.insert(pos, entry['start_ns'])
+            self._entries.insert(pos, entry)
+
+    def evict(self, before_ns):
+        """Removes the files which end at or before the given recorded time, e.g. the files which have been played
+        back while new files are watched. Updaters still playing back an evicted file keep their reference until they
+        move on.
+
+        :param before_ns: (mandatory, int) recorded time in ns since epoch
+        :return: (list) the evicted entries
+        """
+
+        with self._lock:
+            evicted = [entry for entry in self._entries if entry['end_ns'] <= before_ns]
+            if evicted:
+                self._entries = [entry for entry in self._entries if entry['end_ns'] > before_ns]
+                self._starts = [entry['start_ns'] for entry in self._entries]
+            return evicted
+
+    @property
+    def start_ns(self):
+        """Recorded time of the first sample in ns since epoch."""
+
+        with self._lock:
+            return self._starts[0]
+
+    @property
+    def end_ns(self):
+        """Recorded time at which the last file ends in ns since epoch."""
+
+        with self._lock:
+            return max(entry['end_ns'] for entry in self._entries)
+
+    def locate(self, time_ns):
+        """Returns the loaded iba file which contains the given recorded time.
+
+        :param time_ns: (mandatory, int) recorded time in ns since epoch
+        :return: (dict) the entry or None if there is no data at that time
+        """
+
+        with self._lock:
+            pos = bisect_right(self._starts, time_ns) - 1
+            if pos < 0 or time_ns >= self._entries[pos]['end_ns']:
+                return None
+            return self._entries[pos]
+
+
+class PlaybackTimeline(object):
+    """The PlaybackTimeline merges the playback queues of several recorders into a single timeline on absolute
+    recorded time."""
+
+    def __init__(self, queues):
+        """Default constructor.
+
+        :param queues: (mandatory, list of PlaybackQueue) the loaded iba files of each recorder
+        """
+
+        self.queues = queues
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues)
+
+    @property
+    def start_ns(self):
+        """Recorded time of the first sample of all recorders in ns since epoch."""
+
+        return min(queue.start_ns for queue in self.queues if len(queue))
+
+    @property
+    def end_ns(self):
+        """Recorded time at which the last file of all recorders ends in ns since epoch."""
+
+        return max(queue.end_ns for queue in self.queues if len(queue))
+
+
+class PlaybackClock(object):
+    """The PlaybackClock maps the monotonic clock onto the recorded time of the playback timeline. All updaters read
+    the same clock, so all sample rates and recorders stay aligned no matter how long a single tick takes. At the end
+    of the timeline the playback starts over. The clock can be paused, moved to any recorded time and run faster or
+    slower than real time."""
+
+    def __init__(self, timeline, speed=1.0):
+        """Default constructor.
+
+        :param timeline: (mandatory, PlaybackTimeline or PlaybackQueue) the loaded iba files
+        :param speed: (optional, float) factor by which the playback runs faster than real time
+        """
+
+        if speed <= 0:
+            raise ValueError('The playback speed must be positive, got {0}.'.format(speed))
+
+        self.timeline = timeline
+        self.speed = float(speed)
+        self.paused = False
+
+        # recorded time at the monotonic reference time
+        self._origin_ns = 0
+        self._ref_ns = 0
+        self._lock = Lock()
+
+    def start(self):
+        """Starts the playback at the beginning of the timeline.
+
+        :return: None
+        """
+
+        with self._lock:
+            self._origin_ns = self.timeline.start_ns
+            self._ref_ns = time.monotonic_ns()
+
+    def now_ns(self):
+        """Returns the current recorded time in ns since epoch.
+
+        :return: (int)
+        """
+
+        mono_ns = time.monotonic_ns()
+        with self._lock:
+            return self._now_ns(mono_ns)
+
+    def _now_ns(self, mono_ns):
+        """Returns the recorded time at the given monotonic time. The lock must be held."""
+
+        if self.paused:
+            return self._origin_ns
+
+        time_ns = self._origin_ns + int((mono_ns - self._ref_ns) * self.speed)
+
+        end_ns = self.timeline.end_ns
+        if time_ns >= end_ns:
+            # start over. the timeline might have grown since the last loop
+            start_ns = self.timeline.start_ns
+            time_ns = start_ns + (time_ns - end_ns) % max(end_ns - start_ns, 1)
+            self._origin_ns = time_ns
+            self._ref_ns = mono_ns
+
+        return time_ns
+
+    def play(self):
+        """Continues a paused playback.
+
+        :return: None
+        """
+
+        with self._lock:
+            self._ref_ns = time.monotonic_ns()
+            self.paused = False
+
+    def pause(self):
+        """Holds the playback at the current recorded time.
+
+        :return: None
+        """
+
+        with self._lock:
+            self._origin_ns = self._now_ns(time.monotonic_ns())
+            self.paused = True
+
+    def seek(self, time_ns):
+        """Moves the playback to the given recorded time. Times outside of the timeline are clipped to it.
+
+        :param time_ns: (mandatory, int) recorded time in ns since epoch
+        :return: None
+        """
+
+        with self._lock:
+            self._origin_ns = min(max(int(time_ns), self.timeline.start_ns), self.timeline.end_ns - 1)
+            self._ref_ns = time.monotonic_ns()
+
+    def set_speed(self, speed):
+        """Changes the factor by which the playback runs faster than real time.
+
+        :param speed: (mandatory, float) positive factor, e.g. 10 for a ten times faster playback
+        :return: None
+        """
+
+        if speed <= 0:
+            raise ValueError('The playback speed must be positive, got {0}.'.format(speed))
+
+        with self._lock:
+            mono_ns = time.monotonic_ns()
+            self._origin_ns = self._now_ns(mono_ns)
+            self._ref_ns = mono_ns
+            self.speed = float(speed)
+
+
+class ShiftedClock(object):
+    """The ShiftedClock follows a PlaybackClock at a constant offset of recorded time. It is used to play back the same
+    data phase shifted, e.g. by the replicas of a load test. At the end of the timeline it wraps around to the start."""
+
+    def __init__(self, clock, offset_ns):
+        """Default constructor.
+
+        :param clock: (mandatory, PlaybackClock) the clock to follow
+        :param offset_ns: (mandatory, int) offset of the recorded time in ns
+        """
+
+        self.clock = clock
+        self.offset_ns = int(offset_ns)
+
+    @property
+    def speed(self):
+        return self.clock.speed
+
+    @property
+    def paused(self):
+        return self.clock.paused
+
+    def now_ns(self):
+        """Returns the current recorded time in ns since epoch.
+
+        :return: (int)
+        """
+
+        time_ns = self.clock.now_ns() + self.offset_ns
+
+        start_ns = self.clock.timeline.start_ns
+        end_ns = self.clock.timeline.end_ns
+        if time_ns >= end_ns:
+            time_ns = start_ns + (time_ns - start_ns) % max(end_ns - start_ns, 1)
+
+        return time_ns
+
+
+class SharedTimeline(object):
+    """The SharedTimeline holds the extent of a timeline in shared memory, so several processes playing back parts of
+    the same iba files agree on where the playback starts over. The process loading the files extends it."""
+
+    def __init__(self):
+        """Default constructor."""
+
+        # start_ns, end_ns and number of files
+        self._extent = multiprocessing.RawArray('q', 3)
+        self._lock = multiprocessing.Lock()
+
+    def __len__(self):
+        return self._extent[2]
+
+    def extend(self, start_ns, end_ns):
+        """Adds a loaded iba file to the timeline.
+
+        :param start_ns: (mandatory, int) recorded time of the first sample of the file in ns since epoch
+        :param end_ns: (mandatory, int) recorded time at which the file ends in ns since epoch
+        :return: None
+        """
+
+        with self._lock:
+            if not self._extent[2]:
+                self._extent[0], self._extent[1] = start_ns, end_ns
+            else:
+                self._extent[0] = min(self._extent[0], start_ns)
+                self._extent[1] = max(self._extent[1], end_ns)
+            self._extent[2] += 1
+
+    def evict(self, start_ns, files):
+        """Removes evicted files from the timeline.
+
+        :param start_ns: (mandatory, int) recorded time of the first sample of the remaining files in ns since epoch
+        :param files: (mandatory, int) number of evicted files
+        :return: None
+        """
+
+        with self._lock:
+            self._extent[0] = max(self._extent[0], start_ns)
+            self._extent[2] -= files
+
+    @property
+    def start_ns(self):
+        """Recorded time of the first sample in ns since epoch."""
+
+        with self._lock:
+            return self._extent[0]
+
+    @property
+    def end_ns(self):
+        """Recorded time at which the last file ends in ns since epoch."""
+
+        with self._lock:
+            return self._extent[1]
+
+
+class SharedPlaybackClock(PlaybackClock):
+    """The SharedPlaybackClock is a PlaybackClock whose state lives in shared memory. All processes it is passed to at
+    their start follow the same playback position, and play, pause, seek and speed changes of any process apply to all
+    of them. The monotonic clock is system wide, so the processes map it onto the same recorded time."""
+
+    def __init__(self, timeline, speed=1.0):
+        """Default constructor.
+
+        :param timeline: (mandatory, SharedTimeline) extent of the loaded iba files
+        :param speed: (optional, float) factor by which the playback runs faster than real time
+        """
+
+        # origin_ns, ref_ns, paused and started
+        self._state = multiprocessing.RawArray('q', 4)
+        self._speed = multiprocessing.RawValue('d', 1.0)
+
+        super().__init__(timeline, speed=speed)
+        self._lock = multiprocessing.RLock()
+
+    def start(self):
+        """Starts the playback at the beginning of the timeline, unless another process started it already.
+
+        :return: None
+        """
+
+        with self._lock:
+            if not self._state[3]:
+                super().start()
+                self._state[3] = 1
+
+    @property
+    def speed(self):
+        return self._speed.value
+
+    @speed.setter
+    def speed(self, speed):
+        self._speed.value = speed
+
+    @property
+    def paused(self):
+        return bool(self._state[2])
+
+    @paused.setter
+    def paused(self, paused):
+        self._state[2] = int(paused)
+
+    @property
+    def _origin_ns(self):
+        return self._state[0]
+
+    @_origin_ns.setter
+    def _origin_ns(self, time_ns):
+        self._state[0] = time_ns
+
+    @property
+    def _ref_ns(self):
+        return self._state[1]
+
+    @_ref_ns.setter
+    def _ref_ns(self, mono_ns):
+        self._state[1] = mono_ns
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import contextlib
+from collections import Counter
+from threading import Thread, Event, Lock, enumerate as enumerate_threads
+
+# environment variable enabling the profiling, holds the output directory
+PROFILE_ENV = 'IBA2OPCUA_PROFILE'
+
+
+class StackSampler(Thread):
+    """The StackSampler periodically samples the stacks of all threads and counts them in the collapsed stack format
+    of flamegraph.pl (frames separated by semicolons, root first, followed by the number of samples)."""
+
+    def __init__(self, interval=0.005):
+        """Default constructor.
+
+        :param interval: (optional, float) seconds between two samples
+        """
+
+        super().__init__(name='StackSampler', daemon=True)
+
+        self.interval = interval
+        self.stacks = Counter()
+
+        # samples since start_window was called
+        self.window_stacks = None
+        self._close_event = Event()
+
+    def run(self):
+        own_id = self.ident
+        while not self._close_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in enumerate_threads()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = list()
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{0}:{1}'.format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stack = ';'.join(reversed(stack))
+                self.stacks[stack] += 1
+                window_stacks = self.window_stacks
+                if window_stacks is not None:
+                    window_stacks[stack] += 1
+
+    def start_window(self):
+        """Counts the following samples separately as well, see window_stacks."""
+
+        self.window_stacks = Counter()
+
+    def stop(self):
+        """Call to stop the sampling"""
+
+        self._close_event.set()
+
+    def dump(self, path, stacks=None):
+        """Writes the collapsed stacks to the given file.
+
+        :param path: (mandatory, string) output file
+        :param stacks: (optional, Counter) the samples to write. Default: all samples
+        :return: None
+        """
+
+        stacks = self.stacks if stacks is None else stacks
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write('{0} {1}\n'.format(stack, count))
+
+
+class Profiler(object):
+    """The Profiler records the duration of each startup phase of the server, profiles the startup in the main thread
+    with cProfile and samples the stacks of all threads over the startup and a limited window of the playback. Only
+    one cProfile can be active at a time (Python 3.12+ refuses a second one), so the ticks of the updaters are
+    profiled by the stack sampler, in which each updater thread appears under its own name. The results are written
+    to the output directory:
+
+    * phases.json: seconds per startup phase
+    * startup.pstats: cProfile of the startup in the main thread
+    * updaters.collapsed: stack samples of all threads during the window, e.g. for flamegraph.pl
+    * stacks.collapsed: stack samples of all threads over the startup and the window
+
+    The samples are written at the end of the window or at the shutdown of the server, whatever comes first. If
+    profiling is disabled no Profiler exists at all, so there is no overhead.
+    """
+
+    def __init__(self, directory, window=30.0, interval=0.005):
+        """Default constructor.
+
+        :param directory: (mandatory, string) output directory. Created if needed.
+        :param window: (optional, float) seconds the updaters are profiled after the startup
+        :param interval: (optional, float) seconds between two stack samples
+        """
+
+        self.directory = directory
+        self.window = window
+        os.makedirs(directory, exist_ok=True)
+
+        self.phases = dict()
+        self._startup = cProfile.Profile()
+        self._sampler = StackSampler(interval)
+        self._window_end = None
+
+        # ends the window early, e.g. at the shutdown of the server
+        self._stop_event = Event()
+        self._dump_lock = Lock()
+        self._dumped = False
+
+    def start(self):
+        """Starts profiling the startup. Call from the main thread.
+
+        :return: None
+        """
+
+        self._sampler.start()
+        self._startup.enable()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager measuring the duration of a startup phase."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def startup_done(self, updaters):
+        """Stops profiling the startup, dumps its results and starts the window in which the ticks of the updaters are
+        sampled. Call from the main thread.
+
+        :param updaters: (mandatory, list of VariableUpdater) the updaters to profile
+        :return: None
+        """
+
+        self._startup.disable()
+        self._startup.dump_stats(os.path.join(self.directory, 'startup.pstats'))
+        with open(os.path.join(self.directory, 'phases.json'), 'w') as f:
+            json.dump(self.phases, f, indent=2)
+
+        self._window_end = time.monotonic() + self.window
+        self._sampler.start_window()
+        Thread(target=self._finish, name='ProfilerWindow', daemon=True).start()
+
+        # the updaters of the threaded engine keep the process alive until it is interrupted
+        atexit.register(self.stop)
+        print('profiling {0} updaters for {1} s to {2} ...'.format(len(updaters), self.window, self.directory))
+
+    def stop(self):
+        """Ends the window early and dumps the samples taken so far. Called at the shutdown of the server.
+
+        :return: None
+        """
+
+        self._stop_event.set()
+        self._dump()
+
+    def _finish(self):
+        """Dumps the samples at the end of the window."""
+
+        self._stop_event.wait(max(self._window_end - time.monotonic(), 0))
+        self._dump()
+
+    def _dump(self):
+        """Stops the stack sampling and dumps the samples, once."""
+
+        with self._dump_lock:
+            if self._dumped or self._window_end is None:
+                return
+            self._dumped = True
+
+            self._sampler.stop()
+            self._sampler.join()
+            self._sampler.dump(os.path.join(self.directory, 'updaters.collapsed'), self._sampler.window_stacks)
+            self._sampler.dump(os.path.join(self.directory, 'stacks.collapsed'))
+            print('profiles written to {0}.'.format(self.directory))
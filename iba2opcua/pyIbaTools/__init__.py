@@ -2,8 +2,17 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 
-from . import ibaFilesPro
-from . import ibaFilesLite
+# the ibaFiles libraries are only available on windows. see backends for the alternatives
+try:
+    from . import ibaFilesPro
+except ImportError:
+    ibaFilesPro = None
+try:
+    from . import ibaFilesLite
+except ImportError:
+    ibaFilesLite = None
+from . import backends
+from . import cache
 from . import pyIbaTools
 
-__all__ = ["pyIbaTools", "ibaFilesLite", "ibaFilesPro"]
+__all__ = ["pyIbaTools", "backends", "cache", "ibaFilesLite", "ibaFilesPro"]
@@ -0,0 +1,374 @@
+"""The backends module decouples pyIbaTools from the library which actually decodes the iba files.
+
+A backend provides the subset of the ibaFiles API used by pyIbaTools:
+
+* `FileReader()` returns a reader with `Open`, `Close`, `IsOpen`, `QueryInfos`, `QueryInfoByName`,
+  `EnumerateChannels`, `QueryChannel`, `QueryChannelByName` and `GetStartTime`
+* the channel readers returned by `QueryChannel` provide `IsText`, `IsDigital`, `IsAnalog`, `ChannelId`,
+  `QueryInfos`, `QueryData` and `QueryTextData`
+* `ChannelId` and `ChannelReader` are the types of the channel ids and channel readers
+* `isCurrentPDA(iba_file)` tells whether the ibaPDA is still writing the file
+
+Available backends:
+
+* `lite`: ibaFilesLite.pyd (default, Windows only)
+* `pro`: ibaFilesPro.pyd (Windows only)
+* `synthetic`: deterministic data generated from a small text file, see `write_synthetic_file`. Runs everywhere.
+
+The backend is selected by `set_backend(name)` or the environment variable PYIBATOOLS_BACKEND.
+"""
+import os
+import sys
+import zlib
+import importlib
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+import numpy as np
+from pyIbaTools.cache import DecodedCache
+
+# names of the available backends
+BACKENDS = ('lite', 'pro', 'synthetic')
+
+# the backend used by pyIbaTools. created on first use
+__backend__ = None
+
+
+class IbaBackend(ABC):
+    """The IbaBackend is the interface of all backends. See the module docstring for the methods of the readers. A
+    backend which does not implement FileReader and isCurrentPDA can not be created. name, ChannelId and ChannelReader
+    are plain attributes, set by the class or by the constructor of the backend."""
+
+    name = None
+
+    # types of the channel ids and channel readers
+    ChannelId = None
+    ChannelReader = None
+
+    @abstractmethod
+    def FileReader(self):
+        """Returns a new, not yet opened file reader."""
+
+    @abstractmethod
+    def isCurrentPDA(self, iba_file):
+        """Returns True if the given iba file is currently written by the ibaPDA."""
+
+
+class ModuleBackend(IbaBackend):
+    """The ModuleBackend forwards to one of the ibaFiles libraries, e.g. ibaFilesLite."""
+
+    def __init__(self, name, module):
+        """Default constructor.
+
+        :param name: (mandatory, string) name of the backend
+        :param module: (mandatory, string) name of the ibaFiles module within the pyIbaTools package
+        """
+
+        self.name = name
+        self.module = importlib.import_module('pyIbaTools.' + module)
+        self.ChannelId = self.module.ChannelId
+        self.ChannelReader = self.module.ChannelReader
+
+    def FileReader(self):
+        return self.module.FileReader()
+
+    def isCurrentPDA(self, iba_file):
+        return self.module.isCurrentPDA(iba_file)
+
+
+class SyntheticChannelId(object):
+    """Id of a channel of a synthetic iba file."""
+
+    def __init__(self, module, nr):
+        self.Module = module
+        self.Nr = nr
+        self.Label = '{0}:{1}'.format(module, nr)
+
+    def __str__(self):
+        return 'id:' + self.Label
+
+    def __repr__(self):
+        return 'SyntheticChannelId({0})'.format(self.Label)
+
+
+class SyntheticChannelData(np.ndarray):
+    """The data of a numeric channel. Like the data of ibaFilesLite it carries the sample rate as Timebase."""
+
+    Timebase = None
+
+
+class SyntheticChannelReader(object):
+    """Reads a single channel of a synthetic iba file. The data is generated on every query."""
+
+    def __init__(self, channel_id, name, kind, rate, header):
+        """Default constructor.
+
+        :param channel_id: (mandatory, SyntheticChannelId) id of the channel
+        :param name: (mandatory, string) name of the channel
+        :param kind: (mandatory, string) analog, digital or text
+        :param rate: (mandatory, float) sample rate of the channel in seconds
+        :param header: (mandatory, dict) header of the synthetic file
+        """
+
+        self.ChannelId = channel_id
+        self.name = name
+        self.IsAnalog = kind == 'analog'
+        self.IsDigital = kind == 'digital'
+        self.IsText = kind == 'text'
+        self.rate = rate
+        self._header = header
+
+    def _samples(self):
+        """Number of samples of the channel within the file."""
+
+        clk = float(self._header['clk'])
+        frames = int(self._header['frames'])
+        return int(np.ceil(frames / max(int(round(self.rate / clk)), 1)))
+
+    def _seed(self):
+        """Seed of the channel. Depends only on the file seed and the channel id, so the data is reproducible."""
+
+        return zlib.crc32('{0}/{1}'.format(self._header['seed'], self.ChannelId.Label).encode())
+
+    def QueryInfos(self):
+        return {'name': self.name, 'unit': '' if self.IsDigital else 'mm', '$PDA_Tbase': repr(self.rate)}
+
+    def QueryData(self):
+        """Returns the data of a numeric channel. Analog channels are a sine with noise, digital ones a square wave.
+
+        :return: (SyntheticChannelData)
+        """
+
+        samples = self._samples()
+        rng = np.random.default_rng(self._seed())
+        # continue the signal across consecutive files
+        offset = int(round(float(self._header['offset']) / self.rate))
+        x = np.arange(offset, offset + samples, dtype=np.float64)
+
+        if self.IsDigital:
+            half_period = rng.integers(10, 1000)
+            data = ((x // half_period) % 2).astype(np.float32)
+        else:
+            period = rng.uniform(100, 10000)
+            data = (rng.uniform(-100, 100) + rng.uniform(1, 50) * np.sin(2 * np.pi * x / period) +
+                    rng.normal(0, 0.1, samples)).astype(np.float32)
+
+        data = data.view(SyntheticChannelData)
+        data.Timebase = self.rate
+        return data
+
+    def QueryTextData(self):
+        """Returns the data of a text channel as list of (time in seconds, text)."""
+
+        duration = int(self._header['frames']) * float(self._header['clk'])
+        return [(float(t), 'text {0}'.format(num)) for num, t in enumerate(np.arange(0, duration, self.rate))]
+
+
+class SyntheticFileReader(object):
+    """Reads a synthetic iba file. The file is a small text header describing the channels, see
+    write_synthetic_file."""
+
+    def __init__(self):
+        self._header = None
+        self._channels = list()
+
+    def Open(self, iba_file):
+        try:
+            with open(iba_file, 'r') as f:
+                header = dict(line.strip().split(':', 1) for line in f if ':' in line)
+        except (OSError, UnicodeDecodeError, ValueError):
+            raise RuntimeError('Could not open synthetic iba file {0}.'.format(iba_file))
+
+        self._header = header
+        self._channels = list()
+        rates = [float(rate) for rate in header['rates'].split(',')]
+        digital = int(int(header['channels']) * float(header['digital']))
+        for module in range(int(header['modules'])):
+            for nr in range(int(header['channels']) + int(header['text'])):
+                if nr >= int(header['channels']):
+                    kind = 'text'
+                elif nr < digital:
+                    kind = 'digital'
+                else:
+                    kind = 'analog'
+                self._channels.append(SyntheticChannelReader(
+                    SyntheticChannelId(module, nr), 'Signal_{0}_{1}'.format(module, nr), kind,
+                    rates[nr % len(rates)], header))
+
+    def Close(self):
+        self._header = None
+        self._channels = list()
+
+    def IsOpen(self):
+        return self._header is not None
+
+    def QueryInfos(self):
+        infos = {'clk': self._header['clk'], 'frames': self._header['frames'],
+                 'starttime': self._header['starttime']}
+        for module in range(int(self._header['modules'])):
+            infos['Module_name_{}'.format(module)] = 'Module {}'.format(module)
+        return infos
+
+    def QueryInfoByName(self, name):
+        return self.QueryInfos()[name]
+
+    def EnumerateChannels(self):
+        return [(chan.ChannelId, chan.name) for chan in self._channels]
+
+    def QueryChannel(self, channel_id):
+        label = channel_id.Label if isinstance(channel_id, SyntheticChannelId) else channel_id.replace('.', ':')
+        for chan in self._channels:
+            if chan.ChannelId.Label == label:
+                return chan
+        raise RuntimeError('Channel {0} not found.'.format(label))
+
+    def QueryChannelByName(self, name):
+        for chan in self._channels:
+            if chan.name == name:
+                return chan
+        raise RuntimeError('Channel {0} not found.'.format(name))
+
+    def GetStartTime(self):
+        return datetime.strptime(self._header['starttime'], '%d.%m.%Y %H:%M:%S.%f')
+
+
+class SyntheticBackend(IbaBackend):
+    """The SyntheticBackend generates deterministic data instead of decoding iba files. It needs no ibaFiles library,
+    so the read path and the server can be run and benchmarked on any platform."""
+
+    name = 'synthetic'
+    ChannelId = SyntheticChannelId
+    ChannelReader = SyntheticChannelReader
+
+    def FileReader(self):
+        return SyntheticFileReader()
+
+    def isCurrentPDA(self, iba_file):
+        return False
+
+
+class CachedBackend(IbaBackend):
+    """The CachedBackend keeps the channel data decoded through another backend in memory. It is kept for
+    compatibility and superseded by set_cache: it is a thin wrapper around a DecodedCache of its own, which readIbaFile
+    uses instead of the cache of the process while the CachedBackend is selected."""
+
+    def __init__(self, backend, max_bytes=None):
+        """Default constructor.
+
+        :param backend: (mandatory, IbaBackend) the backend decoding the files
+        :param max_bytes: (optional, int) byte budget of the cached data. Default: unlimited
+        """
+
+        self.backend = backend
+        self.name = 'cached ' + backend.name
+        self.ChannelId = backend.ChannelId
+        self.ChannelReader = backend.ChannelReader
+        self.cache = DecodedCache(sys.maxsize if max_bytes is None else max_bytes)
+
+    def FileReader(self):
+        return self.backend.FileReader()
+
+    def isCurrentPDA(self, iba_file):
+        return self.backend.isCurrentPDA(iba_file)
+
+
+def create_backend(name):
+    """Creates the backend of the given name.
+
+    :param name: (mandatory, string) one of BACKENDS
+    :return: (IbaBackend)
+    """
+
+    if name == 'lite':
+        return ModuleBackend('lite', 'ibaFilesLite')
+    elif name == 'pro':
+        return ModuleBackend('pro', 'ibaFilesPro')
+    elif name == 'synthetic':
+        return SyntheticBackend()
+    raise ValueError('Unknown backend {0}. Use one of {1}.'.format(name, ', '.join(BACKENDS)))
+
+
+def set_backend(backend, cached=False):
+    """Selects the backend used by all functions of pyIbaTools.
+
+    :param backend: (mandatory, string or IbaBackend) one of BACKENDS or a backend instance
+    :param cached: (optional, bool) keep the decoded data in memory, see CachedBackend. Prefer set_cache.
+    :return: (IbaBackend) the selected backend
+    """
+
+    global __backend__
+
+    if isinstance(backend, str):
+        backend = create_backend(backend)
+    if cached:
+        backend = CachedBackend(backend)
+    __backend__ = backend
+    return backend
+
+
+def get_backend():
+    """Returns the backend used by all functions of pyIbaTools. The default is taken from the environment variable
+    PYIBATOOLS_BACKEND, or lite if it is not set.
+
+    :return: (IbaBackend)
+    """
+
+    if __backend__ is None:
+        set_backend(os.environ.get('PYIBATOOLS_BACKEND', 'lite'))
+    return __backend__
+
+
+def write_synthetic_file(path, start_time, duration=60.0, modules=4, channels=50, rates=(0.001, 0.01, 0.1),
+                         digital=0.25, text=0, seed=0, offset=None):
+    """Writes a synthetic iba file, which is read by the synthetic backend. Only the header is written, the data is
+    generated deterministically when the channels are read.
+
+    :param path: (mandatory, string) path of the file, should end with .dat
+    :param start_time: (mandatory, datetime) time of the first sample
+    :param duration: (optional, float) length of the file in seconds
+    :param modules: (optional, int) number of modules
+    :param channels: (optional, int) number of numeric channels per module
+    :param rates: (optional, tuple of floats) sample rates in seconds, assigned to the channels in turn
+    :param digital: (optional, float) fraction of the numeric channels which are digital
+    :param text: (optional, int) number of text channels per module
+    :param seed: (optional, int) seed of the data
+    :param offset: (optional, float) seconds since the start of the recording, so consecutive files continue the
+    signals. Default: 0
+    :return: None
+    """
+
+    clk = min(rates)
+    header = [
+        ('starttime', start_time.strftime('%d.%m.%Y %H:%M:%S.%f')),
+        ('clk', repr(clk)),
+        ('frames', str(int(round(duration / clk)))),
+        ('modules', str(modules)),
+        ('channels', str(channels)),
+        ('rates', ','.join(repr(float(rate)) for rate in rates)),
+        ('digital', repr(float(digital))),
+        ('text', str(text)),
+        ('seed', str(seed)),
+        ('offset', repr(float(offset or 0))),
+    ]
+    with open(path, 'w') as f:
+        f.write('\n'.join('{0}:{1}'.format(key, val) for key, val in header) + '\n')
+
+
+def write_synthetic_files(directory, files=3, start_time=datetime(2019, 1, 1), duration=60.0, **kwargs):
+    """Writes a series of consecutive synthetic iba files, like a ibaPDA recorder would.
+
+    :param directory: (mandatory, string) the folder to write the files to. Created if needed.
+    :param files: (optional, int) number of files
+    :param start_time: (optional, datetime) time of the first sample of the first file
+    :param duration: (optional, float) length of each file in seconds
+    :param kwargs: further arguments of write_synthetic_file
+    :return: list of the paths of the written files
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    paths = list()
+    for num in range(files):
+        path = os.path.join(directory, 'synthetic_{0:04d}.dat'.format(num))
+        write_synthetic_file(path, start_time + timedelta(seconds=num * duration), duration=duration,
+                             offset=num * duration, **kwargs)
+        paths.append(path)
+    return paths
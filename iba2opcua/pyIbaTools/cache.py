@@ -0,0 +1,195 @@
+"""The cache module keeps the channel data decoded by readIbaFile in memory, so reading the same channels of an
+unchanged file again does not decode them again. The data is cached per (file identity, channel, tbase, aggregation),
+so a call with an overlapping set of channels only decodes the channels which are not cached yet. The cache is limited
+to a byte budget and evicts the least recently used data first. It is thread safe and shared by all threads of the
+process.
+
+The cache is disabled by default. Enable it with set_cache(max_bytes) or the environment variable PYIBATOOLS_CACHE,
+e.g. PYIBATOOLS_CACHE=2G.
+"""
+import os
+import sys
+import numpy as np
+from collections import OrderedDict
+from threading import Lock, Event
+
+# environment variable holding the byte budget of the cache
+CACHE_ENV = 'PYIBATOOLS_CACHE'
+
+# suffixes of the byte budget
+UNITS = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+# the cache of the process. False until it has been set or read from the environment
+__cache__ = False
+
+
+class DecodedCache(object):
+    """The DecodedCache is a thread safe LRU store of decoded channel data limited to a byte budget. If several threads
+    miss the same key at once, only one of them decodes the data and the others wait for it."""
+
+    def __init__(self, max_bytes):
+        """Default constructor.
+
+        :param max_bytes: (mandatory, int) byte budget of the cached data
+        """
+
+        self.max_bytes = int(max_bytes)
+
+        self._data = OrderedDict()
+        self._sizes = dict()
+        self._pending = dict()
+        self._lock = Lock()
+        self.nbytes = 0
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, decode):
+        """Returns the cached data of the key or decodes and stores it.
+
+        :param key: (mandatory, tuple) file identity, channel, tbase and aggregation
+        :param decode: (mandatory, callable) returns the data if it is not cached
+        :return: the data
+        """
+
+        while True:
+            with self._lock:
+                if key in self._data:
+                    self.hits += 1
+                    self._data.move_to_end(key)
+                    return self._data[key]
+
+                pending = self._pending.get(key)
+                if pending is None:
+                    # this thread decodes the data
+                    self.misses += 1
+                    self._pending[key] = Event()
+                    break
+
+            # another thread decodes the data. it is cached afterwards, unless decoding failed or it was too large
+            pending.wait()
+            with self._lock:
+                if key not in self._data and key not in self._pending:
+                    self.misses += 1
+                    self._pending[key] = Event()
+                    break
+
+        try:
+            data = decode()
+            self._put(key, data)
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+        return data
+
+    def _put(self, key, data):
+        """Stores the data and evicts the least recently used data until the cache fits into its budget."""
+
+        size = nbytes(data)
+        if size > self.max_bytes:
+            return
+
+        # callers share the cached arrays, so they must not be changed in place
+        for array in data if isinstance(data, tuple) else (data,):
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+
+        with self._lock:
+            self._data[key] = data
+            self._sizes[key] = size
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                old_key, _ = self._data.popitem(last=False)
+                self.nbytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def stats(self):
+        """Returns the statistics of the cache.
+
+        :return: dict with keys: hits, misses, evictions, hit_rate, entries, bytes, max_bytes
+        """
+
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / requests if requests else 0.0, 'entries': len(self._data),
+                    'bytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+    def clear(self):
+        """Drops all cached data. The statistics are kept."""
+
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+
+def set_cache(max_bytes):
+    """Enables the cache of decoded channel data with the given byte budget or disables it.
+
+    :param max_bytes: (mandatory, int or string) byte budget, e.g. 2 ** 30 or '1G'. None or 0 disables the cache.
+    :return: (DecodedCache) the new cache or None
+    """
+
+    global __cache__
+    max_bytes = parse_bytes(max_bytes)
+    __cache__ = DecodedCache(max_bytes) if max_bytes else None
+    return __cache__
+
+
+def get_cache():
+    """Returns the cache of decoded channel data or None if it is disabled. Without a call of set_cache the byte budget
+    is read from the environment variable PYIBATOOLS_CACHE.
+
+    :return: (DecodedCache)
+    """
+
+    if __cache__ is False:
+        set_cache(os.environ.get(CACHE_ENV))
+    return __cache__
+
+
+def parse_bytes(value):
+    """Converts a byte budget like 512M or 2G to bytes. None and empty strings are 0."""
+
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        value = value.strip().upper().rstrip('B')
+        if not value:
+            return 0
+        if value[-1] in UNITS:
+            return int(float(value[:-1]) * UNITS[value[-1]])
+        return int(float(value))
+    return int(value)
+
+
+def file_identity(iba_file):
+    """Returns the identity of a file in the cache. A rewritten file gets a new identity.
+
+    :param iba_file: (mandatory, string) path to the iba file
+    :return: (tuple) normalized path, modification time in ns and size
+    """
+
+    stat = os.stat(iba_file)
+    return os.path.normcase(os.path.realpath(iba_file)), stat.st_mtime_ns, stat.st_size
+
+
+def nbytes(data):
+    """Returns the memory used by decoded channel data. Text data is counted by its strings. An array held several
+    times by a tuple, e.g. min and max of 'minmax' at the rate of the file, is counted once."""
+
+    if isinstance(data, tuple):
+        unique = {id(array): array for array in data}
+        return sum(nbytes(array) for array in unique.values())
+    if isinstance(data, np.ndarray):
+        if data.dtype == object:
+            return data.nbytes + sum(sys.getsizeof(value) for value in data.flat)
+        return data.nbytes
+    return sys.getsizeof(data)
@@ -0,0 +1,252 @@
+"""The export module converts iba files to Parquet or Arrow IPC files, e.g. for Spark or DuckDB.
+
+Each iba file is written to its own file within a hive style partitioned directory:
+
+    <output>/date=2019-01-01/<iba file name>.parquet
+    <output>/rate=0.01/date=2019-01-01/<iba file name>.parquet      (native_rates=True, rate of the exported data)
+
+The backends decode a channel as a whole, so the channels are decoded in blocks of block_channels, and each block is
+spilled to a memory mapped Arrow file next to the export. The blocks are then joined into row groups (Parquet) or
+record batches (Arrow) of row_group_seconds each, which are written one after the other. The memory needed per worker
+is about one block of channels plus one row group, independent of the number of channels of the iba file. With
+native_rates=True the channels are grouped by the rate they are exported in, i.e. their own sample rate or tbase if it
+is slower, and each group is written to its own table instead of repeating the samples of slow channels.
+
+Requires pyarrow. Use from the command line:
+
+    python -m pyIbaTools.export dat export --format parquet --workers 4
+"""
+import os
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pyIbaTools.backends import get_backend, set_backend, BACKENDS
+from pyIbaTools.pyIbaTools import ibaReader, get_channel_info, getSortedIbaFiles, AGGREGATIONS, \
+    __check_file__, __time_axis__, __read_channel__
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# formats the iba files can be exported to
+EXPORT_FORMATS = ('parquet', 'arrow')
+
+
+def export_iba_file(iba_file, output, channels=None, tbase=0, aggregation='first', native_rates=False,
+                    export_format='parquet', row_group_seconds=60.0, block_channels=64, compression='snappy'):
+    """Converts a single iba file to Parquet or Arrow IPC.
+
+    :param iba_file: (mandatory, string) path to the iba file
+    :param output: (mandatory, string) root directory of the export
+    :param channels: (optional, list of strings) names or ids of the exported channels. Default: all channels
+    :param tbase: (optional, float) time base in seconds of the exported data. 0 is the rate of the iba file, or the
+    rate of each channel with native_rates.
+    :param aggregation: (optional, string) how the samples within one tbase are reduced, see AGGREGATIONS
+    :param native_rates: (optional, bool) write a table per exported rate instead of repeating slow channels
+    :param export_format: (optional, string) one of EXPORT_FORMATS
+    :param row_group_seconds: (optional, float) seconds of data per row group or record batch
+    :param block_channels: (optional, int) number of channels decoded and spilled at a time
+    :param compression: (optional, string) compression of the Parquet files
+    :return: list of the paths of the written files
+    """
+
+    if pa is None:
+        raise ImportError('The export requires pyarrow. Install it with pip install pyarrow.')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError('Unknown format {0}. Use one of {1}.'.format(export_format, ', '.join(EXPORT_FORMATS)))
+
+    channel_info = get_channel_info(iba_file, channels)
+
+    paths = list()
+    with ibaReader(iba_file) as reader:
+        clk, frames = __check_file__(reader, iba_file)
+
+        # group the channels by the period they are exported in. with tbase several native rates share a group, text
+        # channels have the rate of the file
+        groups = dict()
+        for name, chan in channel_info.items():
+            period_ns, group_tbase = None, tbase
+            if native_rates:
+                native = float(chan.get('$PDA_Tbase', clk)) if chan['type'] != 'text' else clk
+                group_tbase = max(native, tbase)
+                period_ns = __time_axis__(reader, group_tbase, clk, frames).period_ns
+            groups.setdefault(period_ns, (group_tbase, list()))[1].append(name)
+
+        for period_ns, (group_tbase, names) in groups.items():
+            time_axis = __time_axis__(reader, group_tbase, clk, frames)
+            rows_per_group = max(1, int(row_group_seconds * 1e9 / time_axis.period_ns))
+
+            # hive style partitions, labelled with the rate of the exported data. the date is taken from the start of
+            # the time axis, so a file without frames is exported as an empty table with the schema of its channels
+            directory = output
+            if period_ns is not None:
+                directory = os.path.join(directory, 'rate={0!r}'.format(period_ns / 1e9))
+            directory = os.path.join(directory, 'date={0}'.format(time_axis.start.strftime('%Y-%m-%d')))
+            os.makedirs(directory, exist_ok=True)
+
+            stem = os.path.splitext(os.path.basename(iba_file))[0]
+            path = os.path.join(directory, stem + ('.parquet' if export_format == 'parquet' else '.arrow'))
+
+            # the spill files of the channel blocks are hidden from readers of the partitioned directory
+            with tempfile.TemporaryDirectory(prefix='.export-', dir=output) as spill:
+                block_paths = [__decode_block__(reader, iba_file, names[start:start + block_channels], group_tbase,
+                                                clk, frames, aggregation, time_axis, rows_per_group,
+                                                os.path.join(spill, 'block{0}.arrow'.format(start)))
+                               for start in range(0, len(names), block_channels)]
+                __write_row_groups__(block_paths, time_axis, rows_per_group, path, export_format, compression)
+            paths.append(path)
+
+    return paths
+
+
+def export_iba_files(source, output, workers=None, **kwargs):
+    """Converts all iba files of a directory (or a list of iba files) to Parquet or Arrow IPC. The files are converted
+    in parallel worker processes.
+
+    :param source: (mandatory, string or list of strings) directory of the iba files or paths to the iba files
+    :param output: (mandatory, string) root directory of the export
+    :param workers: (optional, int) number of worker processes. 1 converts in the calling process. Default: number of
+    cpus
+    :param kwargs: further arguments of export_iba_file
+    :return: list of the paths of the written files
+    """
+
+    if pa is None:
+        raise ImportError('The export requires pyarrow. Install it with pip install pyarrow.')
+
+    iba_files = getSortedIbaFiles(source) if isinstance(source, str) else list(source)
+
+    if workers == 1 or len(iba_files) <= 1:
+        return [path for iba_file in iba_files for path in export_iba_file(iba_file, output, **kwargs)]
+
+    # the workers use the same backend as the calling process
+    backend = get_backend().name
+    if backend not in BACKENDS:
+        backend = None
+
+    paths = list()
+    with ProcessPoolExecutor(max_workers=workers, initializer=__init_worker__, initargs=(backend,)) as pool:
+        futures = [pool.submit(export_iba_file, iba_file, output, **kwargs) for iba_file in iba_files]
+        for iba_file, future in zip(iba_files, futures):
+            try:
+                paths += future.result()
+            except Exception as e:
+                print('Could not export iba file {0}: {1}'.format(iba_file, e))
+    return paths
+
+
+def __init_worker__(backend):
+    """Internal function selecting the backend of a worker process."""
+
+    if backend is not None:
+        set_backend(backend)
+
+
+def __decode_block__(reader, iba_file, names, tbase, clk, frames, aggregation, time_axis, rows_per_group, path):
+    """Internal function decoding a block of channels and spilling it to an Arrow IPC file in record batches of
+    rows_per_group rows, so only one block of channels is held in memory at a time.
+
+    :return: (string) path of the spill file
+    """
+
+    rows = len(time_axis)
+    columns, arrays = list(), list()
+    for name in names:
+        data = __read_channel__(reader, iba_file, name, tbase, clk, frames, aggregation)
+        if isinstance(data, tuple):
+            columns += [name + '_min', name + '_max']
+            arrays += [__to_arrow__(data[0], rows), __to_arrow__(data[1], rows)]
+        else:
+            columns.append(name)
+            arrays.append(__to_arrow__(data, rows))
+        del data
+
+    table = pa.Table.from_arrays(arrays, names=columns)
+    del arrays
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        for start in range(0, rows, rows_per_group):
+            writer.write_batch(table.slice(start, rows_per_group).combine_chunks().to_batches()[0])
+    return path
+
+
+def __write_row_groups__(block_paths, time_axis, rows_per_group, path, export_format, compression):
+    """Internal function joining the spilled channel blocks row group by row group into the exported file. The blocks
+    are memory mapped, so only the current row group is read into memory."""
+
+    sources = [pa.memory_map(block_path) for block_path in block_paths]
+    blocks = [pa.ipc.open_file(source) for source in sources]
+    schema = pa.schema([pa.field('Time', pa.timestamp('ns'))] + [field for block in blocks for field in block.schema])
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(path, schema, compression=compression)
+    else:
+        sink = pa.OSFile(path, 'wb')
+        writer = pa.ipc.new_file(sink, schema)
+
+    try:
+        for num, start in enumerate(range(0, len(time_axis), rows_per_group)):
+            rows = min(rows_per_group, len(time_axis) - start)
+            arrays = [pa.array(time_axis.start_ns + np.arange(start, start + rows, dtype=np.int64) *
+                               time_axis.period_ns, type=pa.timestamp('ns'))]
+            for block in blocks:
+                arrays += block.get_batch(num).columns
+            batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+            if export_format == 'parquet':
+                writer.write_table(pa.Table.from_batches([batch]), row_group_size=rows_per_group)
+            else:
+                writer.write_batch(batch)
+    finally:
+        writer.close()
+        if export_format != 'parquet':
+            sink.close()
+        # the spill files can only be removed once they are unmapped
+        for source in sources:
+            source.close()
+
+
+def __to_arrow__(data, rows):
+    """Internal function converting the data of a channel to an arrow array of exactly the given number of rows. Missing
+    rows at the end are null."""
+
+    data = data[:rows]
+    array = pa.array(data)
+    if len(data) < rows:
+        array = pa.concat_arrays([array, pa.nulls(rows - len(data), type=array.type)])
+    return array
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts iba files to Parquet or Arrow IPC.')
+    parser.add_argument('source', help='directory of the iba files')
+    parser.add_argument('output', help='root directory of the export')
+    parser.add_argument('--format', dest='export_format', default='parquet', choices=EXPORT_FORMATS)
+    parser.add_argument('--channels', nargs='+', default=None, help='names or ids of the channels (default: all)')
+    parser.add_argument('--tbase', type=float, default=0, help='time base in seconds (default: rate of the file)')
+    parser.add_argument('--aggregation', default='first', choices=AGGREGATIONS,
+                        help='how the samples within one tbase are reduced (default: first)')
+    parser.add_argument('--native-rates', action='store_true',
+                        help='write a table per sample rate instead of repeating the samples of slow channels')
+    parser.add_argument('--row-group-seconds', type=float, default=60.0,
+                        help='seconds of data per row group or record batch (default: 60)')
+    parser.add_argument('--block-channels', type=int, default=64,
+                        help='channels decoded and spilled at a time (default: 64)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of cpus)')
+    parser.add_argument('--backend', default=None, choices=BACKENDS,
+                        help='library decoding the iba files (default: $PYIBATOOLS_BACKEND or lite)')
+    args = parser.parse_args()
+
+    if args.backend is not None:
+        set_backend(args.backend)
+
+    paths = export_iba_files(args.source, args.output, workers=args.workers, channels=args.channels,
+                             tbase=args.tbase, aggregation=args.aggregation, native_rates=args.native_rates,
+                             export_format=args.export_format, row_group_seconds=args.row_group_seconds,
+                             block_channels=args.block_channels)
+    print('{0} files written to {1}.'.format(len(paths), args.output))
+
+
+if __name__ == '__main__':
+    main()
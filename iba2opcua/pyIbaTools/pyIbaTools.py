@@ -5,16 +5,18 @@ Currently available functions:
 * `getFiles(directory=None, file_type="", file_name="*", scan_sub_folders=True, verbose=False)`
    Find all file of a specific type within a folder and its sub folders.
 * `ibaReader(iba_file)`
-   Context manager which yields a ibaFilesLite.FileReader() which opened the wanted iba_file
+   Context manager which yields a FileReader of the current backend which opened the wanted iba_file
 * `ibaChannelReader(channel_, freader_)`
    A context manager to read a iba channel from a file
 * `getSortedIbaFiles(directory, scan_sub_folders=True, verbose=False)`
    Find iba files within a given directory and sort the files by start time in ascending order
-* `readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', caching=True, ignore=False)`
+* `readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', caching=True, ignore=False, time_mode='column', aggregation='first')`
    Read the wanted channel from a iba_file with a specified tbase.
    The Caching is especially useful when reading data from a network drive.
-* `readIbaFiles(iba_file_list, channels=None, names=None, tbase=0, delimiter=',')`
+* `readIbaFiles(iba_file_list, channels=None, names=None, tbase=0, delimiter=',', aggregation='first')`
    Read each file from the given list of files and try to stack them.
+* `get_time_axis(df)`
+   Returns the IbaTimeAxis of a DataFrame read with time_mode='implicit'.
 * `get_channels(iba_file)`
    Use this method to get a list of all available channels in the given file
 * `get_channel_info(iba_file, channels=None)`
@@ -24,6 +26,10 @@ Currently available functions:
    information like the sample rate and number of frames.
 * `is_channel(chan, file)`
   Use to check the existing of a certain channel in a given iba file.
+* `set_backend(backend, cached=False)`
+  Select the library which decodes the iba files: 'lite' (default), 'pro' or 'synthetic'. See pyIbaTools.backends.
+* `set_cache(max_bytes)`
+  Keep the channel data decoded by readIbaFile in a LRU cache of the given size. See pyIbaTools.cache.
 
 """
 import os
@@ -33,7 +39,8 @@ import glob
 import numpy as np
 import pandas as pd
 from contextlib import contextmanager
-from pyIbaTools import ibaFilesLite
+from pyIbaTools.backends import get_backend, set_backend, CachedBackend, BACKENDS
+from pyIbaTools.cache import get_cache, set_cache, file_identity
 
 class ChannelNotFoundError(Exception):
     """The ChannelNotFountError will be raised when ever a given channel was not found."""
@@ -61,6 +68,75 @@ class IbaFileIsCurrentlyWrittenError(Exception):
     pass
 
 
+# aggregations which can be used to reduce the data to a coarser tbase
+AGGREGATIONS = ('first', 'last', 'mean', 'min', 'max', 'minmax')
+
+
+class IbaTimeAxis(object):
+    """The IbaTimeAxis describes the time axis of data read from an iba file by its start time, its sample period and
+    its number of frames. The timestamps are computed on demand with exact integer nanosecond arithmetic."""
+
+    def __init__(self, start, period_ns, frames):
+        """Default constructor.
+
+        :param start: (mandatory, datetime or pd.Timestamp) time of the first sample
+        :param period_ns: (mandatory, int) sample period in nanoseconds
+        :param frames: (mandatory, int) number of samples
+        """
+
+        self.start = pd.Timestamp(start)
+        self.period_ns = int(period_ns)
+        self.frames = int(frames)
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, idx):
+        """Returns the timestamp of the sample(s) at idx. idx may be an int, a slice or an array of ints."""
+
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += self.frames
+            if not 0 <= idx < self.frames:
+                raise IndexError('Sample {0} is out of range of a time axis with {1} frames.'.format(idx, self.frames))
+            return pd.Timestamp(self.start.value + int(idx) * self.period_ns)
+
+        return pd.DatetimeIndex(self.start.value + np.arange(self.frames, dtype=np.int64)[idx] * self.period_ns)
+
+    def __repr__(self):
+        return 'IbaTimeAxis(start={0}, period_ns={1}, frames={2})'.format(self.start, self.period_ns, self.frames)
+
+    @property
+    def start_ns(self):
+        """Start time as nanoseconds since epoch."""
+        return self.start.value
+
+    @property
+    def duration_ns(self):
+        """Time span covered by the samples in nanoseconds (the last sample is held for one period)."""
+        return self.frames * self.period_ns
+
+    @property
+    def end(self):
+        """Time of the last sample."""
+        return pd.Timestamp(self.start.value + max(self.frames - 1, 0) * self.period_ns)
+
+    def index_of(self, time):
+        """Returns the index of the sample which is valid at the given time.
+
+        :param time: (mandatory, datetime or pd.Timestamp or int) time to look up (int is interpreted as ns since epoch)
+        :return: (int) sample index, clipped to the valid range
+        """
+
+        time_ns = time if isinstance(time, (int, np.integer)) else pd.Timestamp(time).value
+        idx = (int(time_ns) - self.start.value) // self.period_ns
+        return int(min(max(idx, 0), self.frames - 1))
+
+    def to_index(self):
+        """Materializes the time axis as pandas DatetimeIndex."""
+        return self[:]
+
+
 def getFiles(directory=None, file_type='dat', file_name='*', scan_sub_folders=True, verbose=False):
     """Use to find files of a certain kind within a folder and its sub folders.
 
@@ -151,18 +227,20 @@ def ibaReader(iba_file):
     """A context manager to help loading iba files. It will yield the actual reader which opened the iba file.
 
     :param iba_file: (string, mandatory) path to the iba file to load
-    :return: yields a ibaFilesLite.FileReader with the desired file opened
+    :return: yields a FileReader of the current backend with the desired file opened
     """
     # make sure to use \\ instead of /
     iba_file = os.path.normpath(iba_file)
 
+    backend = get_backend()
+
     # check if file is currently written by the ibaPDA
-    if ibaFilesLite.isCurrentPDA(iba_file):
+    if backend.isCurrentPDA(iba_file):
         raise IbaFileIsCurrentlyWrittenError(
             'You are about to read a iba file which is currently written by the ibaPDA.')
 
     # open the reader
-    reader = ibaFilesLite.FileReader()
+    reader = backend.FileReader()
     try:
         reader.Open(iba_file)
     except RuntimeError as e:
@@ -190,7 +268,8 @@ def ibaChannelReader(channel_, freader_):
     yield __get_iba_channel_reader__(channel_, freader_)
 
 
-def readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', caching=True, ignore=False):
+def readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', caching=True, ignore=False,
+                time_mode='column', aggregation='first'):
     """Use this function to read an iba file.
 
     :param iba_file: (mandatory, string) Path to the iba file.
@@ -200,12 +279,19 @@ def readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', cac
     :param delimiter: (optional, string) Defines the delimiter if the channels or names input is a single string.
     :param caching: (optional, bool) Flag whether to cache to file or not
     :param ignore: (optional, bool) if ignore is set False, channels that could not be found will raise an error.
+    :param time_mode: (optional, string) How the time axis is returned: 'column' (default), 'index' or 'implicit'.
+    :param aggregation: (optional, string) How the samples within one tbase are reduced. See AGGREGATIONS.
     :return: (pandas.DataFrame) The actual data represented as pandas data frame
 
 
     Note(1): If tbase is 0 the original (minimal) timebase is returned. If e.g. tbase is 0.5,
              than a value for every 0.5s of the data is returned.
 
+    Note(2): The aggregation defines how the samples within one tbase are reduced to a single value: 'first' (default)
+             and 'last' take the first or last sample of each block, 'mean', 'min' and 'max' reduce the block.
+             'minmax' returns the envelope as two columns '<name>_min' and '<name>_max'. Text channels are always
+             reduced by 'first' or 'last'.
+
     Note(3): channels and names can also be given as a single string. if that is the case, the given delimiter is
     expected.
 
@@ -219,8 +305,17 @@ def readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', cac
     Note(7): channels can either contain the precise name of the desired channel (e.g. 'ActCastingSpeed')
              in the iba file, or the actual id (e.g. '3:12').
 
+    Note(8): With time_mode 'column' the time is returned in the first column 'Time', with 'index' as DatetimeIndex.
+             With 'implicit' no time data is materialized at all. The IbaTimeAxis describing the data is stored in
+             df.attrs['time_axis'] and can be received with get_time_axis(df).
+
     This function is originally written by Frank Eschner (nerf@sms-group.com)"""
 
+    if time_mode not in ('column', 'index', 'implicit'):
+        raise ValueError('Unknown time_mode {0}. Use one of column, index or implicit.'.format(time_mode))
+    if aggregation not in AGGREGATIONS:
+        raise ValueError('Unknown aggregation {0}. Use one of {1}.'.format(aggregation, ', '.join(AGGREGATIONS)))
+
     # check given channels and names and format them if necessary
     (channels, names) = __declaration_check__(iba_file, channels, names, delimiter)
 
@@ -228,24 +323,18 @@ def readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', cac
     if caching and len(channels) > 10:
         __cache_prep__(iba_file)
 
+    # channels decoded before are taken from the cache of decoded data if it is enabled
+    backend = get_backend()
+    cache = backend.cache if isinstance(backend, CachedBackend) else get_cache()
+    file_key = file_identity(iba_file) if cache is not None else None
+
     with ibaReader(iba_file) as reader:
 
         # get clk and number of frames from the iba file and also check if the values are valid
         clk, frames = __check_file__(reader, iba_file)
 
-        # get some time data to compute time array with new number of frames
-        start_time = pd.Timestamp(reader.GetStartTime())
-        end_time = start_time + pd.Timedelta(seconds=(clk * (frames - 1)))
-
-        # create time array
-        time_data = np.linspace(start_time.value, end_time.value, frames)
-
-        # only take data points at a certain timebase
-        if tbase != 0:
-            time_data = time_data[::int(tbase / clk)]
-
-        # convert time data to actual pd Timestamp
-        time_data = pd.to_datetime(time_data)
+        # describe the time axis by start time and period. the timestamps are only computed if needed
+        time_axis = __time_axis__(reader, tbase, clk, frames)
 
         # reset collected file data
         df = pd.DataFrame()
@@ -259,8 +348,9 @@ def readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', cac
                 for alt_chn in chn:
                     # get the data of the current channel
                     try:
-                        chan_data = __read_channel__(reader=reader, iba_file=iba_file, channel=alt_chn,
-                                                     tbase=tbase, clk=clk, frames=frames)
+                        chan_data = __read_cached_channel__(cache, file_key, reader=reader, iba_file=iba_file,
+                                                            channel=alt_chn, tbase=tbase, clk=clk, frames=frames,
+                                                            aggregation=aggregation)
                         # we could load the data. yay :-)
                         any_channel_found = True
                         # stop trying the rest of the alternative channels
@@ -279,8 +369,9 @@ def readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', cac
             else:
                 # get the data of the current channel
                 try:
-                    chan_data = __read_channel__(reader=reader, iba_file=iba_file, channel=chn,
-                                                 tbase=tbase, clk=clk, frames=frames)
+                    chan_data = __read_cached_channel__(cache, file_key, reader=reader, iba_file=iba_file,
+                                                        channel=chn, tbase=tbase, clk=clk, frames=frames,
+                                                        aggregation=aggregation)
                 except ChannelNotFoundError as e:
                     if ignore:
                         continue
@@ -289,20 +380,32 @@ def readIbaFile(iba_file, channels=None, names=None, tbase=0, delimiter=',', cac
 
             # add the data to the data frame
             try:
-                df[names[num]] = chan_data
+                if aggregation == 'minmax' and isinstance(chan_data, tuple):
+                    df[names[num] + '_min'], df[names[num] + '_max'] = chan_data
+                else:
+                    df[names[num]] = chan_data
             except Exception:
                 raise DataStackingError('Failed to add channel {0} to DataFrame.'.format(chn))
 
-        # create data frame and concat them
-        # so far I did not find any better solution in order to keep the date times and not converting them to
-        # floats
-        tf = pd.DataFrame(data=time_data, columns=['Time'])
-        df = pd.concat([tf, df], axis=1)
+        if time_mode == 'column':
+            # create data frame and concat them
+            # so far I did not find any better solution in order to keep the date times and not converting them to
+            # floats
+            tf = pd.DataFrame(data=time_axis.to_index(), columns=['Time'])
+            df = pd.concat([tf, df], axis=1)
+        elif time_mode == 'index':
+            if df.empty:
+                df = pd.DataFrame(index=time_axis.to_index())
+            else:
+                df.index = time_axis.to_index()
+            df.index.name = 'Time'
+        else:
+            df.attrs['time_axis'] = time_axis
 
     # TODO: check if DataFrame has been filled properly
     return df
 
-def readIbaFiles(iba_file_list, channels=None, names=None, tbase=0, delimiter=','):
+def readIbaFiles(iba_file_list, channels=None, names=None, tbase=0, delimiter=',', aggregation='first'):
     """Use this method to receive a single pandas DataFrame with data from all given iba files.
 
     :param iba_file_list: (mandatory, list of strings) Path to each file.
@@ -310,6 +413,7 @@ def readIbaFiles(iba_file_list, channels=None, names=None, tbase=0, delimiter=',
     :param names: (optional, string or list of strings) List that defines the names of the extracted channels.
     :param tbase:  (optional, int) Defines timebase in that the data will be returned.
     :param delimiter: (optional, string) Defines the delimiter if the channels or names input is a single string.
+    :param aggregation: (optional, string) How the samples within one tbase are reduced. See readIbaFile.
     :return: (pandas DataFrame) Containing the desired -stacked- data.
     
     Note(1): If channels is a dict, the keys will act as channel ids and values as desired channel names.
@@ -330,7 +434,8 @@ def readIbaFiles(iba_file_list, channels=None, names=None, tbase=0, delimiter=',
     for file in iba_file_list:
             # get data from single file
             temp_df = readIbaFile(iba_file=file, channels=channels, names=names, 
-                                  tbase=tbase, delimiter=delimiter, caching=True, ignore=True)
+                                  tbase=tbase, delimiter=delimiter, caching=True, ignore=True,
+                                  aggregation=aggregation)
             
             # add copy of dataframe to list
             dfs = dfs + [temp_df.copy()]
@@ -355,6 +460,16 @@ def readIbaFiles(iba_file_list, channels=None, names=None, tbase=0, delimiter=',
     return pd.concat(dfs, ignore_index=True)
         
 
+def get_time_axis(df):
+    """Returns the IbaTimeAxis of a DataFrame which has been read with time_mode='implicit'.
+
+    :param df: (mandatory, pandas.DataFrame) data returned by readIbaFile
+    :return: (IbaTimeAxis) the time axis or None if the DataFrame does not carry one
+    """
+
+    return df.attrs.get('time_axis')
+
+
 def get_channels(iba_file, ids=None):
     """Use this method to get a list of all available channels in the given file
 
@@ -446,7 +561,7 @@ def is_channel(chan, file):
         chanReader = None
         with ibaReader(file) as reader:
             chanReader = __get_iba_channel_reader__(chan, reader)
-        return isinstance(chanReader, ibaFilesLite.ChannelReader)
+        return isinstance(chanReader, get_backend().ChannelReader)
     except:
         return False
 
@@ -546,6 +661,28 @@ def __check_file__(reader, iba_file):
     return clk, frames
 
 
+def __time_axis__(reader, tbase, clk, frames):
+    """Internal function to describe the time axis of an opened iba file in the wanted timebase.
+
+    :param reader: (mandatory, ibaFilesLite.FileReader) The reader used to open the iba file
+    :param tbase:  (mandatory, float): defines timebase in that the data will be returned.
+    :param clk: (mandatory, float): the sample rate of the iba file
+    :param frames: (mandatory, int): number of frames available in the iba files
+    :return: (IbaTimeAxis)
+    """
+
+    # integer nanoseconds avoid the rounding errors of a float linspace
+    period_ns = int(round(clk * 1e9))
+
+    # only take data points at a certain timebase
+    if tbase != 0:
+        step = __tbase_step__(tbase, clk)
+        period_ns *= step
+        frames = len(range(0, frames, step))
+
+    return IbaTimeAxis(reader.GetStartTime(), period_ns, frames)
+
+
 def __get_iba_channel_reader__(channel_, freader_):
     """An internal function to obtain the channel reader based on a given channel.
 
@@ -555,7 +692,7 @@ def __get_iba_channel_reader__(channel_, freader_):
     """
 
     # is the current channel a valid channel id?
-    if type(channel_) == ibaFilesLite.ChannelId:
+    if type(channel_) == get_backend().ChannelId:
         # id is valid!
         return freader_.QueryChannel(channel_)
     elif re.match("[0-9]*[.:][0-9]*", channel_):
@@ -566,7 +703,54 @@ def __get_iba_channel_reader__(channel_, freader_):
         return freader_.QueryChannelByName(channel_)
 
 
-def __read_channel__(reader, iba_file, channel, tbase, clk, frames):
+def __tbase_step__(tbase, clk):
+    """Internal function to get the number of samples of the iba file which make up one sample in the wanted tbase.
+
+    :param tbase:  (mandatory, float): defines timebase in that the data will be returned.
+    :param clk: (mandatory, float): the sample rate of the iba file
+    :return: (int) number of samples per tbase, at least 1
+    """
+
+    # round instead of truncating, e.g. 0.01 / 0.001 = 9.999999999999998
+    return max(int(round(tbase / clk)), 1)
+
+
+def __aggregate__(data, step, aggregation):
+    """Internal function to reduce blocks of step samples to a single value each. The reduction is vectorized with
+    numpy's reduceat, the last block may be shorter than step.
+
+    :param data: (mandatory, numpy.ndarray) 1-dimensional data
+    :param step: (mandatory, int) number of samples per block
+    :param aggregation: (mandatory, string) one of AGGREGATIONS
+    :return: numpy array holding the reduced data, or a tuple (min, max) for aggregation 'minmax'
+    """
+
+    if aggregation == 'first':
+        return data[::step]
+
+    # first index of each block
+    starts = np.arange(0, data.shape[0], step)
+
+    if aggregation == 'last':
+        return data[np.minimum(starts + step, data.shape[0]) - 1]
+
+    if data.shape[0] == 0:
+        return (data, data) if aggregation == 'minmax' else data
+
+    if aggregation == 'mean':
+        counts = np.diff(np.append(starts, data.shape[0]))
+        return np.add.reduceat(data.astype(np.float64), starts) / counts
+    if aggregation == 'min':
+        return np.minimum.reduceat(data, starts)
+    if aggregation == 'max':
+        return np.maximum.reduceat(data, starts)
+    if aggregation == 'minmax':
+        return np.minimum.reduceat(data, starts), np.maximum.reduceat(data, starts)
+
+    raise ValueError('Unknown aggregation {0}. Use one of {1}.'.format(aggregation, ', '.join(AGGREGATIONS)))
+
+
+def __read_channel__(reader, iba_file, channel, tbase, clk, frames, aggregation='first'):
     """Internal function to read a certain channel in a wanted timebase
 
     :param reader: (mandatory, ibaFilesLite.FileReader) The reader used to open the iba file
@@ -575,6 +759,7 @@ def __read_channel__(reader, iba_file, channel, tbase, clk, frames):
     :param tbase:  (mandatory, float): defines timebase in that the data will be returned.
     :param clk: (mandatory, float): the sample rate of the iba file
     :param frames: (mandatory, int): number of frames available in the iba files
+    :param aggregation: (optional, string): how the samples within one tbase are reduced
     :return:
     """
 
@@ -586,19 +771,36 @@ def __read_channel__(reader, iba_file, channel, tbase, clk, frames):
 
     # read data from channel
     if chan_reader.IsText:
-        return __read_text_channel__(chan_reader, tbase, clk, frames)
+        return __read_text_channel__(chan_reader, tbase, clk, frames, aggregation)
     else:
-        return __read_numeric_channel__(chan_reader, tbase, clk)
+        return __read_numeric_channel__(chan_reader, tbase, clk, aggregation)
+
+
+def __read_cached_channel__(cache, file_key, reader, iba_file, channel, tbase, clk, frames, aggregation='first'):
+    """Internal function to read a certain channel through the cache of decoded data. Without cache the channel is
+    read by __read_channel__.
+
+    :param cache: (mandatory, DecodedCache) the cache or None
+    :param file_key: (mandatory, tuple) identity of the iba file, see pyIbaTools.cache.file_identity
+    :return: the data of the channel, see __read_channel__
+    """
 
+    if cache is None:
+        return __read_channel__(reader, iba_file, channel, tbase, clk, frames, aggregation)
 
-def __read_numeric_channel__(chan_reader, tbase, clk):
+    return cache.get(file_key + (str(channel), float(tbase), aggregation),
+                     lambda: __read_channel__(reader, iba_file, channel, tbase, clk, frames, aggregation))
+
+
+def __read_numeric_channel__(chan_reader, tbase, clk, aggregation='first'):
     """Internal function to read the data from a given channel reader. The data will be returned in the wanted sample
     rate.
 
     :param chan_reader: (mandatory, iba)
     :param tbase: (mandatory, float) wanted sample rate in seconds
     :param clk: (mandatory, float) sample rate of the iba file
-    :return: numpy array holding the data
+    :param aggregation: (optional, string) how the samples within one tbase are reduced
+    :return: numpy array holding the data, or a tuple (min, max) for aggregation 'minmax'
     """
 
     # extract data
@@ -611,25 +813,36 @@ def __read_numeric_channel__(chan_reader, tbase, clk):
     # get clk of channel
     chn_clk = channel_data.Timebase
 
-    # store as array
-    processed_data = np.repeat(channel_data, 1)
+    # store as array. make sure the data has only 1 dimension.
+    processed_data = np.repeat(channel_data, 1).reshape(-1,)
 
-    # does channel clk equals max clk?
-    if chn_clk != clk:
-        # how many copies per data point are needed?
-        fct = chn_clk / clk
-        # copy data to have equal amount of data points!
-        processed_data = np.repeat(processed_data, fct)[np.newaxis].T
+    # how many copies per data point are needed to match the max clk?
+    fct = __tbase_step__(chn_clk, clk)
 
     # only take data points at a certain timebase
     if tbase != 0:
-        processed_data = processed_data[::int(tbase / clk)]
-        
-    # make sure returned data has only 1 dimension.
-    return processed_data.reshape(-1,)
+        step = __tbase_step__(tbase, clk)
+
+        # blocks of whole channel samples can be aggregated without copying the data to the max clk first
+        if step % fct == 0:
+            return __aggregate__(processed_data, step // fct, aggregation)
+
+        # copy data to have equal amount of data points!
+        if fct != 1:
+            processed_data = np.repeat(processed_data, fct)
+        return __aggregate__(processed_data, step, aggregation)
+
+    # does channel clk equals max clk?
+    if fct != 1:
+        # copy data to have equal amount of data points!
+        processed_data = np.repeat(processed_data, fct)
+
+    if aggregation == 'minmax':
+        return processed_data, processed_data
+    return processed_data
 
 
-def __read_text_channel__(chan_reader, tbase, clk, frames):
+def __read_text_channel__(chan_reader, tbase, clk, frames, aggregation='first'):
     """Internal function to read text the data from a given channel reader. The data will be returned in the wanted
      sample rate.
 
@@ -637,6 +850,7 @@ def __read_text_channel__(chan_reader, tbase, clk, frames):
     :param tbase: (mandatory, float) wanted sample rate in seconds
     :param clk: (mandatory, float) sample rate of the iba file
     :param frames: (mandatory, int): number of frames available in the iba files
+    :param aggregation: (optional, string) 'last' takes the last text of each tbase, everything else the first one
     :return: numpy array holding the data
     """
 
@@ -661,11 +875,14 @@ def __read_text_channel__(chan_reader, tbase, clk, frames):
         for idx_list in range(start_idx, end_idx):
             processed_data[idx_list] = cur_str
 
-    # only take data points at a certain timebase
+    processed_data = np.array(processed_data)
+
+    # only take data points at a certain timebase. text can not be averaged
     if tbase != 0:
-        processed_data = processed_data[::int(tbase / clk)]
+        processed_data = __aggregate__(processed_data, __tbase_step__(tbase, clk),
+                                       'last' if aggregation == 'last' else 'first')
 
-    return np.array(processed_data)
+    return processed_data
 
 
 def __declaration_check__(iba_file, channels, names, delimiter):
@@ -0,0 +1,301 @@
+import os
+import hashlib
+import numpy as np
+from pyIbaTools.pyIbaTools import getSortedIbaFiles, readIbaFile, get_channel_info, get_time_axis
+from playback import PlaybackQueue
+
+
+class IbaRecorder(object):
+    """The IbaRecorder represents the series of iba files written by one ibaPDA system into a single directory. It
+    discovers the files, builds the union of their channel configurations and holds the loaded data in playback
+    order."""
+
+    def __init__(self, directory, name=None, tbase=0, aggregation='first', selection=None):
+        """Default constructor.
+
+        :param directory: (mandatory, string) path to the iba files of the recorder
+        :param name: (optional, string) name of the recorder. Default: name of the directory
+        :param tbase: (optional, float) publish rate in seconds for all channels faster than tbase
+        :param aggregation: (optional, string) how the samples within one tbase are reduced
+        :param selection: (optional, ChannelSelection) which channels are published and at which rate. Default: all
+        channels at their own rate
+        """
+
+        self.directory = directory
+        self.name = name if name is not None else os.path.basename(os.path.normpath(directory))
+        self.tbase = float(tbase)
+        self.aggregation = aggregation
+        self.selection = selection
+
+        # list of path to iba files
+        self.iba_files = list()
+
+        # dictionary containing the union of the channels of all iba files sorted by module and sample rate
+        self.iba_info = dict()
+
+        # channel configurations of the iba files: fingerprint -> {channel key: channel info of that configuration}
+        self._schemas = dict()
+
+        # fingerprint of the channel configuration of each iba file
+        self._file_schema = dict()
+
+        # queue of the loaded iba files in playback order. each entry holds the data sorted by sample rate
+        self.iba_data = PlaybackQueue()
+
+    def discover_iba_files(self):
+        """Call to get a list of iba files in the directory of the recorder.
+
+        :return: list of paths to iba files
+        :raises: FileNotFoundError
+        """
+
+        # get the list of iba files
+        file_list = getSortedIbaFiles(self.directory, scan_sub_folders=False)
+
+        # check if any files have been found
+        if not file_list:
+            raise FileNotFoundError('Could not find any files at ''{}''.'.format(self.directory))
+
+        return file_list
+
+    def load_iba_file(self, iba_file):
+        """Reads the data of all published channels from the given iba file. Since the channel configuration of the
+        file may differ from the published union of channels, a remap table is created for each sample rate. It
+        holds the column of each published channel within the data or -1 if the file does not contain the channel.
+
+        :param iba_file: (mandatory, string) path to a iba files
+        :return: dict with keys: file (string), fingerprint (string), data (dict of 2d numpy.ndarray by sample rate),
+        time_axis (dict of IbaTimeAxis by sample rate), remap (dict of numpy.ndarray by sample rate), start_ns (int),
+        end_ns (int)
+        """
+
+        fingerprint = self._file_schema.get(iba_file)
+        if fingerprint is None:
+            fingerprint = self._register_schema(iba_file)
+        schema = self._schemas[fingerprint]
+
+        # channels which have not been there when the address space was built can not be published
+        published = set(self.get_channel_key(chan) for channel in self.iba_info['channels'].values()
+                        for chan in channel)
+        unknown = set(schema.keys()) - published
+        if unknown:
+            print('{0}: ignoring {1} channels which are not part of the address space.'.format(
+                os.path.basename(iba_file), len(unknown)))
+
+        data, time_axis, remap = dict(), dict(), dict()
+        for sampleRate, channel in self.iba_info['channels'].items():
+            # find the column of each published channel within this file
+            ids = list()
+            table = np.full(len(channel), -1, dtype=np.int64)
+            for num, chan in enumerate(channel):
+                file_chan = schema.get(self.get_channel_key(chan))
+                if file_chan is not None:
+                    table[num] = len(ids)
+                    ids.append(file_chan['id'])
+
+            # the time axis is not materialized. the updater computes timestamps on demand
+            df = readIbaFile(iba_file, channels=ids, names=ids, tbase=self.publish_period(sampleRate),
+                             time_mode='implicit', aggregation=self.aggregation)
+
+            time_axis[sampleRate] = get_time_axis(df)
+            if ids:
+                data[sampleRate] = df.to_numpy(dtype=np.float64)
+            else:
+                # the file contains none of the channels of the group, keep a row per frame for the time axis
+                data[sampleRate] = np.empty((len(time_axis[sampleRate]), 0), dtype=np.float64)
+            remap[sampleRate] = table
+
+        return {'file': iba_file, 'fingerprint': fingerprint, 'data': data, 'time_axis': time_axis, 'remap': remap,
+                'start_ns': min(ax.start_ns for ax in time_axis.values()),
+                'end_ns': max(ax.start_ns + ax.duration_ns for ax in time_axis.values())}
+
+    def append_iba_file(self, iba_file):
+        """Reads the given iba file and appends it to the playback.
+
+        :param iba_file: (mandatory, string) path to a iba files
+        :return: None
+        """
+
+        self.iba_data.append(self.load_iba_file(iba_file))
+        if iba_file not in self.iba_files:
+            self.iba_files.append(iba_file)
+        print('{0}: appended {1} to the playback ({2} files).'.format(self.name, os.path.basename(iba_file),
+                                                                      len(self.iba_data)))
+
+    def evict_iba_files(self, before_ns):
+        """Removes the files which end at or before the given recorded time from the playback, so a watched recorder
+        does not grow forever.
+
+        :param before_ns: (mandatory, int) recorded time in ns since epoch
+        :return: (list) the evicted entries
+        """
+
+        evicted = self.iba_data.evict(before_ns)
+        for entry in evicted:
+            if entry['file'] in self.iba_files:
+                self.iba_files.remove(entry['file'])
+            self._file_schema.pop(entry['file'], None)
+        if evicted:
+            print('{0}: evicted {1} played back files ({2} files).'.format(self.name, len(evicted),
+                                                                          len(self.iba_data)))
+        return evicted
+
+    def publish_period(self, sampleRate):
+        """Returns the period in seconds in which channels of the given sample rate are published."""
+
+        # publish the channels at their own rate or decimated to the server tbase
+        return max(float(sampleRate), self.tbase)
+
+    def rate_key(self, chan):
+        """Returns the sample rate the channel is grouped by. This is the rate of the channel in the iba file, unless
+        the selection configures a slower rate for its module.
+
+        :param chan: (mandatory, dict) channel info, see get_file_info
+        :return: (string) sample rate in seconds
+        """
+
+        if self.selection is not None:
+            rate = self.selection.rate('{0} {1}'.format(chan['module_no'], chan['module']))
+            if rate is not None and rate > float(chan['$PDA_Tbase']):
+                return repr(rate)
+        return chan['$PDA_Tbase']
+
+    @staticmethod
+    def get_channel_key(chan):
+        """Returns the key which identifies a channel across iba files with different channel configurations. The ids
+        of a channel may change between configurations, so the key is built from module and channel name.
+
+        :param chan: (mandatory, dict) channel info, see get_file_info
+        :return: (tuple) module, channel name
+        """
+
+        return '{0} {1}'.format(chan['module_no'], chan['module']), chan['name']
+
+    def _register_schema(self, iba_file):
+        """Reads the channel configuration of the given iba file and stores it by its fingerprint.
+
+        :param iba_file: (mandatory, string) path to a iba files
+        :return: (string) the fingerprint of the channel configuration
+        """
+
+        file_info = self.get_file_info(iba_file)
+        channels = [chan for channel in file_info['modules'].values() for chan in channel]
+
+        fingerprint = channel_fingerprint(channels)
+        if fingerprint not in self._schemas:
+            self._schemas[fingerprint] = {self.get_channel_key(chan): chan for chan in channels}
+        self._file_schema[iba_file] = fingerprint
+
+        return fingerprint
+
+    def get_union_info(self, iba_files):
+        """Returns the same dict as get_file_info, but for the union of the channels of all given iba files. Only the
+        headers of the files are read and each distinct channel configuration is processed once.
+
+        :param iba_files: (mandatory, list) paths to the iba files
+        :return: dict with keys: modules (dict), channel (dict)
+        """
+
+        modules = dict()
+        channels = dict()
+        known = set()
+        for iba_file in iba_files:
+            fingerprint = self._file_schema.get(iba_file)
+            if fingerprint is None:
+                fingerprint = self._register_schema(iba_file)
+
+            for key, chan in self._schemas[fingerprint].items():
+                if key in known:
+                    continue
+                known.add(key)
+
+                # get module
+                if key[0] not in modules.keys():
+                    modules[key[0]] = list()
+                modules[key[0]].append(chan)
+
+                # sort channel
+                cur_tbase = self.rate_key(chan)
+                if cur_tbase not in channels.keys():
+                    channels[cur_tbase] = list()
+                channels[cur_tbase].append(chan)
+
+        return {'modules': modules, 'channels': channels}
+
+    def replicate_info(self):
+        """Returns a copy of the channel info of the recorder with its own channel dicts, so the copy can be bound to a
+        separate set of opc nodes. The order of the channels is kept, so the data and remap tables of the loaded files
+        apply to the copy as well.
+
+        :return: dict with keys: modules (dict), channel (dict)
+        """
+
+        copies = dict()
+        for channel in self.iba_info['modules'].values():
+            for chan in channel:
+                copies[id(chan)] = dict(chan, opc_obj=None, opc_value=None)
+
+        return {'modules': {module: [copies[id(chan)] for chan in channel]
+                            for module, channel in self.iba_info['modules'].items()},
+                'channels': {rate: [copies[id(chan)] for chan in channel]
+                             for rate, channel in self.iba_info['channels'].items()}}
+
+    @property
+    def schema_count(self):
+        """Number of distinct channel configurations seen so far."""
+
+        return len(self._schemas)
+
+    def get_file_info(self, iba_file):
+        """Returns a dict containing all modules defined in the iba file as well as the dictionary with channels group
+        by their sample rate.
+
+        :param iba_file: (madatory, string) path to a iba files
+        :return: dict with keys: modules (dict), channel (dict)
+        """
+
+        # get the actual info
+        channel_info = get_channel_info(iba_file)
+
+        # loop over the file to store the info
+        modules = dict()
+        channels = dict()
+        for name, chan in channel_info.items():
+            # ignore text channel
+            if chan['type'] == 'text' or '$PDA_Tbase' not in chan.keys():
+                continue
+
+            # ignore channels which are not selected. they are never read
+            full_module = '{0} {1}'.format(chan['module_no'], chan['module'])
+            if self.selection is not None and not self.selection.selected(full_module, chan['name']):
+                continue
+
+            # add fields to the channel dict for later use
+            chan['opc_obj'] = None
+            chan['opc_value'] = None
+
+            # get module
+            if full_module not in modules.keys():
+                modules[full_module] = list()
+            modules[full_module].append(chan)
+
+            # sort channel
+            cur_tbase = self.rate_key(chan)
+            if cur_tbase not in channels.keys():
+                channels[cur_tbase] = list()
+            channels[cur_tbase].append(chan)
+
+        return {'modules': modules, 'channels': channels}
+
+
+def channel_fingerprint(channels):
+    """Returns a fingerprint of a channel configuration. Iba files with the same fingerprint share their channel
+    layout.
+
+    :param channels: (mandatory, list) channel infos, see IbaRecorder.get_file_info
+    :return: (string) hex digest
+    """
+
+    layout = sorted((str(chan['module_no']), str(chan['module']), str(chan['id']), str(chan['name']),
+                     str(chan['type']), str(chan['$PDA_Tbase'])) for chan in channels)
+    return hashlib.sha1(repr(layout).encode()).hexdigest()
@@ -1,127 +1,309 @@
 import os
 import time
+import argparse
+import functools
+import contextlib
 from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
 from opcua import ua, uamethod, Server
-from pyIbaTools.pyIbaTools import getSortedIbaFiles, readIbaFile, get_channels, get_channel_info
+from pyIbaTools.pyIbaTools import set_backend, AGGREGATIONS, BACKENDS
+from file_watcher import IbaFileWatcher
+from recorder import IbaRecorder
+from playback import PlaybackTimeline, PlaybackClock, ShiftedClock, datetime_to_ns, ns_to_datetime
+from diagnostics import TickMetrics, DiagnosticsPublisher, MetricsHttpServer, string_node
+from timing import Sleeper, TIMING_MODES
+from profiling import Profiler, PROFILE_ENV
+from config import read_config
+
+# endpoint of the server if none is configured
+ENDPOINT = 'opc.tcp://localhost:4840/sms-digital/iba-playback/'
+
+# what the VariableUpdater does with samples it could not publish in time
+OVERRUN_POLICIES = ('skip', 'burst', 'degrade')
+
+# how the playback is driven: an updater thread per sample rate or coroutines on the loop of an asyncio server
+ENGINES = ('threaded', 'asyncio')
 
 
 class IbaToUaServer():
     """The Server will discover the iba files and prepare the Opc Server accordingly."""
 
-    def __init__(self):
-        """Default constructor. Not magic here since everything is hard coded atm.
-
-        Todo: Use config parser to configure the server a little bit
+    def __init__(self, data_dirs=None, endpoint=ENDPOINT, selection=None, tbase=0, aggregation='first', watch=False,
+                 poll_interval=1.0, retention=3600.0, overrun='skip', metrics_port=None, timing='sleep',
+                 spin_threshold=0.002, cpu_affinity=None, speed=1.0, max_tick_rate=1000, block_speed=None,
+                 recorded_timestamps=False, replicas=1, replica_offset=None, profile_dir=None, profile_window=30.0,
+                 clock=None, subtree=None):
+        """Default constructor.
+
+        :param data_dirs: (optional, list of strings) directories of the iba files of each recorder. All recorders are
+        played back time aligned. Default: the dat sub folder
+        :param endpoint: (optional, string) endpoint url of the opc server
+        :param selection: (optional, ChannelSelection) which channels are published and at which rate. Default: all
+        channels at their own rate
+        :param tbase: (optional, float) publish rate in seconds for all channels faster than tbase. 0 publishes every
+        channel at its own rate.
+        :param aggregation: (optional, string) how the samples within one tbase are reduced, e.g. 'mean' or 'max'
+        :param watch: (optional, bool) watch the data directories and append new iba files to the playback
+        :param poll_interval: (optional, float) seconds between two scans of the directories if inotify is not
+        available
+        :param retention: (optional, float) seconds of recorded time the files are kept behind the playback position
+        with watch. Older files are evicted when a new file is appended. None keeps all files.
+        :param overrun: (optional, string) what to do with samples which could not be published in time, one of
+        OVERRUN_POLICIES
+        :param metrics_port: (optional, int) port of the local Prometheus endpoint. None disables the endpoint.
+        :param timing: (optional, string) how the updaters wait for their next tick, one of TIMING_MODES
+        :param spin_threshold: (optional, float) seconds before a tick at which the precise timing starts spinning
+        :param cpu_affinity: (optional, list of int) CPUs the updater threads are pinned to (Linux only)
+        :param speed: (optional, float) factor by which the playback runs faster than real time
+        :param max_tick_rate: (optional, float) maximal number of ticks per second of each updater
+        :param block_speed: (optional, float) speed from which on all samples passed within a tick are published
+        instead of only the current one. None never publishes blocks.
+        :param recorded_timestamps: (optional, bool) use the recorded time of the samples as source timestamp
+        instead of the time of publishing
+        :param replicas: (optional, int) number of instances of the channels published for load testing. All replicas
+        share the loaded data.
+        :param replica_offset: (optional, float) seconds of recorded time by which each replica is shifted against the
+        previous one. Default: the replicas are spread evenly over the data loaded at start
+        :param profile_dir: (optional, string) directory the startup and updater profiles are written to. None
+        disables the profiling.
+        :param profile_window: (optional, float) seconds the updaters are profiled after the startup
+        :param clock: (optional, PlaybackClock) clock shared with other servers, e.g. the partitions of a cluster. The
+        speed is taken from the clock. Default: a clock over the files of the recorders
+        :param subtree: (optional, string) name of a folder below Objects holding all recorders. Default: none
         """
 
         # init super class constructors
         super().__init__()
 
-        # list of path to iba files
-        self.iba_files = list()
-
-        # dictionary containing the channels of the iba files sorted by sample rate
-        self.iba_info = dict()
+        # a node holds a single value, so the min/max envelope can not be published
+        if aggregation not in AGGREGATIONS or aggregation == 'minmax':
+            raise ValueError('Aggregation {0} can not be published.'.format(aggregation))
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError('Unknown overrun policy {0}. Use one of {1}.'.format(overrun, ', '.join(OVERRUN_POLICIES)))
+        if timing not in TIMING_MODES:
+            raise ValueError('Unknown timing mode {0}. Use one of {1}.'.format(timing, ', '.join(TIMING_MODES)))
+
+        self.endpoint = endpoint
+
+        # decimation of the published data
+        self.tbase = float(tbase)
+        self.aggregation = aggregation
+
+        # hot ingest of new iba files
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.retention = retention
+
+        # playback policy and timing of the updaters
+        self.overrun = overrun
+        self.timing = timing
+        self.spin_threshold = spin_threshold
+        self.cpu_affinity = cpu_affinity
+        self.max_tick_rate = max_tick_rate
+        self.block_speed = block_speed
+        self.recorded_timestamps = recorded_timestamps
+
+        # runtime diagnostics
+        self.metrics_port = metrics_port
+
+        # synthetic load
+        if replicas < 1:
+            raise ValueError('The number of replicas must be at least 1, got {0}.'.format(replicas))
+        self.replicas = int(replicas)
+        self.replica_offset = replica_offset
 
-        # dictionary of loaded iba data sorted by sample rate
-        self.iba_data = dict()
+        # where shall i search for files?
+        if not data_dirs:
+            data_dirs = [os.path.join(os.getcwd(), 'dat')]
+
+        # one recorder for each directory of iba files
+        self.recorders = list()
+        for data_dir in data_dirs:
+            recorder = IbaRecorder(data_dir, tbase=self.tbase, aggregation=self.aggregation, selection=selection)
+            # make sure each recorder gets its own namespace subtree
+            names = [other.name for other in self.recorders]
+            if recorder.name in names:
+                recorder.name = '{0} {1}'.format(recorder.name, len(names) + 1)
+            self.recorders.append(recorder)
+
+        # the clock defining the playback position of all updaters of all recorders
+        if clock is None:
+            clock = PlaybackClock(PlaybackTimeline([recorder.iba_data for recorder in self.recorders]), speed=speed)
+        self._clock = clock
+        self.subtree = subtree
+
+        # channel info of each replica of each recorder. replica 0 is the channel info of the recorder itself
+        self._replica_info = dict()
+
+        # variables of the Playback object
+        self._playback_nodes = dict()
+
+        # channel info by the string NodeId of its object and value node, e.g. ns=2;s=3:12.value
+        self._node_index = dict()
 
         # handle to the actual opc ua server
         self._server = None
 
-        # dictionary of threads for each unique sample rate
+        # dictionary of threads for each recorder and unique sample rate
         self._value_updater = dict()
 
+        # threads loading the remaining and new iba files in the background
+        self._watchers = list()
+
+        # namespace index of our own namespace
+        self._ns_idx = None
+
+        # threads exposing the tick metrics of the updaters
+        self._diagnostics = None
+        self._metrics_http = None
+
+        # opt-in profiling of the startup and the updaters
+        self._profiler = Profiler(profile_dir, profile_window) if profile_dir else None
+
     def start(self):
         """The actual run function called by the Thread super class. All the magic happens here.
 
-        1. discover the iba files in the dat sub folder
+        1. discover the iba files in the directory of each recorder
         2. get channels from the iba files
         3. build the opc ua server
-        4. read the data
+        4. read the data of the first file of each recorder
         5. start the updating of the data
+        6. read the remaining (and new) files in the background
 
         :return:
         """
 
+        if self._profiler is not None:
+            self._profiler.start()
+
         # discover iba files
         print('finding iba files ...')
-        self.iba_files = self.discover_iba_files()
+        with self._phase('discover'):
+            for recorder in self.recorders:
+                recorder.iba_files = recorder.discover_iba_files()
 
-        # get channels from first iba file
+        # get the union of the channels of all iba files
         print('receiving channel info ...')
-        self.iba_info = self.get_file_info(self.iba_files[0])
+        with self._phase('channel_info'):
+            for recorder in self.recorders:
+                recorder.iba_info = recorder.get_union_info(recorder.iba_files)
+                print('\t{0}: {1} files with {2} channel configuration(s).'.format(
+                    recorder.name, len(recorder.iba_files), recorder.schema_count))
 
         # build the opc server
         print('building opc server ...')
-        self.init_opc()
+        with self._phase('init_opc'):
+            self.init_opc()
 
-        # start the server
-        print('starting opc server ...')
-        self._server.start()
+        # read the first file of each recorder in parallel. playback can start as soon as they are available
+        print('reading iba data ...')
+        with self._phase('read_first_files'), ThreadPoolExecutor(max_workers=len(self.recorders)) as pool:
+            list(pool.map(lambda recorder: recorder.append_iba_file(recorder.iba_files[0]), self.recorders))
 
-        # create the value updater
-        self._write_values()
+        self.serve()
+        self._start_loaders()
 
+    def _start_loaders(self):
+        """Decodes the remaining files in the background and appends them to the playback. With watch new files are
+        appended as well.
 
-    def discover_iba_files(self):
-        """Call to get a list of iba files in the dat sub directory.
+        :return: None
+        """
 
-        :return: list of paths to iba files
-        :raises: FileNotFoundError
+        if self.watch:
+            for recorder in self.recorders:
+                watcher = IbaFileWatcher(recorder.directory, functools.partial(self._append_watched_file, recorder),
+                                         known_files=recorder.iba_files[:1], pending_files=recorder.iba_files[1:],
+                                         poll_interval=self.poll_interval)
+                watcher.start()
+                self._watchers.append(watcher)
+        else:
+            # one loader per recorder, so the timeline of all recorders grows evenly
+            for recorder in self.recorders:
+                Thread(target=self._load_remaining_files, args=(recorder,), name='IbaFileLoader_' + recorder.name,
+                       daemon=True).start()
+
+    def serve(self):
+        """Starts the opc server, the updaters and the diagnostics. The address space must have been built by init_opc
+        and the first file of each recorder must be loaded.
+
+        :return: None
         """
 
-        # where shall i search for files?
-        iba_path = os.path.join(os.getcwd(), 'dat')
+        # start the server
+        print('starting opc server ...')
+        with self._phase('start_server'):
+            self._server.start()
 
-        # get the list of iba files
-        file_list = getSortedIbaFiles(iba_path, scan_sub_folders=False)
+        # create the value updater
+        with self._phase('start_updaters'):
+            self._write_values()
 
-        # check if any files have been found
-        if not file_list:
-            raise FileNotFoundError('Could not find any files at ''{}''.'.format(file_list))
+        # expose the tick metrics of the updaters
+        with self._phase('start_diagnostics'):
+            self._start_diagnostics()
 
-        # TODO: check if all iba files have the same channel configuration. If not this will create problems!
+        if self._profiler is not None:
+            self._profiler.startup_done(list(self._value_updater.values()))
 
-        return file_list
+    @property
+    def speed(self):
+        """Factor by which the playback runs faster than real time."""
 
+        return self._clock.speed
 
-    def get_file_info(self, iba_file):
-        """Returns a dict containing all modules defined in the iba file as well as the dictionary with channels group
-        by their sample rate.
+    def _phase(self, name):
+        """Returns a context manager measuring the startup phase of the given name if the profiling is enabled."""
 
-        :param iba_file: (madatory, string) path to a iba files
-        :return: dict with keys: modules (dict), channel (dict)
-        """
+        if self._profiler is None:
+            return contextlib.nullcontext()
+        return self._profiler.phase(name)
 
-        # get the actual info
-        channel_info = get_channel_info(iba_file)
+    def stop(self):
+        """Stops the playback and the opc ua server.
+
+        :return: None
+        """
 
-        # loop over the file to store the info
-        modules = dict()
-        channels = dict()
-        for name, chan in channel_info.items():
-            # ignore text channel
-            if chan['type'] == 'text' or '$PDA_Tbase' not in chan.keys():
-                continue
+        for watcher in self._watchers:
+            watcher.stop()
+        if self._diagnostics is not None:
+            self._diagnostics.stop()
+        if self._metrics_http is not None:
+            self._metrics_http.stop()
+        for updater in self._value_updater.values():
+            updater.stop()
+        if self._server is not None:
+            self._server.stop()
+        if self._profiler is not None:
+            self._profiler.stop()
+
+    def _append_watched_file(self, recorder, iba_file):
+        """Appends a new iba file to the playback of the recorder and evicts the files which have been played back
+        more than the retention ago.
+
+        :param recorder: (mandatory, IbaRecorder) the recorder
+        :param iba_file: (mandatory, string) path to the iba file
+        :return: None
+        """
 
-            # add fields to the channel dict for later use
-            chan['opc_obj'] = None
-            chan['opc_value'] = None
+        recorder.append_iba_file(iba_file)
+        if self.retention is not None:
+            recorder.evict_iba_files(self._clock.now_ns() - int(self.retention * 1e9))
 
-            # get module
-            full_module = '{0} {1}'.format(chan['module_no'], chan['module'])
-            if full_module not in modules.keys():
-                modules[full_module] = list()
-            modules[full_module].append(chan)
+    @staticmethod
+    def _load_remaining_files(recorder):
+        """Reads the remaining iba files of the recorder in chronological order and appends them to the playback.
 
-            # sort channel
-            cur_tbase = chan['$PDA_Tbase']
-            if cur_tbase not in channels.keys():
-                channels[cur_tbase] = list()
-            channels[cur_tbase].append(chan)
+        :param recorder: (mandatory, IbaRecorder) the recorder
+        :return: None
+        """
 
-        return {'modules': modules, 'channels': channels}
+        for iba_file in recorder.iba_files[1:]:
+            try:
+                recorder.append_iba_file(iba_file)
+            except Exception as e:
+                print('could not read {0}: {1}'.format(iba_file, e))
 
     def init_opc(self):
         """Initializes the actual OPC Server and creates all folder, nodes, etc.
@@ -130,7 +312,7 @@ class IbaToUaServer():
         """
 
         self._server = Server()
-        self._server.set_endpoint("opc.tcp://localhost:4840/sms-digital/iba-playback/")
+        self._server.set_endpoint(self.endpoint)
         self._server.set_server_name("iba Files Playback OPC UA Server")
 
         # set all possible endpoint policies for clients to connect through
@@ -142,37 +324,160 @@ class IbaToUaServer():
         # setup our own namespace
         uri = "http://iba-playback.sms-digital.io"
         idx = self._server.register_namespace(uri)
+        self._ns_idx = idx
+
+        root = self._server.nodes.objects
+        if self.subtree is not None:
+            root = root.add_folder(*string_node(idx, self.subtree, self.subtree))
+
+        for recorder in self.recorders:
+            # each recorder gets its own subtree if there is more than one
+            if len(self.recorders) == 1:
+                parent = root
+                prefix = ''
+            else:
+                print('\tRecorder: {} ...'.format(recorder.name))
+                parent = root.add_folder(*string_node(idx, recorder.name, recorder.name))
+                prefix = recorder.name + '/'
+            self.init_modules(parent, idx, recorder.iba_info, prefix)
+
+            # the replicas get their own copy of the modules next to the original ones
+            self._replica_info[recorder.name] = [recorder.iba_info]
+            for replica in range(1, self.replicas):
+                print('\tReplica: {} ...'.format(replica))
+                iba_info = recorder.replicate_info()
+                name = 'Replica {0}'.format(replica)
+                self.init_modules(parent.add_folder(*string_node(idx, prefix + name, name)), idx, iba_info,
+                                  prefix + name + '/')
+                self._replica_info[recorder.name].append(iba_info)
+
+        # add the playback controls
+        self.init_playback_controls(self._server.nodes.objects, idx)
+
+    def init_modules(self, parent, idx, iba_info, prefix=''):
+        """Adds the Modules folder with a folder for each module and an object for each channel. The NodeIds are
+        strings derived from the module number and the channel number, e.g. ns=2;s=3:12 for the channel object and
+        ns=2;s=3:12.value for its value, so they stay the same across restarts and clients can cache them. If the
+        number of a channel is taken by another channel of the module, its name is used instead, e.g. 3:Speed.
+
+        :param parent: (mandatory, opcua.Node) node the Modules folder is added to
+        :param idx: (mandatory, int) namespace index
+        :param iba_info: (mandatory, dict) channel info of a recorder, see IbaRecorder.get_union_info
+        :param prefix: (optional, string) prefix of the NodeIds, e.g. of a replica
+        :return: None
+        """
 
         # add modules folder
-        modules = self._server.nodes.objects.add_folder(idx, "Modules")
-        for module, channel in self.iba_info['modules'].items():
+        modules = parent.add_folder(*string_node(idx, prefix + 'Modules', 'Modules'))
+        used = set()
+        for module, channel in iba_info['modules'].items():
             print('\tModule: {} ...'.format(module))
             # create a new folder for the module
-            module_folder = modules.add_folder(idx, module)
+            module_id = '{0}Modules/{1}'.format(prefix, channel[0]['module_no'])
+            module_folder = modules.add_folder(*string_node(idx, module_id, module))
 
             # create a folder for analog and digital signals
-            analog_folder = module_folder.add_folder(idx, 'Analog')
-            digital_folder = module_folder.add_folder(idx, 'Digital')
+            analog_folder = module_folder.add_folder(*string_node(idx, module_id + '/Analog', 'Analog'))
+            digital_folder = module_folder.add_folder(*string_node(idx, module_id + '/Digital', 'Digital'))
 
             # add the channel
             for chan in channel:
+                chan_id = '{0}{1}:{2}'.format(prefix, chan['module_no'], chan['no'])
+                if chan_id in used:
+                    chan_id = '{0}{1}:{2}'.format(prefix, chan['module_no'], chan['name'])
+                used.add(chan_id)
+
                 # create channel
                 if chan['type'] == 'analog':
-                    opc_channel = analog_folder.add_object(idx, chan['name'])
+                    opc_channel = analog_folder.add_object(*string_node(idx, chan_id, chan['name']))
                     val = 0.0
                 else:
-                    opc_channel = digital_folder.add_object(idx, chan['name'])
+                    opc_channel = digital_folder.add_object(*string_node(idx, chan_id, chan['name']))
                     val = False
 
                 # define the channel object
-                value_var = opc_channel.add_variable(idx, "value", val)
+                value_var = opc_channel.add_variable(*string_node(idx, chan_id + '.value', 'value'), val)
                 value_var.set_writable(True)
                 for key, val in chan.items():
-                    opc_channel.add_variable(idx, key, val).set_writable(False)
+                    opc_channel.add_variable(*string_node(idx, '{0}.{1}'.format(chan_id, key), key),
+                                             val).set_writable(False)
 
                 # store the handles to the value variable and the opc_channel in the channel dict
                 chan['opc_obj'] = opc_channel
                 chan['opc_value'] = value_var
+                self._node_index[opc_channel.nodeid.to_string()] = chan
+                self._node_index[value_var.nodeid.to_string()] = chan
+
+    def find_channel(self, node_id):
+        """Returns the channel info of a channel object or value node without browsing.
+
+        :param node_id: (mandatory, string or ua.NodeId) NodeId of the node, e.g. 'ns=2;s=3:12.value'
+        :return: (dict) the channel info or None if the node is not a channel
+        """
+
+        if isinstance(node_id, ua.NodeId):
+            node_id = node_id.to_string()
+        return self._node_index.get(node_id)
+
+    def init_playback_controls(self, parent, idx):
+        """Adds the Playback object with the methods Play, Pause, Seek(time) and SetSpeed(factor).
+
+        :param parent: (mandatory, opcua.Node) node the Playback object is added to
+        :param idx: (mandatory, int) namespace index
+        :return: None
+        """
+
+        clock = self._clock
+
+        @uamethod
+        def play(parent):
+            clock.play()
+            self._update_playback_nodes()
+
+        @uamethod
+        def pause(parent):
+            clock.pause()
+            self._update_playback_nodes()
+
+        @uamethod
+        def seek(parent, time):
+            clock.seek(datetime_to_ns(time))
+            self._update_playback_nodes()
+
+        @uamethod
+        def set_speed(parent, factor):
+            # an exception raised by a method reaches the client as BadUnexpectedError, a returned status code as is
+            if factor <= 0:
+                return ua.StatusCode(ua.StatusCodes.BadInvalidArgument)
+            clock.set_speed(factor)
+            self._update_playback_nodes()
+
+        playback = parent.add_object(*string_node(idx, 'Playback', 'Playback'))
+        playback.add_method(*string_node(idx, 'Playback.Play', 'Play'), play, [], [])
+        playback.add_method(*string_node(idx, 'Playback.Pause', 'Pause'), pause, [], [])
+        playback.add_method(*string_node(idx, 'Playback.Seek', 'Seek'), seek, [ua.VariantType.DateTime], [])
+        playback.add_method(*string_node(idx, 'Playback.SetSpeed', 'SetSpeed'), set_speed, [ua.VariantType.Double],
+                            [])
+
+        self._playback_nodes = {
+            'state': playback.add_variable(*string_node(idx, 'Playback.State', 'State'), 'Playing'),
+            'speed': playback.add_variable(*string_node(idx, 'Playback.Speed', 'Speed'), clock.speed),
+            'time': playback.add_variable(*string_node(idx, 'Playback.PlaybackTime', 'PlaybackTime'),
+                                          ns_to_datetime(time.time_ns())),
+        }
+
+    def _update_playback_nodes(self):
+        """Copies the state of the playback clock to the variables of the Playback object.
+
+        :return: None
+        """
+
+        if not self._playback_nodes or not len(self._clock.timeline):
+            return
+
+        self._playback_nodes['state'].set_value('Paused' if self._clock.paused else 'Playing')
+        self._playback_nodes['speed'].set_value(self._clock.speed)
+        self._playback_nodes['time'].set_value(ns_to_datetime(self._clock.now_ns()), ua.VariantType.DateTime)
 
     def _write_values(self):
         """Spawn a thread for each sample rate
@@ -180,43 +485,141 @@ class IbaToUaServer():
         :return:
         """
 
-        for sampleRate, channel in self.iba_info['channels'].items():
+        self._clock.start()
+
+        # phase shift between two replicas
+        if self.replica_offset is not None:
+            offset_ns = int(self.replica_offset * 1e9)
+        else:
+            offset_ns = (self._clock.timeline.end_ns - self._clock.timeline.start_ns) // self.replicas
+
+        for recorder in self.recorders:
+            for replica, iba_info in enumerate(self._replica_info[recorder.name]):
+                clock = self._clock if replica == 0 else ShiftedClock(self._clock, replica * offset_ns)
+                for sampleRate, channel in iba_info['channels'].items():
+                    period = recorder.publish_period(sampleRate)
+                    name = 'Updater'
+                    if len(self.recorders) > 1:
+                        name += '_{}'.format(recorder.name)
+                    if replica > 0:
+                        name += '_replica{}'.format(replica)
+                    # the rate key is unique within the recorder, the period is not if tbase decimates several rates
+                    name += '_{}'.format(sampleRate)
+
+                    # todo: split large files with many channel with the same samplerate into multiple threads
+
+                    # create variable update. all replicas share the data of the queue
+                    updater = self._create_updater(server=self._server, channel=channel, period=period,
+                                                   queue=recorder.iba_data, rate=sampleRate, clock=clock,
+                                                   overrun=self.overrun,
+                                                   sleeper=Sleeper(self.timing, self.spin_threshold,
+                                                                   self.cpu_affinity),
+                                                   max_tick_rate=self.max_tick_rate, block_speed=self.block_speed,
+                                                   recorded_timestamps=self.recorded_timestamps, name=name)
+                    self._value_updater[(recorder.name, replica, sampleRate)] = updater
+                    updater.start()
+
+    def _create_updater(self, **kwargs):
+        """Returns the updater of a sample rate, see VariableUpdater for the arguments.
+
+        :return: (VariableUpdater)
+        """
 
-            # read the data
-            channels = list()
-            for chan in channel:
-                channels.append(chan['id'])
+        return VariableUpdater(**kwargs)
 
-            # TODO: Deal with multiple files
-            data = readIbaFile(self.iba_files[0], channels=channels, names=channels)
+    def _start_diagnostics(self):
+        """Publishes the tick metrics of the updaters in the Diagnostics folder and, if a port is configured, via the
+        Prometheus endpoint.
 
-            # todo: split large files with many channel with the same samplerate into multiple threads
+        :return: None
+        """
+
+        metrics = [updater.metrics for updater in self._value_updater.values()]
+
+        self._diagnostics = DiagnosticsPublisher(self._server.nodes.objects, self._ns_idx, metrics,
+                                                 hooks=[self._update_playback_nodes])
+        self._diagnostics.start()
 
-            # create variable update
-            VariableUpdater(server=self._server, channel=channel, period=float(sampleRate), data=data).start()
+        if self.metrics_port is not None:
+            print('serving metrics on http://127.0.0.1:{0}/metrics ...'.format(self.metrics_port))
+            self._metrics_http = MetricsHttpServer(metrics, port=self.metrics_port)
+            self._metrics_http.start()
 
 
 class VariableUpdater(Thread):
-    """The VariableUpdater is used to periodically update the values on the opc server."""
+    """The VariableUpdater is used to periodically update the values on the opc server. The published sample is
+    derived from the playback clock, so a slow tick never lets the playback fall behind the real time. What happens
+    with the samples of a tick which overran its period is defined by the overrun policy:
+
+    * skip: publish the current sample, the missed ones are dropped
+    * burst: publish all missed samples in order with the next tick
+    * degrade: publish the current sample and halve the publish rate of the group until the ticks are on time again
+
+    If the playback runs faster than real time, the updater ticks faster as well, but at most max_tick_rate times per
+    second. From block_speed on, all samples passed within a tick are published as a block.
+    """
 
-    def __init__(self, server, channel, period, data):
+    def __init__(self, server, channel, period, queue, rate, clock, overrun='skip', max_burst=100, max_degrade=16,
+                 recover_ticks=100, sleeper=None, max_tick_rate=1000, block_speed=None, recorded_timestamps=False,
+                 name=None):
         """
 
         :param channel: (mandatory, list) list with the channels
         :param period: (mandatory, float) the actual sample period
-        :param data: (mandatory, pandas.DataFrame) the loaded data
+        :param queue: (mandatory, PlaybackQueue) the loaded data of all files
+        :param rate: (mandatory, string) the sample rate of the channels, i.e. the key of their data in the queue
+        :param clock: (mandatory, PlaybackClock) the clock defining the current playback position
+        :param overrun: (optional, string) overrun policy, one of OVERRUN_POLICIES
+        :param max_burst: (optional, int) maximal number of missed samples published at once by the burst policy
+        :param max_degrade: (optional, int) maximal factor by which the degrade policy reduces the publish rate
+        :param recover_ticks: (optional, int) number of ticks on time before the degrade policy doubles the rate again
+        :param sleeper: (optional, Sleeper) waits for the next tick. Default: plain sleep
+        :param max_tick_rate: (optional, float) maximal number of ticks per second
+        :param block_speed: (optional, float) speed from which on all samples passed within a tick are published
+        :param recorded_timestamps: (optional, bool) use the recorded time of the samples as source timestamp
+        :param name: (optional, string) name of the thread. Default: Updater_<period>
         """
 
-        super().__init__(name='Updater_{}'.format(period))
+        super().__init__(name=name if name is not None else 'Updater_{}'.format(period))
+
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError('Unknown overrun policy {0}. Use one of {1}.'.format(overrun, ', '.join(OVERRUN_POLICIES)))
 
         self.server = server
         self.channel = channel
         self.period = period
-        self.data = data
+        self.queue = queue
+        self.rate = rate
+        self.clock = clock
+        self.overrun = overrun
+        self.max_burst = max_burst
+        self.max_degrade = max_degrade
+        self.recover_ticks = recover_ticks
+        self.sleeper = sleeper if sleeper is not None else Sleeper()
+        self.block_speed = block_speed
+        self.recorded_timestamps = recorded_timestamps
+
+        # current file of the queue and last published sample within its data
+        self._entry = None
+        self._idx = -1
+        self.data = None
+        self.time_axis = None
+
+        # value node, data column and digital flag of each channel contained in the current file
+        self._present = list()
+
+        # tick duration, jitter, overruns, writes and position
+        self.metrics = TickMetrics(self.name, period)
+
+        # current reduction of the publish rate by the degrade policy and ticks on time since the last overrun
+        self._degrade = 1
+        self._on_time = 0
 
         # timer stuff
         self._close_event = Event()
-        self._nextCall = time.time()
+        self._period_ns = int(round(period * 1e9))
+        self._min_tick_ns = int(1e9 / max_tick_rate)
+        self._nextCall = time.monotonic_ns()
 
     def run(self):
         """This method will make
@@ -226,35 +629,268 @@ class VariableUpdater(Thread):
 
         print('Started VariableUpdater {}'.format(self.name))
 
-        idx = 0
+        self.sleeper.prepare_thread()
+
+        late = False
+        self._nextCall = time.monotonic_ns()
         while not self._close_event.is_set():
-            # store information about the next call
-            self._nextCall = time.time()
+            wakeup = time.monotonic_ns()
 
             # do your tasks here
-            for chan in self.channel:
-                # faster than chan['opc_value'].set_value(9.9)
-                chan['opc_value'].set_value(self.data[chan['id']][idx])
-                # self.server.set_attribute_value(chan['opc_value'].nodeid, ua.DataValue(self.data[chan['id']][idx]))
-
-            # increase index
-            idx += 1
-            if idx > self.data.shape[0]:
-                idx = 0
+            writes = self._tick(self.clock.now_ns(), late)
+            self.metrics.record(time.monotonic_ns() - wakeup, wakeup - self._nextCall, writes)
 
             # sleep until next execution
-            self._nextCall = self._nextCall + self.period
-            sleepLength = self._nextCall - time.time()
-            if sleepLength > 0:
-                time.sleep(sleepLength)
+            late = self._schedule()
+            if not late:
+                self.sleeper.sleep_until(self._nextCall)
+
+    def _schedule(self):
+        """Computes the time of the next tick. The tick rate follows the playback speed up to the max tick rate.
+
+        :return: (bool) True if the next tick is already due, i.e. the current tick overran its period
+        """
+
+        self._nextCall += max(int(self._period_ns * self._degrade / self.clock.speed), self._min_tick_ns)
+        if self._nextCall > time.monotonic_ns():
+            self._on_time += 1
+            if self._degrade > 1 and self._on_time >= self.recover_ticks:
+                self._degrade //= 2
+                self._on_time = 0
+            return False
+
+        # the position is taken from the clock, so the missed ticks are not caught up
+        self.metrics.overruns += 1
+        self._on_time = 0
+        if self.overrun == 'degrade':
+            self._degrade = min(self._degrade * 2, self.max_degrade)
+        self._nextCall = time.monotonic_ns()
+        return True
+
+    def _tick(self, time_ns, late=False):
+        """Publishes the sample(s) of the given recorded time.
+
+        :param time_ns: (mandatory, int) recorded time in ns since epoch
+        :param late: (optional, bool) whether the previous tick overran its period
+        :return: (int) number of written values
+        """
+
+        self.metrics.position_ns = time_ns
+
+        # continue with the next file at the end of the current one
+        entry = self.queue.locate(time_ns)
+        if entry is not self._entry:
+            self._load_file(entry)
+        if entry is None:
+            return 0
+
+        idx = self.time_axis.index_of(time_ns)
+        if idx == self._idx:
+            return 0
+
+        # the file contains none of the channels, they have been published as bad by _load_file
+        if not self._present:
+            self._idx = idx
+            return 0
+
+        # samples between the last and the current tick have not been published. they are expected at high speeds
+        # or a degraded rate, but missed if the previous tick was late
+        first = idx
+        if 0 <= self._idx < idx - 1:
+            if late:
+                self.metrics.missed_samples += idx - self._idx - 1
+            if (late and self.overrun == 'burst') or \
+                    (self.block_speed is not None and self.clock.speed >= self.block_speed):
+                first = max(self._idx + 1, idx - self.max_burst + 1)
+
+        for sample in range(first, idx + 1):
+            self._publish(sample)
+        self._idx = idx
+
+        return (idx + 1 - first) * len(self._present)
+
+    def _publish(self, idx):
+        """Writes the idx-th sample of the current file to the opc server."""
+
+        row = self.data[idx].tolist()
+
+        if self.recorded_timestamps:
+            source_timestamp = ns_to_datetime(self.time_axis.start_ns + idx * self.time_axis.period_ns)
+            for opc_value, col, digital in self._present:
+                variant = ua.Variant(row[col] != 0.0 if digital else row[col])
+                opc_value.set_value(ua.DataValue(variant, sourceTimestamp=source_timestamp))
+            return
+
+        # the data is float64, digital values are published as Boolean like the nodes were created
+        for opc_value, col, digital in self._present:
+            # faster than chan['opc_value'].set_value(9.9)
+            opc_value.set_value(row[col] != 0.0 if digital else row[col])
+            # self.server.set_attribute_value(opc_value.nodeid, ua.DataValue(row[col]))
+
+    def _load_file(self, entry):
+        """Continues the playback with the given file of the queue. Channels which are not contained in the file are
+        published once with a bad status instead of keeping their stale values. Between two files all channels are
+        bad."""
+
+        self._entry = entry
+        self._idx = -1
+        self._present = list()
+        if entry is None:
+            self.data = None
+            remap = [-1] * len(self.channel)
+        else:
+            self.data = entry['data'][self.rate]
+            self.time_axis = entry['time_axis'][self.rate]
+            remap = entry['remap'][self.rate]
+
+        for chan, col in zip(self.channel, remap):
+            if col >= 0:
+                self._present.append((chan['opc_value'], int(col), chan['type'] != 'analog'))
             else:
-                print('{0}: Sample rate exceeded by {1:.2f}ms.'.format(self.name, abs(sleepLength)*1000))
+                chan['opc_value'].set_value(ua.DataValue(ua.Variant(None), ua.StatusCode(ua.StatusCodes.BadNoData),
+                                                         sourceTimestamp=ns_to_datetime(time.time_ns())))
+
+    @property
+    def playback_time(self):
+        """The recorded time of the sample which is currently published."""
+
+        if self.time_axis is None:
+            return None
+        return self.time_axis[min(max(self._idx, 0), len(self.time_axis) - 1)]
 
     def stop(self):
         """Call to stop the timer"""
 
         self._close_event.set()
 
+
 if __name__ == "__main__":
-    the_server = IbaToUaServer()
-    the_server.start()
+    parser = argparse.ArgumentParser(description='Plays back the iba files of the dat folder on an OPC UA server.')
+    parser.add_argument('--config', default=None,
+                        help='ini file with the server options, the channel selection and per module publish rates. '
+                             'Options given on the command line take precedence.')
+    parser.add_argument('--endpoint', default=ENDPOINT, help='endpoint url of the server (default: {0})'.format(
+        ENDPOINT.replace('%', '%%')))
+    parser.add_argument('--data-dir', action='append', dest='data_dirs', default=None,
+                        help='directory of the iba files of a recorder. Repeat for several time aligned recorders '
+                             '(default: dat)')
+    parser.add_argument('--backend', default=None, choices=BACKENDS,
+                        help='library decoding the iba files. synthetic generates data for testing '
+                             '(default: $PYIBATOOLS_BACKEND or lite)')
+    parser.add_argument('--tbase', type=float, default=0,
+                        help='publish rate in seconds for channels faster than tbase (default: native rate)')
+    parser.add_argument('--aggregation', default='first', choices=[agg for agg in AGGREGATIONS if agg != 'minmax'],
+                        help='how the samples within one tbase are reduced (default: first)')
+    parser.add_argument('--watch', action='store_true',
+                        help='watch the data directories and append new iba files to the playback')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help='seconds between two scans of the dat folder if inotify is not available (default: 1)')
+    parser.add_argument('--retention', type=float, default=3600.0,
+                        help='seconds of recorded time the files are kept behind the playback position with --watch '
+                             '(default: 3600)')
+    parser.add_argument('--overrun', default='skip', choices=OVERRUN_POLICIES,
+                        help='what to do with samples which could not be published in time (default: skip)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve the tick metrics for Prometheus on http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--timing', default='sleep', choices=TIMING_MODES,
+                        help='how the updaters wait for their next tick (default: sleep)')
+    parser.add_argument('--spin-threshold', type=float, default=0.002,
+                        help='seconds before a tick at which the precise timing starts spinning (default: 0.002)')
+    parser.add_argument('--cpu-affinity', type=lambda cpus: [int(cpu) for cpu in cpus.split(',')], default=None,
+                        help='comma separated CPUs the updater threads are pinned to (Linux only)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='factor by which the playback runs faster than real time (default: 1)')
+    parser.add_argument('--max-tick-rate', type=float, default=1000,
+                        help='maximal number of ticks per second of each sample rate (default: 1000)')
+    parser.add_argument('--block-speed', type=float, default=None,
+                        help='speed from which on all samples passed within a tick are published as a block')
+    parser.add_argument('--recorded-timestamps', action='store_true',
+                        help='use the recorded time of the samples as source timestamp')
+    parser.add_argument('--replicas', type=int, default=1,
+                        help='publish the channels N times with phase shifted playback positions for load testing '
+                             '(default: 1)')
+    parser.add_argument('--replica-offset', type=float, default=None,
+                        help='seconds of recorded time between two replicas (default: spread evenly over the data)')
+    parser.add_argument('--profile', default=os.environ.get(PROFILE_ENV), metavar='DIR',
+                        help='write startup timings, cProfile stats and stack samples to DIR '
+                             '(default: ${0})'.format(PROFILE_ENV))
+    parser.add_argument('--profile-window', type=float, default=30.0,
+                        help='seconds the updaters are profiled after the startup (default: 30)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only read the headers of the iba files, benchmark the publish path and print a JSON '
+                             'report of the expected load and memory instead of starting the server')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='partition the modules across N server processes on consecutive ports sharing the decoded '
+                             'data and the playback clock (default: 1)')
+    parser.add_argument('--engine', default='threaded', choices=ENGINES,
+                        help='threaded runs an updater thread per sample rate on python-opcua, asyncio runs the '
+                             'updaters as coroutines on the event loop of an asyncua server (default: threaded)')
+
+    # the config file provides the defaults of the command line options
+    selection = None
+    data_dirs = None
+    config_file = parser.parse_known_args()[0].config
+    if config_file is not None:
+        try:
+            options, selection = read_config(config_file, parser)
+        except ValueError as e:
+            parser.error(str(e))
+        # --data-dir appends to its default, so the directories of the config file are only used without it
+        data_dirs = options.pop('data_dirs', None)
+        parser.set_defaults(**options)
+    args = parser.parse_args()
+
+    if args.backend is not None:
+        set_backend(args.backend)
+
+    if args.dry_run:
+        import json
+        from capacity import capacity_report
+
+        the_server = IbaToUaServer(data_dirs=args.data_dirs or data_dirs, endpoint=args.endpoint, selection=selection,
+                                   tbase=args.tbase, aggregation=args.aggregation, speed=args.speed,
+                                   max_tick_rate=args.max_tick_rate, block_speed=args.block_speed,
+                                   recorded_timestamps=args.recorded_timestamps, replicas=args.replicas,
+                                   timing=args.timing, spin_threshold=args.spin_threshold,
+                                   cpu_affinity=args.cpu_affinity)
+        print(json.dumps(capacity_report(the_server, workers=args.workers, engine=args.engine), indent=2))
+    elif args.workers > 1:
+        if args.engine != 'threaded':
+            parser.error('--workers supports the threaded engine only')
+
+        from cluster import IbaCluster
+
+        data_dirs = args.data_dirs or data_dirs or [os.path.join(os.getcwd(), 'dat')]
+        if len(data_dirs) > 1:
+            parser.error('--workers supports a single data directory')
+
+        cluster = IbaCluster(data_dirs[0], args.workers, endpoint=args.endpoint, selection=selection, tbase=args.tbase,
+                             aggregation=args.aggregation, watch=args.watch, poll_interval=args.poll_interval,
+                             retention=args.retention, speed=args.speed, metrics_port=args.metrics_port,
+                             profile_dir=args.profile,
+                             overrun=args.overrun, timing=args.timing, spin_threshold=args.spin_threshold,
+                             cpu_affinity=args.cpu_affinity, max_tick_rate=args.max_tick_rate,
+                             block_speed=args.block_speed, recorded_timestamps=args.recorded_timestamps,
+                             replicas=args.replicas, replica_offset=args.replica_offset,
+                             profile_window=args.profile_window)
+        try:
+            cluster.start()
+            cluster.join()
+        finally:
+            cluster.stop()
+    else:
+        server_class = IbaToUaServer
+        if args.engine == 'asyncio':
+            from async_engine import AsyncIbaToUaServer
+            server_class = AsyncIbaToUaServer
+
+        the_server = server_class(data_dirs=args.data_dirs or data_dirs, endpoint=args.endpoint, selection=selection,
+                                  tbase=args.tbase, aggregation=args.aggregation, watch=args.watch,
+                                  poll_interval=args.poll_interval, retention=args.retention, overrun=args.overrun,
+                                  metrics_port=args.metrics_port, timing=args.timing,
+                                  spin_threshold=args.spin_threshold, cpu_affinity=args.cpu_affinity,
+                                  speed=args.speed, max_tick_rate=args.max_tick_rate, block_speed=args.block_speed,
+                                  recorded_timestamps=args.recorded_timestamps, replicas=args.replicas,
+                                  replica_offset=args.replica_offset, profile_dir=args.profile,
+                                  profile_window=args.profile_window)
+        the_server.start()
@@ -0,0 +1,36 @@
+"""Tests of the backends of pyIbaTools. Run from within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from pyIbaTools.backends import IbaBackend, ModuleBackend, SyntheticBackend, CachedBackend, create_backend
+
+
+def test_incomplete_backend_can_not_be_created():
+    class ReaderOnlyBackend(IbaBackend):
+        name = 'reader only'
+
+        def FileReader(self):
+            return None
+
+    with pytest.raises(TypeError, match='isCurrentPDA'):
+        ReaderOnlyBackend()
+    with pytest.raises(TypeError):
+        IbaBackend()
+
+
+def test_backends_implement_the_interface():
+    # the ibaFiles libraries are only available on Windows, so the ModuleBackend is checked by its class
+    for backend_class in (ModuleBackend, SyntheticBackend, CachedBackend):
+        assert not backend_class.__abstractmethods__
+
+    backend = CachedBackend(create_backend('synthetic'))
+    assert isinstance(backend.backend, SyntheticBackend)
+    assert backend.name == 'cached synthetic'
+    assert backend.ChannelId is SyntheticBackend.ChannelId
+    assert backend.isCurrentPDA('synthetic_0000.dat') is False
+    assert not backend.FileReader().IsOpen()
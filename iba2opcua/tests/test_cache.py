@@ -0,0 +1,39 @@
+"""Tests of the cache of decoded channel data. Run from within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from pyIbaTools.pyIbaTools import set_backend, set_cache, readIbaFile
+from pyIbaTools.backends import write_synthetic_file, CachedBackend
+from pyIbaTools.cache import nbytes
+
+
+def test_cached_backend_wraps_a_decoded_cache(tmp_path):
+    iba_file = str(tmp_path / 'synthetic_0000.dat')
+    write_synthetic_file(iba_file, datetime(2019, 1, 1), duration=2.0, modules=1, channels=4)
+    set_cache(None)
+    backend = set_backend('synthetic', cached=True)
+    try:
+        assert isinstance(backend, CachedBackend)
+        first = readIbaFile(iba_file, channels=['0:0', '0:1'], caching=False)
+        second = readIbaFile(iba_file, channels=['0:1', '0:2'], caching=False)
+    finally:
+        set_backend(None)
+        set_cache(None)
+
+    assert backend.cache.stats()['misses'] == 3
+    assert backend.cache.stats()['hits'] == 1
+    assert (first['Signal_0_1'] == second['Signal_0_1']).all()
+
+
+def test_nbytes_counts_a_shared_array_once():
+    data = np.zeros(1000, dtype=np.float32)
+    assert nbytes(data) == 4000
+    # 'minmax' at the rate of the file returns the same array as min and max
+    assert nbytes((data, data)) == 4000
+    assert nbytes((data, data.copy())) == 8000
@@ -0,0 +1,74 @@
+"""Tests of the dry run of the server. Run from within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime
+import numpy as np
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import capacity
+from capacity import capacity_report
+from pyIbaTools.pyIbaTools import set_backend
+from pyIbaTools.backends import write_synthetic_file
+from server import IbaToUaServer
+from async_engine import Server as AsyncServer
+
+
+@pytest.fixture(autouse=True)
+def synthetic_backend():
+    set_backend('synthetic')
+    yield
+    set_backend(None)
+
+
+@pytest.fixture
+def small_fast_group(tmp_path):
+    """A file with a 1 ms group of 8 channels and a 0.1 s group of 100 channels."""
+
+    write_synthetic_file(str(tmp_path / 'synthetic_0000.dat'), datetime(2019, 1, 1), duration=2.0, modules=1,
+                         channels=8, rates=(0.001,), digital=0)
+    write_synthetic_file(str(tmp_path / 'synthetic_0001.dat'), datetime(2019, 1, 1, 0, 0, 2), duration=2.0,
+                         modules=2, channels=100, rates=(0.1,), digital=0, offset=2.0)
+    return str(tmp_path)
+
+
+def test_fixed_tick_cost_makes_a_small_fast_group_late(small_fast_group, monkeypatch):
+    engines = list()
+
+    # a tick costs 30 us plus 2 us per channel, 1 % of the wakeups are 0.98 ms late
+    def benchmark_publish(channels, seconds, recorded_timestamps, engine):
+        engines.append(engine)
+        return {'channels': channels, 'tick_seconds': 30e-6 + 2e-6 * channels}
+
+    def benchmark_wakeup(period, seconds, engine, timing, spin_threshold, cpu_affinity):
+        engines.append(engine)
+        return np.array([100e-6] * 99 + [980e-6])
+
+    monkeypatch.setattr(capacity, 'benchmark_publish', benchmark_publish)
+    monkeypatch.setattr(capacity, 'benchmark_wakeup', benchmark_wakeup)
+    report = capacity_report(IbaToUaServer(data_dirs=[small_fast_group]), engine='asyncio')
+
+    assert engines == ['asyncio'] * 3
+    assert report['benchmark']['fixed_tick_seconds'] == pytest.approx(30e-6)
+    groups = {group['rate']: group for group in report['recorders'][0]['groups']}
+    assert groups['0.001']['tick_seconds'] == pytest.approx(46e-6)
+    assert groups['0.001']['overrun_ratio'] == pytest.approx(0.01)
+    assert groups['0.1']['fits_period']
+
+    # the load alone is far below a core, but the 1 ms group overruns
+    assert report['prediction']['utilization'] < 0.2
+    assert report['prediction']['late_groups'] == [os.path.basename(small_fast_group) + '/0.001']
+    assert not report['prediction']['keeps_up']
+
+
+@pytest.mark.parametrize('engine', ['threaded', pytest.param('asyncio', marks=pytest.mark.skipif(
+    AsyncServer is None, reason='asyncua is not installed'))])
+def test_benchmarks_of_the_engines(engine):
+    result = capacity.benchmark_publish(4, 0.05, engine=engine)
+    assert result['ticks'] > 0 and result['writes'] == 4 * result['ticks']
+
+    latency = capacity.benchmark_wakeup(0.005, 0.05, engine=engine)
+    assert latency.shape == (10,) and (latency >= 0).all()
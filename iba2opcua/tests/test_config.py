@@ -0,0 +1,61 @@
+"""Tests of the configuration file of the server. Run from within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import argparse
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from config import read_config
+from server import ENGINES, OVERRUN_POLICIES
+
+
+@pytest.fixture
+def arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data-dir', action='append', dest='data_dirs', default=None)
+    parser.add_argument('--overrun', default='skip', choices=OVERRUN_POLICIES)
+    parser.add_argument('--engine', default='threaded', choices=ENGINES)
+    parser.add_argument('--watch', action='store_true')
+    parser.add_argument('--cpu-affinity', type=lambda cpus: [int(cpu) for cpu in cpus.split(',')], default=None)
+    parser.add_argument('--profile', default=None, metavar='DIR')
+    parser.add_argument('--profile-window', type=float, default=30.0)
+    return parser
+
+
+def write_config(tmp_path, text):
+    path = str(tmp_path / 'server.ini')
+    with open(path, 'w') as f:
+        f.write('[server]\n' + text)
+    return path
+
+
+def test_values_are_checked_against_the_choices(tmp_path, arguments):
+    path = write_config(tmp_path, 'data_dir = dat\noverrun = burst\nengine = asyncio\n')
+    options, _ = read_config(path, arguments)
+    assert options == {'data_dirs': ['dat'], 'overrun': 'burst', 'engine': 'asyncio'}
+
+    path = write_config(tmp_path, 'engine = asyncoi\n')
+    with pytest.raises(ValueError, match='engine'):
+        read_config(path, arguments)
+
+    # without the parser the values are not checked
+    assert read_config(path)[0] == {'engine': 'asyncoi'}
+
+
+def test_values_are_read_like_the_command_line_options(tmp_path, arguments):
+    path = write_config(tmp_path, 'watch = yes\ncpu-affinity = 2,3\nprofile = prof\nprofile_window = 5\n')
+    expected = {'watch': True, 'cpu_affinity': [2, 3], 'profile': 'prof', 'profile_window': 5.0}
+    assert read_config(path, arguments)[0] == expected
+    assert read_config(path)[0] == expected
+
+    path = write_config(tmp_path, 'profile_window = soon\n')
+    with pytest.raises(ValueError, match='profile_window'):
+        read_config(path, arguments)
+
+    # options of the command line only and options the server does not know are rejected
+    for text in ('config = other.ini\n', 'dry_run_typo = yes\n'):
+        with pytest.raises(ValueError, match='Unknown option'):
+            read_config(write_config(tmp_path, text), arguments)
@@ -0,0 +1,83 @@
+"""Tests of the Parquet and Arrow export. The iba files are generated by the synthetic backend. Run from within the
+iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime
+import numpy as np
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from pyIbaTools.pyIbaTools import set_backend, readIbaFile
+from pyIbaTools.backends import write_synthetic_file
+from pyIbaTools.export import export_iba_file
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+@pytest.fixture(autouse=True)
+def synthetic_backend():
+    set_backend('synthetic')
+    yield
+    set_backend(None)
+
+
+@pytest.fixture
+def iba_file(tmp_path):
+    """A file with a 1 ms, a 10 ms and a 100 ms channel over 2 s."""
+
+    path = str(tmp_path / 'synthetic_0000.dat')
+    write_synthetic_file(path, datetime(2019, 1, 1, 12), duration=2.0, modules=1, channels=3, digital=0)
+    return path
+
+
+def test_export_in_row_groups(iba_file, tmp_path):
+    # 3 channels in blocks of 2, 0.3 s per row group, so the last row group holds 0.2 s only
+    output = str(tmp_path / 'export')
+    paths = export_iba_file(iba_file, output, row_group_seconds=0.3, block_channels=2)
+
+    assert paths == [os.path.join(output, 'date=2019-01-01', 'synthetic_0000.parquet')]
+    assert os.listdir(output) == ['date=2019-01-01']
+
+    parquet = pq.ParquetFile(paths[0])
+    assert [parquet.metadata.row_group(num).num_rows for num in range(parquet.num_row_groups)] == [300] * 6 + [200]
+
+    table = parquet.read()
+    expected = readIbaFile(iba_file, channels='*', caching=False)
+    assert table.column_names == list(expected.columns)
+    assert (table.column('Time').to_numpy() == expected['Time'].to_numpy()).all()
+    for name in expected.columns[1:]:
+        np.testing.assert_array_equal(table.column(name).to_numpy(), expected[name].to_numpy())
+
+
+def test_export_partitions_by_native_rate(iba_file, tmp_path):
+    output = str(tmp_path / 'export')
+    paths = export_iba_file(iba_file, output, native_rates=True, export_format='arrow', row_group_seconds=0.5)
+
+    assert sorted(os.path.relpath(path, output) for path in paths) == [
+        os.path.join('rate={0}'.format(rate), 'date=2019-01-01', 'synthetic_0000.arrow')
+        for rate in ('0.001', '0.01', '0.1')]
+
+    # each table holds the channels of its rate in record batches of 0.5 s
+    for path, rows, name in zip(sorted(paths), (2000, 200, 20), ('Signal_0_0', 'Signal_0_1', 'Signal_0_2')):
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            assert reader.num_record_batches == 4
+            table = reader.read_all()
+        assert table.column_names == ['Time', name]
+        assert table.num_rows == rows
+
+
+def test_file_without_frames_is_exported_empty(tmp_path):
+    iba_file = str(tmp_path / 'synthetic_0000.dat')
+    write_synthetic_file(iba_file, datetime(2019, 1, 1, 12), duration=0, modules=1, channels=3, digital=0)
+
+    paths = export_iba_file(iba_file, str(tmp_path / 'export'), native_rates=True)
+    assert len(paths) == 3
+    for path in paths:
+        table = pq.read_table(path)
+        assert table.num_rows == 0
+        assert table.column_names[0] == 'Time'
@@ -0,0 +1,30 @@
+"""Tests of the IbaFileWatcher. Run from within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import contextlib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import file_watcher
+from file_watcher import IbaFileWatcher
+
+
+def test_os_error_is_retried_and_given_up(tmp_path, monkeypatch):
+    def check_file(iba_file):
+        raise PermissionError(13, 'Permission denied', iba_file)
+
+    monkeypatch.setattr(file_watcher, 'checkFile', check_file)
+    ingested = list()
+    iba_file = os.path.normpath(str(tmp_path / 'locked.dat'))
+    watcher = IbaFileWatcher(str(tmp_path), ingested.append, pending_files=[iba_file], retry_interval=0,
+                             max_retries=2, use_inotify=False)
+
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        watcher._check_pending()
+        assert iba_file in watcher._pending
+        watcher._check_pending()
+
+    assert iba_file not in watcher._pending
+    assert not ingested
@@ -0,0 +1,140 @@
+"""Tests of the playback clock. The monotonic clock is replaced by a fake one, so the positions are exact. Run from
+within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import playback
+from playback import PlaybackQueue, PlaybackClock, ShiftedClock
+
+START_NS = 1546300800 * 10 ** 9
+SECOND = 10 ** 9
+
+
+class FakeTime(object):
+    """Replaces the time module of playback, the monotonic clock only moves by advance."""
+
+    def __init__(self):
+        self.mono_ns = 10 ** 12
+
+    def monotonic_ns(self):
+        return self.mono_ns
+
+    def advance(self, seconds):
+        self.mono_ns += int(seconds * SECOND)
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(playback, 'time', fake)
+    return fake
+
+
+@pytest.fixture
+def queue():
+    """Two consecutive files of 2 s each."""
+
+    queue = PlaybackQueue()
+    for num in range(2):
+        queue.append({'file': 'file{0}'.format(num), 'start_ns': START_NS + num * 2 * SECOND,
+                      'end_ns': START_NS + (num + 1) * 2 * SECOND})
+    return queue
+
+
+def test_clock_follows_the_monotonic_clock(fake_time, queue):
+    clock = PlaybackClock(queue)
+    clock.start()
+    assert clock.now_ns() == START_NS
+
+    fake_time.advance(1.5)
+    assert clock.now_ns() == START_NS + 3 * SECOND // 2
+    assert queue.locate(clock.now_ns())['file'] == 'file0'
+
+    fake_time.advance(1)
+    assert clock.now_ns() == START_NS + 5 * SECOND // 2
+    assert queue.locate(clock.now_ns())['file'] == 'file1'
+
+
+def test_clock_starts_over_at_the_end(fake_time, queue):
+    clock = PlaybackClock(queue)
+    clock.start()
+
+    fake_time.advance(4.25)
+    assert clock.now_ns() == START_NS + SECOND // 4
+
+    # a file appended in the meantime extends the next loop
+    queue.append({'file': 'file2', 'start_ns': START_NS + 4 * SECOND, 'end_ns': START_NS + 6 * SECOND})
+    fake_time.advance(5)
+    assert clock.now_ns() == START_NS + 21 * SECOND // 4
+
+
+def test_pause_play_and_seek(fake_time, queue):
+    clock = PlaybackClock(queue)
+    clock.start()
+    fake_time.advance(1)
+
+    # a paused playback holds its position
+    clock.pause()
+    fake_time.advance(5)
+    assert clock.paused
+    assert clock.now_ns() == START_NS + SECOND
+
+    # and continues from there
+    clock.play()
+    fake_time.advance(0.5)
+    assert clock.now_ns() == START_NS + 3 * SECOND // 2
+
+    clock.seek(START_NS + 3 * SECOND)
+    assert clock.now_ns() == START_NS + 3 * SECOND
+    fake_time.advance(0.5)
+    assert clock.now_ns() == START_NS + 7 * SECOND // 2
+
+    # a seek while paused moves the held position
+    clock.pause()
+    clock.seek(START_NS + SECOND // 2)
+    fake_time.advance(1)
+    assert clock.now_ns() == START_NS + SECOND // 2
+
+    # times outside of the timeline are clipped to it
+    clock.seek(0)
+    assert clock.now_ns() == START_NS
+    clock.seek(START_NS + 10 * SECOND)
+    assert clock.now_ns() == START_NS + 4 * SECOND - 1
+
+
+def test_set_speed_keeps_the_position(fake_time, queue):
+    clock = PlaybackClock(queue, speed=2)
+    clock.start()
+    fake_time.advance(0.5)
+    assert clock.now_ns() == START_NS + SECOND
+
+    clock.set_speed(0.5)
+    fake_time.advance(1)
+    assert clock.now_ns() == START_NS + 3 * SECOND // 2
+
+    with pytest.raises(ValueError):
+        clock.set_speed(0)
+    assert clock.speed == 0.5
+
+
+def test_replica_clock_is_shifted_by_its_offset(fake_time, queue):
+    clock = PlaybackClock(queue, speed=2)
+    clock.start()
+    replicas = [ShiftedClock(clock, replica * 3 * SECOND // 2) for replica in range(1, 4)]
+
+    fake_time.advance(0.25)
+    assert clock.now_ns() == START_NS + SECOND // 2
+    assert [replica.now_ns() for replica in replicas] == [START_NS + 2 * SECOND, START_NS + 7 * SECOND // 2,
+                                                          START_NS + SECOND]
+    assert queue.locate(replicas[0].now_ns())['file'] == 'file1'
+
+    # the replicas follow the speed and the pause of the clock
+    clock.pause()
+    fake_time.advance(1)
+    assert all(replica.paused and replica.speed == 2 for replica in replicas)
+    assert replicas[0].now_ns() == START_NS + 2 * SECOND
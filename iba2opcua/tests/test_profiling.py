@@ -0,0 +1,41 @@
+"""Tests of the Profiler. Run from within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+import contextlib
+from threading import Thread, Event
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from profiling import Profiler
+
+
+def busy(stop_event):
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+def test_stop_dumps_the_window_of_concurrent_updaters(tmp_path):
+    profiler = Profiler(str(tmp_path), window=60.0, interval=0.001)
+    stop_event = Event()
+    threads = [Thread(target=busy, args=(stop_event,), name='Updater_{0}'.format(rate)) for rate in ('0.1', '0.01')]
+
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        profiler.start()
+        with profiler.phase('discover'):
+            time.sleep(0.01)
+        profiler.startup_done(threads)
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        # the server stops long before the window ends
+        profiler.stop()
+    stop_event.set()
+
+    assert sorted(os.listdir(str(tmp_path))) == ['phases.json', 'stacks.collapsed', 'startup.pstats',
+                                                 'updaters.collapsed']
+    with open(str(tmp_path / 'updaters.collapsed')) as f:
+        roots = set(line.split(';', 1)[0] for line in f)
+    assert {'Updater_0.1', 'Updater_0.01'} <= roots
@@ -0,0 +1,146 @@
+"""Tests of the time axis and the aggregation of pyIbaTools. The iba files are generated by the synthetic backend. Run
+from within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from pyIbaTools.pyIbaTools import set_backend, readIbaFile, get_time_axis, IbaTimeAxis, AGGREGATIONS, \
+    __time_axis__, __tbase_step__, __aggregate__
+from pyIbaTools.backends import write_synthetic_file
+
+# plain python reductions of one block of samples
+REFERENCE = {
+    'first': lambda block: block[0],
+    'last': lambda block: block[-1],
+    'mean': lambda block: sum(float(value) for value in block) / len(block),
+    'min': min,
+    'max': max,
+}
+
+
+@pytest.fixture(autouse=True)
+def synthetic_backend():
+    set_backend('synthetic')
+    yield
+    set_backend(None)
+
+
+@pytest.fixture
+def iba_file(tmp_path):
+    """A file with a 1 ms, a 10 ms and a 100 ms channel over 2 s."""
+
+    path = str(tmp_path / 'synthetic_0000.dat')
+    write_synthetic_file(path, datetime(2019, 1, 1, 12), duration=2.0, modules=1, channels=3, digital=0)
+    return path
+
+
+def reference_aggregate(data, step, aggregation):
+    """Reduces the blocks of step samples one by one."""
+
+    blocks = [data[start:start + step] for start in range(0, len(data), step)]
+    if aggregation == 'minmax':
+        return [min(block) for block in blocks], [max(block) for block in blocks]
+    return [REFERENCE[aggregation](block) for block in blocks]
+
+
+class FakeReader(object):
+    def GetStartTime(self):
+        return datetime(2019, 1, 1, 12)
+
+
+@pytest.mark.parametrize('aggregation', AGGREGATIONS)
+def test_aggregate_matches_the_reference(aggregation):
+    # 25 samples in blocks of 10, the last block holds 5 samples only
+    data = np.random.RandomState(0).uniform(-1, 1, 25).astype(np.float32)
+    result = __aggregate__(data, 10, aggregation)
+    expected = reference_aggregate(data, 10, aggregation)
+
+    if aggregation == 'minmax':
+        assert len(result[0]) == len(result[1]) == 3
+        np.testing.assert_allclose(result[0], expected[0])
+        np.testing.assert_allclose(result[1], expected[1])
+    else:
+        assert len(result) == 3
+        np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+    # the last block is not padded with a sample of the next one
+    if aggregation == 'last':
+        assert result[-1] == data[-1]
+
+
+def test_aggregate_rejects_an_unknown_aggregation():
+    with pytest.raises(ValueError, match='median'):
+        __aggregate__(np.arange(10.0), 2, 'median')
+
+
+def test_tbase_step_rounds_to_whole_samples():
+    assert __tbase_step__(0.01, 0.001) == 10
+    assert __tbase_step__(0.0004, 0.001) == 1
+    assert __tbase_step__(0.03, 0.001) == 30
+
+
+def test_time_axis_of_a_tbase_keeps_the_last_block():
+    time_axis = __time_axis__(FakeReader(), tbase=0.01, clk=0.001, frames=25)
+    assert time_axis.period_ns == 10000000
+    assert len(time_axis) == 3
+    assert time_axis.end == pd.Timestamp(datetime(2019, 1, 1, 12)) + pd.Timedelta(milliseconds=20)
+
+
+def test_index_of_is_clipped_to_the_time_axis():
+    time_axis = IbaTimeAxis(datetime(2019, 1, 1, 12), period_ns=1000000, frames=100)
+    start_ns = time_axis.start_ns
+
+    assert time_axis.index_of(start_ns) == 0
+    assert time_axis.index_of(start_ns - 1) == 0
+    assert time_axis.index_of(start_ns - 10 ** 9) == 0
+    assert time_axis.index_of(start_ns + 5 * 1000000 - 1) == 4
+    assert time_axis.index_of(start_ns + 5 * 1000000) == 5
+    assert time_axis.index_of(time_axis.end) == 99
+    assert time_axis.index_of(start_ns + time_axis.duration_ns) == 99
+    assert time_axis.index_of(start_ns + 10 ** 12) == 99
+
+    assert time_axis[-1] == time_axis.end
+    with pytest.raises(IndexError):
+        time_axis[100]
+
+
+@pytest.mark.parametrize('tbase', [0, 0.01, 0.03])
+def test_implicit_time_axis_matches_the_linspace_column(iba_file, tbase):
+    df = readIbaFile(iba_file, channels='*', tbase=tbase, caching=False, time_mode='implicit')
+    column = readIbaFile(iba_file, channels='*', tbase=tbase, caching=False)
+    time_axis = get_time_axis(df)
+
+    # the time column as it was computed before the time axis was carried implicitly
+    clk, frames = 0.001, 2000
+    start = pd.Timestamp(datetime(2019, 1, 1, 12))
+    time_data = np.linspace(start.value, (start + pd.Timedelta(seconds=clk * (frames - 1))).value, frames)
+    if tbase != 0:
+        time_data = time_data[::__tbase_step__(tbase, clk)]
+
+    assert len(time_axis) == len(df) == len(time_data)
+    assert (np.abs(time_axis.to_index().asi8 - time_data) < 1000).all()
+    assert (column['Time'] == time_axis.to_index()).all()
+    assert 'Time' not in df.columns
+
+
+@pytest.mark.parametrize('aggregation', AGGREGATIONS)
+def test_read_aggregation_matches_the_reference(iba_file, aggregation):
+    # 30 ms blocks: the 10 ms channel is reduced in whole samples, the 100 ms channel is repeated to 1 ms first
+    raw = readIbaFile(iba_file, channels='*', caching=False, time_mode='implicit')
+    df = readIbaFile(iba_file, channels='*', tbase=0.03, caching=False, time_mode='implicit', aggregation=aggregation)
+
+    assert len(get_time_axis(df)) == len(df) == 67
+    for name in raw.columns:
+        expected = reference_aggregate(raw[name].to_numpy(), 30, aggregation)
+        if aggregation == 'minmax':
+            np.testing.assert_allclose(df[name + '_min'], expected[0])
+            np.testing.assert_allclose(df[name + '_max'], expected[1])
+        else:
+            np.testing.assert_allclose(df[name], expected, rtol=1e-6)
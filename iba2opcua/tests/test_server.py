@@ -0,0 +1,272 @@
+"""Tests of the publish path of the server. The iba files are generated by the synthetic backend and the values are
+written to an opc server which is not started, so neither ibaFilesLite nor a network connection is needed.
+
+Run from within the iba2opcua folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import asyncio
+import contextlib
+from datetime import datetime
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from opcua import ua
+from pyIbaTools.pyIbaTools import set_backend
+from pyIbaTools.backends import write_synthetic_file
+from playback import PlaybackClock
+from server import IbaToUaServer, VariableUpdater
+from async_engine import AsyncIbaToUaServer, AsyncVariableUpdater, Server as AsyncServer
+
+
+@pytest.fixture(autouse=True)
+def synthetic_backend():
+    set_backend('synthetic')
+    yield
+    set_backend(None)
+
+
+@pytest.fixture
+def gap_dir(tmp_path):
+    """Two consecutive files. The second one contains none of the channels of the 0.1 s group of the first one."""
+
+    write_synthetic_file(str(tmp_path / 'synthetic_0000.dat'), datetime(2019, 1, 1), duration=2.0, modules=1,
+                         channels=6)
+    write_synthetic_file(str(tmp_path / 'synthetic_0001.dat'), datetime(2019, 1, 1, 0, 0, 2), duration=2.0,
+                         modules=1, channels=2, rates=(0.001, 0.01), offset=2.0)
+    return str(tmp_path)
+
+
+def load_recorder(server):
+    """Reads the channel info and all files of the first recorder of the server, the address space must be built."""
+
+    recorder = server.recorders[0]
+    for iba_file in recorder.iba_files:
+        recorder.append_iba_file(iba_file)
+    return recorder
+
+
+def discover(server):
+    for recorder in server.recorders:
+        recorder.iba_files = recorder.discover_iba_files()
+        recorder.iba_info = recorder.get_union_info(recorder.iba_files)
+
+
+def test_file_without_rate_group_keeps_time_axis(gap_dir):
+    server = IbaToUaServer(data_dirs=[gap_dir])
+    discover(server)
+    recorder = server.recorders[0]
+    entry = recorder.load_iba_file(recorder.iba_files[1])
+
+    assert (entry['remap']['0.1'] == -1).all()
+    assert entry['data']['0.1'].shape == (len(entry['time_axis']['0.1']), 0)
+
+
+def test_updater_survives_file_without_rate_group(gap_dir):
+    server = IbaToUaServer(data_dirs=[gap_dir])
+    discover(server)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        server.init_opc()
+        recorder = load_recorder(server)
+
+    channel = recorder.iba_info['channels']['0.1']
+    updater = VariableUpdater(server=server._server, channel=channel, period=0.1, queue=recorder.iba_data,
+                              rate='0.1', clock=PlaybackClock(recorder.iba_data))
+
+    first, second = recorder.iba_data[0], recorder.iba_data[1]
+    assert updater._tick(first['start_ns']) == len(channel)
+    for num in range(5):
+        assert updater._tick(second['start_ns'] + num * 100000000) == 0
+
+    for chan in channel:
+        data_value = server._server.iserver.aspace.get_attribute_value(chan['opc_value'].nodeid,
+                                                                       ua.AttributeIds.Value)
+        assert data_value.StatusCode.value == ua.StatusCodes.BadNoData
+
+
+@pytest.mark.skipif(AsyncServer is None, reason='asyncua is not installed')
+def test_async_updater_survives_file_without_rate_group(gap_dir):
+    async def run():
+        server = AsyncIbaToUaServer(data_dirs=[gap_dir])
+        discover(server)
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            await server.init_opc()
+            recorder = load_recorder(server)
+
+        channel = recorder.iba_info['channels']['0.1']
+        updater = AsyncVariableUpdater(server=server._server, channel=channel, period=0.1, queue=recorder.iba_data,
+                                       rate='0.1', clock=PlaybackClock(recorder.iba_data))
+
+        second = recorder.iba_data[1]
+        writes = 0
+        for num in range(5):
+            writes += updater._tick(second['start_ns'] + num * 100000000)
+            await updater._flush()
+        assert writes == 0
+
+        for chan in channel:
+            data_value = await chan['opc_value'].read_data_value(raise_on_bad_status=False)
+            assert data_value.StatusCode.value == ua.StatusCodes.BadNoData
+
+    asyncio.run(run())
+
+
+def test_tbase_keeps_the_updaters_apart(tmp_path):
+    # with tbase all three sample rates are published every 0.1 s
+    write_synthetic_file(str(tmp_path / 'synthetic_0000.dat'), datetime(2019, 1, 1), duration=2.0, modules=1,
+                         channels=6)
+    server = IbaToUaServer(data_dirs=[str(tmp_path)], endpoint='opc.tcp://127.0.0.1:48411/test/', tbase=0.1)
+    discover(server)
+    recorder = server.recorders[0]
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        server.init_opc()
+        recorder.append_iba_file(recorder.iba_files[0])
+        try:
+            server.serve()
+        finally:
+            server.stop()
+
+    names = [updater.name for updater in server._value_updater.values()]
+    assert sorted(names) == ['Updater_0.001', 'Updater_0.01', 'Updater_0.1']
+    assert all(updater.period == 0.1 for updater in server._value_updater.values())
+
+    diagnostics = server._server.get_node(ua.NodeId('Diagnostics', server._ns_idx))
+    assert sorted(node.get_browse_name().Name for node in diagnostics.get_children()) == sorted(names)
+
+
+def test_watched_files_are_evicted_behind_the_playback(tmp_path):
+    paths = list()
+    for num in range(3):
+        paths.append(str(tmp_path / 'synthetic_{0:04d}.dat'.format(num)))
+        write_synthetic_file(paths[-1], datetime(2019, 1, 1, 0, 0, 2 * num), duration=2.0, modules=1, channels=2,
+                             offset=2.0 * num)
+    server = IbaToUaServer(data_dirs=[str(tmp_path)], watch=True, retention=1.0)
+    discover(server)
+    recorder = server.recorders[0]
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        recorder.append_iba_file(paths[0])
+        recorder.append_iba_file(paths[1])
+        first, second = recorder.iba_data[0], recorder.iba_data[1]
+
+        # 1.5 s into the second file, the first one ended more than the retention ago
+        server._clock.start()
+        server._clock.pause()
+        server._clock.seek(second['start_ns'] + 1500000000)
+        server._append_watched_file(recorder, paths[2])
+
+    assert len(recorder.iba_data) == 2
+    assert recorder.iba_data.start_ns == second['start_ns']
+    assert recorder.iba_data.locate(first['start_ns']) is None
+    assert recorder.iba_files == paths[1:]
+
+
+def test_set_speed_rejects_an_invalid_factor(gap_dir):
+    server = IbaToUaServer(data_dirs=[gap_dir])
+    discover(server)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        server.init_opc()
+        load_recorder(server)
+    server._clock.start()
+
+    playback = server._server.get_node(ua.NodeId('Playback', server._ns_idx))
+    set_speed = ua.NodeId('Playback.SetSpeed', server._ns_idx)
+    with pytest.raises(ua.UaStatusCodeError) as error:
+        playback.call_method(set_speed, ua.Variant(-1.0, ua.VariantType.Double))
+    assert error.value.code == ua.StatusCodes.BadInvalidArgument
+
+    playback.call_method(set_speed, ua.Variant(4.0, ua.VariantType.Double))
+    assert server.speed == 4.0
+
+
+@pytest.mark.skipif(AsyncServer is None, reason='asyncua is not installed')
+def test_async_set_speed_rejects_an_invalid_factor(gap_dir):
+    from asyncua import ua as async_ua
+
+    async def run():
+        server = AsyncIbaToUaServer(data_dirs=[gap_dir])
+        discover(server)
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            await server.init_opc()
+            load_recorder(server)
+        server._clock.start()
+
+        playback = server._server.get_node(async_ua.NodeId('Playback', server._ns_idx))
+        set_speed = async_ua.NodeId('Playback.SetSpeed', server._ns_idx)
+        with pytest.raises(async_ua.UaStatusCodeError) as error:
+            await playback.call_method(set_speed, async_ua.Variant(-1.0, async_ua.VariantType.Double))
+        assert error.value.code == async_ua.StatusCodes.BadInvalidArgument
+
+        await playback.call_method(set_speed, async_ua.Variant(4.0, async_ua.VariantType.Double))
+        assert server.speed == 4.0
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(AsyncServer is None, reason='asyncua is not installed')
+def test_digital_channels_are_boolean_in_both_engines(gap_dir):
+    from asyncua import ua as async_ua
+
+    server = IbaToUaServer(data_dirs=[gap_dir])
+    discover(server)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        server.init_opc()
+        recorder = load_recorder(server)
+
+    channel = recorder.iba_info['channels']['0.001']
+    chan = next(chan for chan in channel if chan['type'] != 'analog')
+    updater = VariableUpdater(server=server._server, channel=channel, period=0.001, queue=recorder.iba_data,
+                              rate='0.001', clock=PlaybackClock(recorder.iba_data))
+    updater._tick(recorder.iba_data[0]['start_ns'])
+    data_type = chan['opc_value'].get_data_type()
+    variant_type = chan['opc_value'].get_data_value().Value.VariantType
+
+    async def run():
+        server = AsyncIbaToUaServer(data_dirs=[gap_dir])
+        discover(server)
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            await server.init_opc()
+            recorder = load_recorder(server)
+
+        channel = recorder.iba_info['channels']['0.001']
+        chan = next(chan for chan in channel if chan['type'] != 'analog')
+        updater = AsyncVariableUpdater(server=server._server, channel=channel, period=0.001, queue=recorder.iba_data,
+                                       rate='0.001', clock=PlaybackClock(recorder.iba_data))
+        updater._tick(recorder.iba_data[0]['start_ns'])
+        await updater._flush()
+        data_value = await chan['opc_value'].read_data_value()
+        return await chan['opc_value'].read_data_type(), data_value.Value.VariantType
+
+    async_data_type, async_variant_type = asyncio.run(run())
+
+    assert data_type.Identifier == async_data_type.Identifier == ua.ObjectIds.Boolean
+    assert variant_type.name == async_variant_type.name == 'Boolean'
+
+
+@pytest.mark.parametrize('overrun, published', [('skip', 1), ('burst', 5), ('degrade', 1)])
+def test_overrun_policies_after_a_late_tick(gap_dir, overrun, published):
+    server = IbaToUaServer(data_dirs=[gap_dir])
+    discover(server)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        server.init_opc()
+        recorder = load_recorder(server)
+
+    channel = recorder.iba_info['channels']['0.001']
+    updater = VariableUpdater(server=server._server, channel=channel, period=0.001, queue=recorder.iba_data,
+                              rate='0.001', clock=PlaybackClock(recorder.iba_data), overrun=overrun, max_burst=20)
+    start_ns = recorder.iba_data[0]['start_ns']
+    assert updater._tick(start_ns) == len(channel)
+
+    # the previous tick overran its period by 4 samples. burst catches them up, skip and degrade drop them
+    assert updater._tick(start_ns + 5000000, late=True) == published * len(channel)
+    assert updater.metrics.missed_samples == 4
+
+    # samples passed by a tick on time are expected, e.g. at a high speed, and not missed
+    assert updater._tick(start_ns + 8000000) == len(channel)
+    assert updater.metrics.missed_samples == 4
+
+    # burst publishes at most max_burst samples at once
+    expected = 20 if overrun == 'burst' else 1
+    assert updater._tick(start_ns + 108000000, late=True) == expected * len(channel)
+    assert updater.metrics.missed_samples == 103
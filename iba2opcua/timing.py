@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+
+# how the updater threads wait for their next tick
+TIMING_MODES = ('sleep', 'precise')
+
+# see <linux/prctl.h>
+PR_SET_TIMERSLACK = 29
+
+
+class Sleeper(object):
+    """The Sleeper waits for the deadlines of the ticks of an updater thread. All deadlines are given in ns of
+    time.monotonic_ns, which is not affected by adjustments of the wall clock.
+
+    * sleep: a plain time.sleep. On Linux this overshoots by tens to hundreds of microseconds.
+    * precise: time.sleep until spin_threshold before the deadline, then spin on the clock. The spinning yields the GIL
+      on every iteration, so the other threads (e.g. the opc server) are not starved.
+    """
+
+    def __init__(self, mode='sleep', spin_threshold=0.002, cpu_affinity=None):
+        """Default constructor.
+
+        :param mode: (optional, string) one of TIMING_MODES
+        :param spin_threshold: (optional, float) seconds before the deadline at which the precise mode starts spinning
+        :param cpu_affinity: (optional, list of int) CPUs the timing thread shall be pinned to. Linux only.
+        """
+
+        if mode not in TIMING_MODES:
+            raise ValueError('Unknown timing mode {0}. Use one of {1}.'.format(mode, ', '.join(TIMING_MODES)))
+
+        self.mode = mode
+        self.spin_threshold_ns = int(spin_threshold * 1e9)
+        self.cpu_affinity = cpu_affinity
+
+    def prepare_thread(self):
+        """Call from within the timing thread before the first tick. Pins the thread to the configured CPUs and, in
+        precise mode, reduces the timer slack of the thread so the kernel does not delay the wakeups. Both are best
+        effort and only available on Linux.
+
+        :return: None
+        """
+
+        if self.cpu_affinity and hasattr(os, 'sched_setaffinity'):
+            # pid 0 is the calling thread
+            try:
+                os.sched_setaffinity(0, self.cpu_affinity)
+            except OSError as e:
+                print('could not set the cpu affinity to {0}: {1}'.format(self.cpu_affinity, e))
+
+        if self.mode == 'precise' and sys.platform.startswith('linux'):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+                libc.prctl(PR_SET_TIMERSLACK, ctypes.c_ulong(1), 0, 0, 0)
+            except (OSError, AttributeError):
+                pass
+
+    def sleep_until(self, deadline_ns):
+        """Returns as soon as possible after deadline_ns.
+
+        :param deadline_ns: (mandatory, int) deadline in ns of time.monotonic_ns
+        :return: None
+        """
+
+        remaining = deadline_ns - time.monotonic_ns()
+        if self.mode == 'sleep':
+            if remaining > 0:
+                time.sleep(remaining / 1e9)
+            return
+
+        # sleep the bulk of the time, spin the rest
+        if remaining > self.spin_threshold_ns:
+            time.sleep((remaining - self.spin_threshold_ns) / 1e9)
+        while time.monotonic_ns() < deadline_ns:
+            time.sleep(0)